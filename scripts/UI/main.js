@@ -107,7 +107,12 @@ $(function() {
 		var outputFileBox = $("#output-file-box");
 
 		$("#output-type").change(function() {
-			outputFileBox.val("{z}/{x}/{y}.png");
+			var outputType = $("#output-type").val();
+			if(outputType == "mbtiles") {
+				outputFileBox.val("tiles.mbtiles");
+			} else {
+				outputFileBox.val("{z}/{x}/{y}.png");
+			}
 		});
 
 	}
@@ -419,11 +424,11 @@ $(function() {
 		strip.prepend(image)
 	}
 	// Function to poll the task status
-	async function pollTaskStatus() {
+	async function pollTaskStatus(taskId) {
 	    try {
-	        // Call the /task-status endpoint
+	        // Call the /task-status endpoint of the job
 	        var response = await $.ajax({
-	            url: "/task-status",
+	            url: "/task-status/" + taskId,
 	            async: true,
 	            timeout: 30 * 1000,
 	            type: "get",
@@ -438,9 +443,15 @@ $(function() {
 				if (status === "completed") {
 					logItemRaw("Gazebo world generated successfully.");
 					$("#stop-button").html("FINISH");
+				} else if (status === "queued") {
+					logItemRaw("World Generation queued, " + response.message.position + " job(s) ahead..");
+					setTimeout(() => pollTaskStatus(taskId), 5000); // Poll every 5 seconds
 				} else if (status === "in_progress") {
-					logItemRaw("World Generation Inprogress..");
-					setTimeout(() => pollTaskStatus(), 5000); // Poll every 5 seconds
+					var stage = response.message.stage ? " (" + response.message.stage + ", " + Math.round(response.message.progress * 100) + "%)" : "";
+					logItemRaw("World Generation Inprogress.." + stage);
+					setTimeout(() => pollTaskStatus(taskId), 5000); // Poll every 5 seconds
+				} else if (status === "failed") {
+					logItemRaw("World Generation failed: " + response.message.error);
 				} else {
 					logItemRaw("Unexpected status: " + status);
 				}
@@ -481,6 +492,7 @@ $(function() {
 		var outputType = $("#output-type").val();
 		var outputScale = $("#output-scale").val();
 		var source = $("#source-box").val()
+		var heightmapResolution = $("#heightmap-resolution").val();
 
 		var bounds = getBounds();
 		var area_rect = area();
@@ -498,6 +510,7 @@ $(function() {
 		data.append('bounds', boundsArray.join(","))
 		data.append('center', centerArray.join(","))
 		data.append('area',area_rect)
+		data.append('heightmapResolution', heightmapResolution)
 
 		var request = await $.ajax({
 			url: "/start-download",
@@ -510,6 +523,12 @@ $(function() {
 			dataType: 'json',
 		})
 
+		if(request.code !== 200) {
+			logItemRaw("Download not started: " + request.message);
+			$("#stop-button").html("FINISH");
+			return;
+		}
+
 		let i = 0;
 		var iterator = async.eachLimit(allTiles, numThreads, function(item, done) {
 
@@ -596,8 +615,13 @@ $(function() {
 			})
 
 			updateProgress(allTiles.length, allTiles.length);
+			if(request.code !== 200) {
+				logItemRaw("World Generation not started: " + request.message);
+				$("#stop-button").html("FINISH");
+				return;
+			}
 			logItemRaw("Starting World Generation");
-			pollTaskStatus(); // Start polling with the task ID
+			pollTaskStatus(request.job_id); // Start polling with the task ID
 			$("#stop-button").html("FINISH");
 
 		},
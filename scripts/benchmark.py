@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+"""
+Offline benchmark of the world generation pipeline.
+
+Starts a local stand-in tile server and runs the tile download, DEM download,
+aerial image stitching, heightmap generation and the full world generation for
+every combination of zoom level and area size. Every stage runs in a fresh
+process against its own work directory, so the reported peak RSS belongs to
+that stage alone, and the results are written as JSON for comparing commits.
+
+Example:
+    python benchmark.py --zooms 15 16 17 --areas 1 2 --output bench.json
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import resource
+import threading
+import subprocess
+import multiprocessing
+
+from utils.param import globalParam
+from utils.stub_tile_server import stubTileServer
+
+
+STAGES = ("tile_download", "dem_download", "generate_ortho", "gen_terrain", "generate_gazebo_world")
+
+
+def configure(workdir: str, imagery_url: str, dem_url: str) -> None:
+    # Point every output, cache and DEM path of this process at the case work directory
+    globalParam.OUTPUT_BASE_PATH = os.path.join(workdir, 'output')
+    globalParam.TEMP_PATH = os.path.join(workdir, 'temp')
+    globalParam.GAZEBO_WORLD_PATH = os.path.join(globalParam.OUTPUT_BASE_PATH, 'gazebo_terrian')
+    globalParam.DEM_PATH = os.path.join(globalParam.OUTPUT_BASE_PATH, 'dem')
+    globalParam.TILE_CACHE_PATH = os.path.join(workdir, 'cache')
+    globalParam.DEM_TILE_URL = dem_url
+
+    from utils.tile_cache import tile_cache
+    tile_cache.path = globalParam.TILE_CACHE_PATH
+
+
+def peak_rss_mb() -> float:
+    """
+    Peak resident set size of this process and its finished children in MiB.
+    """
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_stage(stage: str, case: dict, workdir: str, imagery_url: str, dem_url: str) -> dict:
+    """
+    Run one pipeline stage of a case in the current process.
+
+    Args:
+        stage (str): One of STAGES.
+        case (dict): Case with "name", "zoom", "bounds" and "heightmap_resolution".
+        workdir (str): Work directory shared by the stages of the case.
+        imagery_url (str): Imagery tile source template.
+        dem_url (str): DEM tile URL template.
+
+    Returns:
+        dict: Wall time in seconds, processed items and their unit, errors and throughput.
+    """
+    configure(workdir, imagery_url, dem_url)
+
+    from utils.maptile_utils import maptile_utiles
+    from utils.metrics import jobMetrics
+    from utils.tile_downloader import bulkDownloader
+    from utils.demTilesDownloader import download_dem_data
+    from utils.gazebo_world_generator import heightmapgenerator, generate_gazebo_world
+
+    tiles_dir = os.path.join(globalParam.OUTPUT_BASE_PATH, case["name"])
+    errors = 0
+    start = time.perf_counter()
+
+    if stage == "tile_download":
+        unit = "tiles"
+        job_id = bulkDownloader.start(threading.Lock(), case["bounds"], case["zoom"], imagery_url, 1,
+                                      case["name"], "{z}/{x}/{y}.jpg", 0)
+        status = bulkDownloader.status(job_id)
+        while status["status"] == "in_progress":
+            time.sleep(0.01)
+            status = bulkDownloader.status(job_id)
+        items, errors = status["downloaded"] + status["existing"], status["failed"]
+    elif stage == "dem_download":
+        unit = "tiles"
+        boundaries = maptile_utiles.get_true_boundaries(case["bounds"], case["zoom"])
+        dem_zoom = heightmapgenerator.select_dem_zoom(case["bounds"], case["zoom"], case["heightmap_resolution"])
+        result = download_dem_data(boundaries, globalParam.DEM_PATH, (dem_zoom, dem_zoom))
+        items, errors = result["downloaded"], result["failed"]
+    elif stage == "generate_ortho":
+        unit = "tiles"
+        generator = heightmapgenerator(tiles_dir)
+        generator.generate_ortho(tiles_dir)
+        counts = generator.metrics.as_dict()["ortho_stitch"]
+        items, errors = counts["items"], counts["errors"]
+    elif stage == "gen_terrain":
+        unit = "samples"
+        generator = heightmapgenerator(tiles_dir, case["heightmap_resolution"])
+        generator.gen_terrain()
+        counts = generator.metrics.as_dict()["heightmap_sample"]
+        items, errors = counts["items"], counts["errors"]
+    elif stage == "generate_gazebo_world":
+        unit = "tiles"
+        metrics = jobMetrics()
+        generate_gazebo_world(tiles_dir, case["heightmap_resolution"], metrics=metrics, resume=False)
+        counts = metrics.as_dict()["ortho_stitch"]
+        items, errors = counts["items"], counts["errors"]
+    else:
+        raise ValueError(f"Unknown stage {stage}")
+
+    seconds = time.perf_counter() - start
+    return {
+        "seconds": seconds,
+        "items": items,
+        "unit": unit,
+        "errors": errors,
+        "items_per_second": items / seconds if seconds > 0 else None,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def _stage_process(connection, *args) -> None:
+    # Entry point of the stage child process, the output of the pipeline is silenced
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        connection.send(run_stage(*args))
+    except Exception as e:
+        connection.send({"error": f"{type(e).__name__}: {e}"})
+    finally:
+        connection.close()
+        # a multiprocessing child joins the worker processes of the executor before exiting
+        from utils.executor import task_executor
+        task_executor.shutdown()
+
+
+def run_isolated(*args) -> dict:
+    """
+    Run run_stage(*args) in a fresh process.
+
+    A plain process rather than a pool worker is used so every stage starts the
+    pools of the shared executor afresh, which a daemonic pool worker cannot do
+    in process mode. The process is forked where possible so those pools inherit
+    the configured paths.
+    """
+    context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_stage_process, args=(sender,) + args)
+    process.start()
+    sender.close()
+    try:
+        result = receiver.recv()
+    except EOFError:
+        result = {"error": "stage process exited without a result"}
+    process.join()
+    return result
+
+
+def region_bounds(lat: float, lon: float, size_km: float) -> list:
+    """
+    Bounds of a square region centred on a point.
+
+    Returns:
+        list: [west, south, east, north] in degrees.
+    """
+    half_lat = size_km / 2 / 111.32
+    half_lon = size_km / 2 / (111.32 * math.cos(math.radians(lat)))
+    return [lon - half_lon, lat - half_lat, lon + half_lon, lat + half_lat]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the world generation pipeline against a local stand-in tile server.")
+    parser.add_argument('--zooms', type=int, nargs='+', default=[15, 16, 17], help="Imagery zoom levels.")
+    parser.add_argument('--areas', type=float, nargs='+', default=[0.5, 1, 2], help="Side lengths of the square regions in km.")
+    parser.add_argument('--center', type=float, nargs=2, default=[12.97, 77.59], metavar=('LAT', 'LON'), help="Centre of the regions.")
+    parser.add_argument('--heightmap-resolution', type=int, default=None, help="Native heightmap resolution (2^n+1), legacy sampling when omitted.")
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES), help="Stages to run, in pipeline order.")
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds the stand-in server delays every tile.")
+    parser.add_argument('--output', default=None, help="JSON result file, printed to stdout when omitted.")
+    parser.add_argument('--keep', action='store_true', help="Keep the work directories of the cases.")
+    args = parser.parse_args()
+
+    server = stubTileServer(latency=args.latency).start()
+    results = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "latency": args.latency,
+        "started": time.time(),
+        "cases": [],
+    }
+
+    try:
+        for zoom in args.zooms:
+            for area in args.areas:
+                case = {
+                    "name": f"bench_z{zoom}_{area:g}km",
+                    "zoom": zoom,
+                    "area_km": area,
+                    "bounds": region_bounds(args.center[0], args.center[1], area),
+                    "heightmap_resolution": args.heightmap_resolution,
+                }
+                workdir = tempfile.mkdtemp(prefix=case["name"] + "_")
+                case["stages"] = {}
+                for stage in args.stages:
+                    result = run_isolated(stage, case, workdir, server.imagery_url, server.dem_url)
+                    case["stages"][stage] = result
+                    summary = result.get("error") or f"{result['seconds']:.2f}s {result['items']} {result['unit']} {result['peak_rss_mb']:.0f} MiB"
+                    print(f"{case['name']:<24} {stage:<22} {summary}", file=sys.stderr)
+                if args.keep:
+                    case["workdir"] = workdir
+                else:
+                    shutil.rmtree(workdir, ignore_errors=True)
+                results["cases"].append(case)
+    finally:
+        server.stop()
+
+    if args.output is None:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
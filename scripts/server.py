@@ -1,68 +1,133 @@
 #!/usr/bin/env python
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_from_directory, Response
 import threading
+import time
 import os
-import uuid
-import base64
 from pathlib import Path
 import mimetypes
+from concurrent.futures import ThreadPoolExecutor
 from utils.demTilesDownloader import download_dem_data
-from utils.file_writer import FileWriter
 from utils.utils import Utils
-from utils.gazebo_world_generator import generate_gazebo_world
+from utils.tile_downloader import tileDownloader, bulkDownloader
+from utils.gazebo_world_generator import generate_gazebo_world, heightmapgenerator
 from utils.maptile_utils import maptile_utiles
+from utils.job_manager import job_manager
+from utils.metrics import jobMetrics, metrics_registry
+from utils.http_client import http_client
+from utils.tile_cache import tile_cache
+from utils.dem_cache import dem_tile_cache
 from utils.param import globalParam
 
 app = Flask(__name__)
 lock = threading.Lock()
 
 
-task_status = {"status": "idle"}  # Global variable to track task status
-
-
 outputdirectory = None
 
-def random_string():
+# DEM downloads started at /start-download as (future, start time), keyed by (outputDirectory, bounds, zoom_level, DEM zoom)
+dem_prefetches = {}
+dem_prefetches_lock = threading.Lock()
+dem_executor = ThreadPoolExecutor(max_workers=globalParam.DEM_PREFETCH_WORKERS)
 
-	return uuid.uuid4().hex.upper()[0:6]
+def dem_download_task(bounds, zoom_level, heightmapResolution):
+    # The DEM zoom the heightmap of a region is sampled from and the call downloading only that zoom
+    true_boundaries = maptile_utiles.get_true_boundaries(bounds, zoom_level)
+    dem_zoom = heightmapgenerator.select_dem_zoom(bounds, zoom_level, heightmapResolution)
+    return dem_zoom, (download_dem_data, true_boundaries, os.path.join(globalParam.OUTPUT_BASE_PATH, "dem"), (dem_zoom, dem_zoom))
 
+def prune_dem_prefetches():
+    # Drop prefetches whose /end-download never came, call with dem_prefetches_lock held
+    now = time.monotonic()
+    for key, (future, started) in list(dem_prefetches.items()):
+        if now - started > globalParam.DEM_PREFETCH_TTL:
+            future.cancel()
+            del dem_prefetches[key]
 
+def prefetch_dem(bounds, zoom_level, outputDirectory, heightmapResolution=None):
+    # Start downloading the DEM of a region in the background while the imagery is fetched
+    dem_zoom, task = dem_download_task(bounds, zoom_level, heightmapResolution)
+    key = (outputDirectory, tuple(bounds), zoom_level, dem_zoom)
+    with dem_prefetches_lock:
+        prune_dem_prefetches()
+        if key not in dem_prefetches:
+            dem_prefetches[key] = (dem_executor.submit(*task), time.monotonic())
 
+def wait_for_dem(bounds, zoom_level, outputDirectory, heightmapResolution=None):
+    # Wait for the prefetched DEM of a region, downloading it now if it was never started
+    dem_zoom, task = dem_download_task(bounds, zoom_level, heightmapResolution)
+    key = (outputDirectory, tuple(bounds), zoom_level, dem_zoom)
+    with dem_prefetches_lock:
+        prune_dem_prefetches()
+        # Prefetches of the directory under another key, e.g. another heightmap resolution, are not waited for
+        prefetches = {other: dem_prefetches.pop(other) for other in list(dem_prefetches) if other[0] == outputDirectory}
+    if key in prefetches:
+        return prefetches[key][0].result()
+    return task[0](*task[1:])
 
-def process_end_download(bounds, zoom_level, outputDirectory, outputFile, filePath):
-    global task_status
-    try:
-        task_status["status"] = "in_progress"
+def parse_heightmap_resolution(postvars):
+    # Optional heightmapResolution of a request, a ValueError carries the message for unsupported values
+    value = postvars.get('heightmapResolution', '')
+    if not value:
+        return None
+    resolution = int(value) if value.isdigit() else None
+    if resolution is None or not heightmapgenerator.is_valid_resolution(resolution):
+        raise ValueError(f"Heightmap resolution must be 2^n+1 between 3 and {globalParam.HEIGHTMAP_MAX_RESOLUTION}, got {value}")
+    return resolution
 
-        # Perform the long-running task
-        FileWriter.close(lock, os.path.join(globalParam.OUTPUT_BASE_PATH, outputDirectory), filePath, zoom_level)
-        true_boundaries = maptile_utiles.get_true_boundaries(bounds, zoom_level)
-        download_dem_data(true_boundaries, os.path.join(globalParam.OUTPUT_BASE_PATH, "dem"))
-        orthodir_path = os.path.join(globalParam.OUTPUT_BASE_PATH, outputDirectory)
-        generate_gazebo_world(orthodir_path)
+def process_end_download(bounds, zoom_level, outputDirectory, outputFile, filePath, heightmapResolution=None, outputType="directory", progress=None, metrics=None):
+    # Runs on a job manager worker, exceptions mark the job as failed
+    if progress is None:
+        progress = lambda stage, fraction=None: None
+    if metrics is None:
+        metrics = jobMetrics()
+    progress("dem", 0.1)
+    tileDownloader.getWriter(outputType).close(lock, os.path.join(globalParam.OUTPUT_BASE_PATH, outputDirectory), filePath, zoom_level)
+    # Only the part of the DEM download not overlapped with the imagery download is timed here
+    with metrics.stage("dem_download") as count:
+        dem_result = wait_for_dem(bounds, zoom_level, outputDirectory, heightmapResolution)
+        count(items=dem_result["downloaded"], errors=dem_result["failed"])
+    orthodir_path = os.path.join(globalParam.OUTPUT_BASE_PATH, outputDirectory)
+    generate_gazebo_world(orthodir_path, heightmapResolution, progress=progress, metrics=metrics)
 
-        task_status["status"] = "completed"
-        print("Gazebo world generation completed successfully.")
-    except Exception as e:
-        task_status["status"] = "failed"
-        print(f"Error during processing: {e}")
+    print("Gazebo world generation completed successfully.")
 
 @app.route('/task-status', methods=['GET'])
 def task_status_endpoint():
-	global task_status
+	# Status of the most recently submitted job, kept for older clients
+	status = job_manager.latest()
 	result = {}
 	result["code"] = 200
-	result["message"] = task_status
+	result["message"] = status if status is not None else {"status": "idle"}
 	return jsonify(result)
 
+@app.route('/task-status/<job_id>', methods=['GET'])
+def job_status_endpoint(job_id):
+	status = job_manager.status(job_id)
+	if status is None:
+		return jsonify({"code": 404, "message": "Unknown job"})
+	return jsonify({"code": 200, "message": status})
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+	# Refresh the gauges that mirror state kept elsewhere before rendering
+	for state, count in job_manager.counts().items():
+		metrics_registry.set("gazebo_jobs", count, state=state)
+	for key, value in http_client.stats().items():
+		if key != "latency":
+			metrics_registry.set("gazebo_http_requests", value, kind=key)
+	for name, cache in (("tile", tile_cache), ("dem", dem_tile_cache)):
+		for key, value in cache.stats().items():
+			if value is not None:
+				metrics_registry.set("gazebo_cache", value, cache=name, kind=key)
+	return Response(metrics_registry.render(), mimetype="text/plain; version=0.0.4")
+
 @app.route('/download-tile', methods=['POST'])
 def download_tile():
 	postvars = request.form
 	x = int(postvars['x'])
 	y = int(postvars['y'])
 	z = int(postvars['z'])
-	quad = str(postvars['quad'])
 	timestamp = int(postvars['timestamp'])
 	outputDirectory = str(postvars['outputDirectory'])
 	outputFile = str(postvars['outputFile'])
@@ -70,40 +135,59 @@ def download_tile():
 	outputScale = int(postvars['outputScale'])
 	source = str(postvars['source'])
 
-	replaceMap = {
-		"x": str(x),
-		"y": str(y),
-		"z": str(z),
-		"quad": quad,
-		"timestamp": str(timestamp),
-	}
-	for key, value in replaceMap.items():
-		outputDirectory = outputDirectory.replace(f"{{{key}}}", value)
-		outputFile = outputFile.replace(f"{{{key}}}", value)
-	print(outputDirectory)
+	if not Utils.isValidScale(outputScale):
+		return jsonify({"code": 400, "message": "Output scale must be a power of two"})
 
-	filePath = os.path.join(globalParam.OUTPUT_BASE_PATH, outputDirectory, outputFile)
+	outputDirectory, filePath = tileDownloader.resolve_output_path(outputDirectory, outputFile, x, y, z, timestamp)
+	print(outputDirectory)
 
-	result = {}
-	if FileWriter.exists(filePath, x, y, z):
-		result["code"] = 200
-		result["message"] = 'Tile already exists'
-	else:
-		tempFile = random_string() + ".jpg"
-		tempFilePath = os.path.join(globalParam.TEMP_PATH, tempFile)
-		result["code"] = Utils.downloadFileScaled(source, tempFilePath, x, y, z, outputScale)
-
-		if os.path.isfile(tempFilePath):
-			FileWriter.addTile(lock, filePath, tempFilePath, x, y, z, outputScale)
-			with open(tempFilePath, "rb") as image_file:
-				result["image"] = base64.b64encode(image_file.read()).decode("utf-8")
-			os.remove(tempFilePath)
-			result["message"] = 'Tile Downloaded'
-		else:
-			result["message"] = 'Download failed'
+	result = tileDownloader.download_tile(lock, source, filePath, x, y, z, outputScale, withImage=True, writer=tileDownloader.getWriter(outputType))
 
 	return jsonify(result)
 
+@app.route('/bulk-download', methods=['POST'])
+def bulk_download():
+	postvars = request.form
+	bounds = list(map(float, postvars['bounds'].split(",")))
+	zoom_level = int(postvars['maxZoom'])
+	source = str(postvars['source'])
+	outputScale = int(postvars.get('outputScale', 1))
+	outputType = str(postvars.get('outputType', "directory"))
+	outputDirectory = str(postvars.get('outputDirectory', "{timestamp}"))
+	outputFile = str(postvars.get('outputFile', "{z}/{x}/{y}.jpg"))
+	timestamp = int(postvars.get('timestamp', int(time.time() * 1000)))
+	center = list(map(float, postvars['center'].split(","))) if 'center' in postvars else None
+	area_rect = str(postvars.get('area', ""))
+	generateWorld = postvars.get('generateWorld', 'false').lower() in ('1', 'true', 'yes')
+	try:
+		heightmapResolution = parse_heightmap_resolution(postvars)
+	except ValueError as e:
+		return jsonify({"code": 400, "message": str(e)})
+	if not Utils.isValidScale(outputScale):
+		return jsonify({"code": 400, "message": "Output scale must be a power of two"})
+
+	def onComplete(outputDirectory, filePath):
+		return job_manager.submit(
+			process_end_download, bounds, zoom_level, outputDirectory, outputFile, filePath, heightmapResolution, outputType,
+			outputDirectory=outputDirectory
+		)
+
+	if generateWorld:
+		prefetch_dem(bounds, zoom_level, outputDirectory.replace("{timestamp}", str(timestamp)), heightmapResolution)
+
+	jobId = bulkDownloader.start(
+		lock, bounds, zoom_level, source, outputScale, outputDirectory, outputFile, timestamp,
+		center, area_rect, onComplete if generateWorld else None, outputType
+	)
+	return jsonify({"code": 200, "message": {"job_id": jobId}})
+
+@app.route('/bulk-download/<job_id>', methods=['GET'])
+def bulk_download_status(job_id):
+	status = bulkDownloader.status(job_id)
+	if status is None:
+		return jsonify({"code": 404, "message": "Unknown job"})
+	return jsonify({"code": 200, "message": status})
+
 @app.route('/start-download', methods=['POST'])
 def start_download():
 
@@ -117,42 +201,55 @@ def start_download():
 	bounds = list(map(float, postvars['bounds'].split(",")))
 	center = list(map(float, postvars['center'].split(",")))
 	area_rect = postvars['area']
+	try:
+		heightmapResolution = parse_heightmap_resolution(postvars)
+	except ValueError as e:
+		return jsonify({"code": 400, "message": str(e)})
 
 	outputDirectory = outputDirectory.replace("{timestamp}", str(timestamp))
 	outputFile = outputFile.replace("{timestamp}", str(timestamp))
 	filePath = os.path.join(globalParam.OUTPUT_BASE_PATH, outputDirectory, outputFile)
 
-	FileWriter.addMetadata(
+	tileDownloader.getWriter(outputType).addMetadata(
 		lock, os.path.join(globalParam.OUTPUT_BASE_PATH, outputDirectory), filePath, outputFile,
 		"Map Tiles Downloader via AliFlux", "jpg", bounds, center, area_rect,
 		zoom_level, "mercator", 256 * outputScale
 	)
-	global task_status
-	task_status = {"status": "idle"} 
+	# Tiles the browser fails to store are refetched from the source, when given, before stitching
+	tileDownloader.getWriter(outputType).addManifest(
+		lock, os.path.join(globalParam.OUTPUT_BASE_PATH, outputDirectory), zoom_level,
+		maptile_utiles.get_tile_range(bounds, zoom_level), postvars.get('source'), outputScale
+	)
+	# The region is known now, fetch its DEM while the browser downloads the imagery
+	prefetch_dem(bounds, zoom_level, outputDirectory, heightmapResolution)
 	return jsonify({"code": 200, "message": "Metadata written"})
 
 @app.route('/end-download', methods=['POST'])
 def end_download():
 	postvars = request.form
 	outputType = postvars['outputType']
-	outputScale = int(postvars['outputScale'])
 	outputDirectory = postvars['outputDirectory']
 	outputFile = postvars['outputFile']
 	zoom_level = int(postvars['maxZoom'])
 	timestamp = int(postvars['timestamp'])
 	bounds = list(map(float, postvars['bounds'].split(",")))
-	center = list(map(float, postvars['center'].split(",")))
+	try:
+		heightmapResolution = parse_heightmap_resolution(postvars)
+	except ValueError as e:
+		return jsonify({"code": 400, "message": str(e)})
 
 	outputDirectory = outputDirectory.replace("{timestamp}", str(timestamp))
 	outputFile = outputFile.replace("{timestamp}", str(timestamp))
 	filePath = os.path.join(globalParam.OUTPUT_BASE_PATH, outputDirectory, outputFile)
 
-	FileWriter.close(lock, os.path.join(globalParam.OUTPUT_BASE_PATH, outputDirectory), filePath, zoom_level)
-    # Start the long-running task in a background thread
-	thread = threading.Thread(target=process_end_download, args=(bounds, zoom_level, outputDirectory, outputFile, filePath))
-	thread.start()
+	tileDownloader.getWriter(outputType).close(lock, os.path.join(globalParam.OUTPUT_BASE_PATH, outputDirectory), filePath, zoom_level)
+	# Queue the long-running generation behind the job workers
+	jobId = job_manager.submit(
+		process_end_download, bounds, zoom_level, outputDirectory, outputFile, filePath, heightmapResolution, outputType,
+		outputDirectory=outputDirectory
+	)
 
-	return jsonify({"code": 200, "message": "Download ended"})
+	return jsonify({"code": 200, "message": "Download ended", "job_id": jobId})
 
 @app.route('/', defaults={'path': 'index.htm'})
 @app.route('/<path:path>')
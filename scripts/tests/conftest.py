@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+# The modules are imported as utils.xxx with the scripts directory as working directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.param import globalParam
+from utils.dem_cache import dem_tile_cache
+
+
+@pytest.fixture
+def output_paths(tmp_path, monkeypatch):
+    """
+    Point the output, temp and DEM directories at a temporary directory.
+    """
+    monkeypatch.setattr(globalParam, "TEMP_PATH", str(tmp_path / "temp"))
+    monkeypatch.setattr(globalParam, "OUTPUT_BASE_PATH", str(tmp_path / "output"))
+    monkeypatch.setattr(globalParam, "DEM_PATH", str(tmp_path / "output" / "dem"))
+    dem_tile_cache.clear()
+    yield tmp_path
+    dem_tile_cache.clear()
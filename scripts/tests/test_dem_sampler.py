@@ -0,0 +1,98 @@
+import os
+
+import cv2
+import numpy as np
+
+from utils.param import globalParam
+from utils.dem_sampler import demSampler
+
+ZOOM = 10
+X0 = 500
+Y0 = 300
+
+
+def plane(cols, rows):
+    # Elevation linear in the mosaic pixel position, bilinear sampling reproduces it exactly
+    return 1000.0 + np.asarray(cols, dtype=np.float64) + 10.0 * np.asarray(rows, dtype=np.float64)
+
+
+def write_tile(x, y):
+    size = globalParam.DEM_TILE_SIZE
+    rows, cols = np.mgrid[0:size, 0:size]
+    heights = plane((x - X0) * size + cols, (y - Y0) * size + rows)
+    value = np.round((heights + 10000.0) * 10).astype(np.int64)
+    image = np.stack([value & 255, (value >> 8) & 255, value >> 16], axis=-1).astype(np.uint8)
+    path = demSampler.tile_path(ZOOM, x, y)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    cv2.imwrite(path, image)
+
+
+def pixel_centres(count, tiles):
+    # Tile coordinates of the middle of count pixels spread over tiles, clear of the mosaic border
+    size = globalParam.DEM_TILE_SIZE
+    pixels = np.linspace(1.0, tiles * size - 1.0, count)
+    return pixels, pixels / size
+
+
+def test_decode_terrain_rgb():
+    image = np.array([[[0, 0, 0], [160, 134, 1]]], dtype=np.uint8)
+    np.testing.assert_allclose(demSampler.decode_terrain_rgb(image), [[-10000.0, 0.0]], atol=1e-3)
+
+
+def test_lerp_falls_back_to_available_neighbour():
+    lower = np.array([1.0, np.nan, 3.0, np.nan])
+    upper = np.array([5.0, 7.0, np.nan, np.nan])
+    result = demSampler._lerp(lower, upper, np.float32(0.25))
+    np.testing.assert_array_equal(result[:3], [2.0, 7.0, 3.0])
+    assert np.isnan(result[3])
+
+
+def test_sample_grid_is_bilinear(output_paths):
+    for x in (X0, X0 + 1):
+        for y in (Y0, Y0 + 1):
+            write_tile(x, y)
+    col_pixels, tile_xs = pixel_centres(37, 2)
+    row_pixels, tile_ys = pixel_centres(29, 2)
+
+    heights = demSampler.sample_grid(X0 + tile_xs, Y0 + tile_ys, ZOOM)
+
+    assert heights.shape == (29, 37)
+    expected = plane(col_pixels[np.newaxis, :] - 0.5, row_pixels[:, np.newaxis] - 0.5)
+    np.testing.assert_allclose(heights, expected, atol=1e-2)
+
+
+def test_sample_grid_next_to_missing_tile(output_paths):
+    size = globalParam.DEM_TILE_SIZE
+    write_tile(X0, Y0)
+    _, tile_ys = pixel_centres(5, 1)
+    # between the last pixel centre of the tile and the edge of the missing tile east of it
+    edge_xs = X0 + 1 - np.array([0.4, 0.2, 0.0]) / size
+
+    heights = demSampler.sample_grid(edge_xs, Y0 + tile_ys, ZOOM)
+
+    assert not np.isnan(heights).any()
+    np.testing.assert_allclose(heights, np.repeat(heights[:, :1], 3, axis=1))
+    np.testing.assert_allclose(heights[:, 0], plane(size - 1, tile_ys * size - 0.5), atol=1e-2)
+
+    # samples well inside the missing tile have no elevation
+    inside = demSampler.sample_grid(X0 + 1 + np.array([0.25, 0.5, 0.75]), Y0 + tile_ys, ZOOM)
+    assert np.isnan(inside).all()
+
+
+def test_sample_grid_matches_across_tile_edge(output_paths):
+    # grids meeting on a tile edge sample it alike whether or not the next tile is in range
+    write_tile(X0, Y0)
+    _, tile_ys = pixel_centres(5, 1)
+    edge_x = np.array([X0 + 1.0])
+
+    alone = demSampler.sample_grid(np.array([X0 + 0.5, X0 + 1.0]), Y0 + tile_ys, ZOOM)[:, 1:]
+    shared = demSampler.sample_grid(np.array([X0 + 1.0, X0 + 1.5]), Y0 + tile_ys, ZOOM)[:, :1]
+
+    np.testing.assert_array_equal(alone, shared)
+    np.testing.assert_array_equal(alone, demSampler.sample_grid(edge_x, Y0 + tile_ys, ZOOM))
+
+
+def test_sample_grid_without_tiles(output_paths):
+    heights = demSampler.sample_grid(X0 + np.linspace(0, 1, 4), Y0 + np.linspace(0, 1, 3), ZOOM)
+    assert heights.shape == (3, 4)
+    assert np.isnan(heights).all()
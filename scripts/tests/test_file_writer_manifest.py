@@ -0,0 +1,49 @@
+import threading
+
+import numpy as np
+import pytest
+
+from utils.file_writer import FileWriter
+
+
+@pytest.mark.parametrize("tileRange", [(10, 10, 20, 20), (3, 9, 5, 7), (100, 112, 40, 44)])
+def test_manifest_round_trip(output_paths, tileRange):
+    path = str(output_paths / "tiles")
+    minX, maxX, minY, maxY = tileRange
+    rng = np.random.default_rng(sum(tileRange))
+    expected = rng.random((maxY - minY + 1, maxX - minX + 1)) < 0.5
+    ys, xs = np.nonzero(expected)
+
+    FileWriter.addManifest(threading.Lock(), path, 17, tileRange, source="https://example.com/{z}/{x}/{y}.png", outputScale=2)
+    FileWriter.flushManifest(path)
+    assert not FileWriter.readManifest(path)["present"].any()
+    FileWriter.updateManifest(path, present=zip((xs + minX).tolist(), (ys + minY).tolist()))
+
+    manifest = FileWriter.readManifest(path)
+    assert manifest["zoom_level"] == 17
+    assert manifest["range"] == list(tileRange)
+    assert manifest["source"] == "https://example.com/{z}/{x}/{y}.png"
+    assert manifest["outputScale"] == 2
+    assert manifest["present"].dtype == bool
+    np.testing.assert_array_equal(manifest["present"], expected)
+
+
+def test_manifest_update_and_missing_tiles(output_paths):
+    path = str(output_paths / "tiles")
+    FileWriter.addManifest(threading.Lock(), path, 12, (0, 2, 0, 2))
+    FileWriter.flushManifest(path)
+
+    # tiles outside the range are ignored
+    FileWriter.updateManifest(path, present=[(0, 0), (1, 0), (2, 2), (5, 5)])
+    FileWriter.updateManifest(path, missing=[(1, 0), (-1, 0)])
+
+    manifest = FileWriter.readManifest(path)
+    assert FileWriter.missingTiles(manifest, (0, 2, 0, 2)) == [(1, 0), (2, 0), (0, 1), (1, 1), (2, 1), (0, 2), (1, 2)]
+    # tiles outside the manifest range are never present
+    assert FileWriter.missingTiles(manifest, (2, 3, 2, 2)) == [(3, 2)]
+    assert FileWriter.missingTiles(manifest, (0, 0, 0, 0)) == []
+
+
+def test_missing_manifest(output_paths):
+    assert FileWriter.readManifest(str(output_paths / "tiles")) is None
+    FileWriter.updateManifest(str(output_paths / "tiles"), present=[(0, 0)])
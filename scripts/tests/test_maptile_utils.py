@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from utils.maptile_utils import maptile_utiles
+
+mercantile = pytest.importorskip("mercantile")
+
+ZOOMS = [0, 1, 5, 12, 17, 22]
+
+
+def points(count=500):
+    rng = np.random.default_rng(3)
+    lats = rng.uniform(-85.0, 85.0, count)
+    lons = rng.uniform(-180.0, 180.0, count)
+    # tile edges, the poles, the antimeridian and points just inside tile edges
+    edge_lats = [0.0, 85.0511, -85.0511, 89.9, -89.9, 45.0, 48.922499263758255]
+    edge_lons = [-180.0, 180.0, 0.0, 179.9999999, -179.9999999, 22.5, 2.8125]
+    return np.concatenate([lats, edge_lats]), np.concatenate([lons, edge_lons])
+
+
+@pytest.mark.parametrize("zoom", ZOOMS)
+def test_tiles_match_mercantile(zoom):
+    lats, lons = points()
+
+    xs, ys = maptile_utiles.lat_lon_to_tiles(lats, lons, zoom)
+
+    # latitudes are clamped to the Web Mercator limits before mercantile sees them
+    clamped = np.clip(lats, -maptile_utiles.MAX_LATITUDE, maptile_utiles.MAX_LATITUDE)
+    expected = [mercantile.tile(lon, lat, zoom) for lat, lon in zip(clamped.tolist(), lons.tolist())]
+    assert list(zip(xs.tolist(), ys.tolist())) == [(tile.x, tile.y) for tile in expected]
+    assert maptile_utiles.lat_lon_to_tile(float(lats[0]), float(lons[0]), zoom) == tuple(expected[0][:2])
+
+
+@pytest.mark.parametrize("zoom", ZOOMS)
+def test_bounds_and_quadkeys_match_mercantile(zoom):
+    lats, lons = points()
+    xs, ys = maptile_utiles.lat_lon_to_tiles(lats, lons, zoom)
+
+    west, south, east, north = maptile_utiles.tile_bounds(xs, ys, zoom)
+    quadkeys = maptile_utiles.quadkeys(xs, ys, zoom)
+    lat, lon = maptile_utiles.tile_to_lat_lon(xs, ys, zoom)
+
+    for index, (x, y) in enumerate(zip(xs.tolist(), ys.tolist())):
+        bounds = mercantile.bounds(x, y, zoom)
+        assert (west[index], south[index], east[index], north[index]) == (bounds.west, bounds.south, bounds.east, bounds.north)
+        assert quadkeys[index] == mercantile.quadkey(x, y, zoom)
+        corner = mercantile.ul(x, y, zoom)
+        assert lat[index] == pytest.approx(corner.lat, abs=1e-12)
+        assert lon[index] == pytest.approx(corner.lng, abs=1e-12)
+    corners = maptile_utiles.get_tile_bounds(int(xs[0]), int(ys[0]), zoom)
+    bounds = mercantile.bounds(int(xs[0]), int(ys[0]), zoom)
+    assert corners["southwest"] == (bounds.south, bounds.west)
+    assert corners["northeast"] == (bounds.north, bounds.east)
+
+
+@pytest.mark.parametrize("zoom", [3, 10, 15])
+@pytest.mark.parametrize("bounds", [[-0.2, 51.4, 0.1, 51.6], [139.6, 35.6, 139.9, 35.8], [-74.3, 40.5, -73.7, 40.9]])
+def test_tiles_in_bounds_match_mercantile(zoom, bounds):
+    expected = sorted((tile.y, tile.x) for tile in mercantile.tiles(*bounds, zoom))
+
+    tiles = maptile_utiles.get_tiles_in_bounds(bounds, zoom)
+
+    assert [(y, x) for x, y in tiles] == expected
+    xs, ys = zip(*tiles)
+    assert maptile_utiles.get_tile_range(bounds, zoom) == (min(xs), max(xs), min(ys), max(ys))
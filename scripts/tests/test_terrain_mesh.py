@@ -0,0 +1,94 @@
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from utils.terrain_mesh import terrainMesh
+
+N = 65
+
+
+def terrain(seed):
+    # Rolling hills with a sharp ridge, so the quadtree mixes large and full resolution leaves
+    rng = np.random.default_rng(seed)
+    rows, cols = np.mgrid[0:N, 0:N] / (N - 1)
+    heights = 20 * np.sin(3 * rows + rng.uniform(0, 6)) * np.cos(2 * cols + rng.uniform(0, 6))
+    heights += 40 * np.maximum(0, 1 - 12 * np.abs(cols - rng.uniform(0.3, 0.7) - 0.2 * rows))
+    return heights
+
+
+def signed_areas(triangles):
+    rows, cols = np.divmod(triangles, N)
+    return ((cols[:, 1] - cols[:, 0]) * (rows[:, 2] - rows[:, 0])
+            - (cols[:, 2] - cols[:, 0]) * (rows[:, 1] - rows[:, 0])) / 2
+
+
+def on_border(index):
+    row, col = divmod(index, N)
+    return row in (0, N - 1) or col in (0, N - 1)
+
+
+def assert_watertight(triangles):
+    # Every edge inside the grid is shared with the opposite direction by exactly one other
+    # triangle, a T-junction would leave the long edge of one side without a partner
+    edges = Counter()
+    for a, b, c in triangles.tolist():
+        edges.update([(a, b), (b, c), (c, a)])
+    assert max(edges.values()) == 1
+    for (a, b) in edges:
+        if (b, a) not in edges:
+            assert on_border(a) and on_border(b), f"open edge {divmod(a, N)} - {divmod(b, N)}"
+
+
+@pytest.mark.parametrize("seed", range(4))
+@pytest.mark.parametrize("max_error", [0.5, 2.0, 8.0])
+def test_simplified_mesh_is_watertight(seed, max_error):
+    triangles = terrainMesh.simplify(terrain(seed), max_error)
+
+    assert len(triangles) < 2 * (N - 1) ** 2
+    areas = signed_areas(triangles)
+    # counter clockwise seen from above and covering the grid once
+    assert (areas > 0).all()
+    assert areas.sum() == (N - 1) ** 2
+    assert_watertight(triangles)
+
+
+@pytest.mark.parametrize("max_error", [0.5, 2.0, 8.0])
+def test_simplified_mesh_is_within_error(max_error):
+    heights = terrain(1)
+    triangles = terrainMesh.simplify(heights, max_error)
+
+    worst = 0.0
+    for triangle in triangles:
+        rows, cols = np.divmod(triangle, N)
+        grid_rows, grid_cols = np.mgrid[rows.min():rows.max() + 1, cols.min():cols.max() + 1]
+        # barycentric coordinates of the grid points of the bounding box
+        weights = []
+        for a, b in ((1, 2), (2, 0), (0, 1)):
+            weights.append(((cols[a] - grid_cols) * (rows[b] - grid_rows)
+                            - (cols[b] - grid_cols) * (rows[a] - grid_rows)) / (2 * signed_areas(triangle[np.newaxis])[0]))
+        inside = np.all(np.array(weights) >= 0, axis=0)
+        surface = sum(weight * heights[row, col] for weight, row, col in zip(weights, rows, cols))
+        worst = max(worst, np.abs(surface - heights[grid_rows, grid_cols])[inside].max())
+    assert worst <= max_error + 1e-9
+
+
+def test_fixed_edges_keep_border_points():
+    triangles = terrainMesh.simplify(terrain(0), 8.0, fixed_edges=True)
+
+    assert_watertight(triangles)
+    used = set(triangles.ravel().tolist())
+    border = [index for index in range(N * N) if on_border(index)]
+    assert used.issuperset(border)
+
+
+def test_flat_grid_is_two_triangles():
+    triangles = terrainMesh.simplify(np.full((N, N), 12.0), 0.1)
+
+    assert len(triangles) == 2
+    assert signed_areas(triangles).sum() == (N - 1) ** 2
+
+
+def test_grid_size_is_checked():
+    with pytest.raises(ValueError):
+        terrainMesh.simplify(np.zeros((64, 64)), 1.0)
@@ -0,0 +1,39 @@
+import cv2
+import numpy as np
+import pytest
+
+from utils.texture_encoder import textureEncoder
+
+
+def image(kind):
+    rng = np.random.default_rng(7)
+    # noise over gradients, so the Up filter sees both flat and changing rows
+    rows, cols = np.mgrid[0:123, 0:77]
+    if kind == "bgr":
+        base = np.stack([rows * 2, cols * 3, rows + cols], axis=-1)
+        return ((base + rng.integers(0, 8, base.shape)) % 256).astype(np.uint8)
+    if kind == "grey":
+        return ((rows * cols + rng.integers(0, 8, rows.shape)) % 256).astype(np.uint8)
+    return ((rows * 500 + cols * 7 + rng.integers(0, 300, rows.shape)) % 65536).astype(np.uint16)
+
+
+@pytest.mark.parametrize("kind", ["bgr", "grey", "grey16"])
+@pytest.mark.parametrize("strips", [1, 2, 7, 500])
+@pytest.mark.parametrize("level", [0, 1, 9])
+def test_png_strips_decode_like_imencode(kind, strips, level):
+    original = image(kind)
+
+    data = textureEncoder.encode_png_strips(original, level, strips)
+
+    decoded = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    ok, reference = cv2.imencode(".png", original, [cv2.IMWRITE_PNG_COMPRESSION, level])
+    assert ok
+    expected = cv2.imdecode(reference, cv2.IMREAD_UNCHANGED)
+    assert decoded.dtype == expected.dtype == original.dtype
+    np.testing.assert_array_equal(decoded, expected)
+    np.testing.assert_array_equal(decoded, original)
+
+
+def test_png_strips_reject_alpha():
+    with pytest.raises(ValueError):
+        textureEncoder.encode_png_strips(np.zeros((4, 4, 4), dtype=np.uint8), 6, 2)
@@ -0,0 +1,141 @@
+import os
+import json
+import hashlib
+import tempfile
+
+
+class checkpointManifest:
+    '''
+    Checkpoints of the world generation stages of one model.
+
+    Every finished stage records a key, a hash of the contents of its inputs and
+    of its parameters, together with the files it wrote and a small JSON result.
+    A stage is skipped on the next run when its key is unchanged and its outputs
+    still exist. Keys of later stages include the keys of the stages they
+    depend on, so a change resumes the run from the first stale stage.
+    '''
+
+    FILE_NAME = '.checkpoint.json'
+
+    def __init__(self, model_path: str):
+        """
+        Args:
+            model_path (str): Directory of the generated model holding the manifest.
+        """
+        self.model_path = model_path
+        self.path = os.path.join(model_path, checkpointManifest.FILE_NAME)
+        try:
+            with open(self.path) as manifest_file:
+                self.stages = json.load(manifest_file)
+        except (OSError, ValueError):
+            self.stages = {}
+
+    @staticmethod
+    def digest(*parts) -> str:
+        """
+        Hash JSON serialisable parameters and keys of other stages.
+
+        Returns:
+            str: Hex digest.
+        """
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def hash_contents(items) -> str:
+        """
+        Hash named contents, e.g. the tiles of a tile set.
+
+        Args:
+            items (iterable): (name, data) pairs in a stable order. data is bytes, a file
+                path or None for a missing input.
+
+        Returns:
+            str: Hex digest.
+        """
+        digest = hashlib.sha256()
+        for name, data in items:
+            digest.update(str(name).encode("utf-8") + b"\0")
+            if isinstance(data, str):
+                try:
+                    with open(data, "rb") as input_file:
+                        data = input_file.read()
+                except OSError:
+                    data = None
+            if data is None:
+                digest.update(b"missing\0")
+            else:
+                digest.update(len(data).to_bytes(8, "little"))
+                digest.update(data)
+        return digest.hexdigest()
+
+    def is_fresh(self, stage: str, key: str) -> bool:
+        """
+        Check if a stage finished with the same key and its outputs still exist.
+
+        Args:
+            stage (str): Stage name.
+            key (str): Current key of the stage.
+
+        Returns:
+            bool: True if the stage can be skipped.
+        """
+        entry = self.stages.get(stage)
+        if entry is None or entry["key"] != key:
+            return False
+        return all(os.path.isfile(os.path.join(self.model_path, output)) for output in entry["outputs"])
+
+    def result(self, stage: str):
+        """
+        Get the result recorded by a stage.
+
+        Returns:
+            The JSON result passed to record.
+        """
+        return self.stages[stage]["result"]
+
+    def invalidate(self, stage: str) -> None:
+        """
+        Forget a stage before it is run again, so an interrupted run is not mistaken for a finished one.
+
+        Args:
+            stage (str): Stage name.
+
+        Returns:
+            None
+        """
+        if self.stages.pop(stage, None) is not None:
+            self.save()
+
+    def record(self, stage: str, key: str, outputs: list = (), result=None) -> None:
+        """
+        Record a finished stage.
+
+        Args:
+            stage (str): Stage name.
+            key (str): Key the stage was run with.
+            outputs (list, optional): Files written by the stage, relative to the model directory.
+            result (optional): JSON serialisable result restored when the stage is skipped.
+
+        Returns:
+            None
+        """
+        self.stages[stage] = {"key": key, "outputs": list(outputs), "result": result}
+        self.save()
+
+    def save(self) -> None:
+        """
+        Atomically write the manifest.
+
+        Returns:
+            None
+        """
+        os.makedirs(self.model_path, exist_ok=True)
+        descriptor, temp_path = tempfile.mkstemp(dir=self.model_path, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "w") as temp_file:
+                json.dump(self.stages, temp_file, indent=2)
+            os.replace(temp_path, self.path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
@@ -1,63 +1,79 @@
-﻿from urllib import request
-import numpy as np
-import cv2
-import os
+﻿import os
+import tempfile
 from utils.maptile_utils import maptile_utiles
-from multiprocessing import Pool, cpu_count
+from utils.http_client import http_client
+from utils.tile_cache import tile_cache
+from utils.param import globalParam
+from utils.executor import task_executor
 
-def fetch_image_from_url(url):
+def fetch_tile_data(url, tile=None):
     try:
-        resp = request.urlopen(url)
-        img = np.asarray(bytearray(resp.read()), dtype="uint8")
-        img = cv2.imdecode(img, cv2.IMREAD_ANYCOLOR)
-        if img is None:
-            raise ValueError("Failed to decode image from URL.")
-        return img
+        if tile is None:
+            code, data = http_client.fetch(url)
+        else:
+            # read through the persistent tile cache keyed by the URL template
+            zoom, x, y = tile
+            code, data = tile_cache.fetch(globalParam.DEM_TILE_URL, zoom, x, y, lambda: http_client.fetch(url))
+        if code != 200 or not data:
+            raise ValueError(f"HTTP status {code}.")
+        return data
     except Exception as e:
-        print(f"Failed to download or decode image from {url}: {e}")
+        print(f"Failed to download image from {url}: {e}")
         return None
 
 def download_tile_image(args):
     zoom, x, y, output_dir = args
-    tile_url = (
-        f"https://api.mapbox.com/raster/v1/mapbox.mapbox-terrain-dem-v1/"
-        f"{zoom}/{x}/{y}.webp?sku=101CUGorpzzyK&access_token=pk.eyJ1IjoicHJhdmlubWFsaTg1NCIsImEiOiJjbDM4Y2ZpaDIwMDdkM2JxbGM0ZWtkamxxIn0.VStYkAceQjhkW8StZekEvg"
-    )
-    img = fetch_image_from_url(tile_url)
-    if img is not None:
-        file_path = os.path.join(output_dir, f"{y}.png")
-        cv2.imwrite(file_path, img)
-        print(f"[INFO] Saved: {file_path}")
-    else:
+    file_path = os.path.join(output_dir, f"{y}.png")
+    # Tiles of earlier jobs are kept, rewriting them would also invalidate their decoded copies in the DEM cache
+    if os.path.isfile(file_path):
+        return True
+    tile_url = globalParam.DEM_TILE_URL.format(z=zoom, x=x, y=y)
+    data = fetch_tile_data(tile_url, (zoom, x, y))
+    if data is None:
         print(f"[WARN] Skipped tile ({x}, {y}) due to download error.")
+        return False
+    # Stored as served, OpenCV reads the image format from the content. Written to a temporary
+    # file and renamed, jobs reading the DEM never see a partial tile
+    descriptor, temp_path = tempfile.mkstemp(dir=output_dir, suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "wb") as temp_file:
+            temp_file.write(data)
+        os.replace(temp_path, file_path)
+    except OSError as e:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        print(f"[WARN] Skipped tile ({x}, {y}) due to a write error: {e}")
+        return False
+    print(f"[INFO] Saved: {file_path}")
+    return True
 
-def download_dem_data(bound_array, output_directory, zoom_range: tuple = (10, 11)):
+def download_dem_data(bound_array, output_directory, zoom_range: tuple):
+    # Returns the number of downloaded and failed tiles
+    result = {"downloaded": 0, "failed": 0}
     try:
         tasks = []
         nw_lat, nw_lon = map(float, bound_array["northwest"])
         se_lat, se_lon = map(float, bound_array["southeast"])
-        maptile_utiles.dir_check(output_directory)
+        maptile_utiles.ensure_dir(output_directory)
 
         for zoom in range(zoom_range[0], zoom_range[1] + 1):
-            nw_tilex, nw_tiley = maptile_utiles.lat_lon_to_tile(nw_lat, nw_lon, zoom)
-            se_tilex, se_tiley = maptile_utiles.lat_lon_to_tile(se_lat, se_lon, zoom)
-
-            tilex_start, tilex_end = sorted((nw_tilex, se_tilex))
-            tiley_start, tiley_end = sorted((nw_tiley, se_tiley))
+            tilex_start, tilex_end, tiley_start, tiley_end = maptile_utiles.get_tile_range((nw_lon, se_lat, se_lon, nw_lat), zoom)
 
             zoom_dir = os.path.join(output_directory, str(zoom))
-            maptile_utiles.dir_check(zoom_dir)
+            maptile_utiles.ensure_dir(zoom_dir)
 
             # Prepare all tile args
             for x in range(tilex_start, tilex_end + 1):
                 x_dir = os.path.join(zoom_dir, str(x))
-                maptile_utiles.dir_check(x_dir)
+                maptile_utiles.ensure_dir(x_dir)
                 for y in range(tiley_start, tiley_end + 1):
                     tasks.append((zoom, x, y, x_dir))
 
-            # Use multiprocessing
-        with Pool(processes=cpu_count()) as pool:  # You can tune the number here
-            pool.map(download_tile_image, tasks)
+        # Network bound, the tiles are fetched on the I/O threads of the shared executor
+        saved = task_executor.map(download_tile_image, tasks, io=True)
+        result["downloaded"] = sum(saved)
+        result["failed"] = len(saved) - result["downloaded"]
 
     except Exception as e:
         print(f"Download failed: {e}")
+    return result
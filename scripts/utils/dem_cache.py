@@ -0,0 +1,107 @@
+import os
+import threading
+from collections import OrderedDict
+from utils.param import globalParam
+
+
+class demTileCache:
+    '''
+    Process wide LRU cache of decoded DEM tiles keyed by (zoom, x, y) and tile file.
+
+    Entries are evicted least recently used first once the decoded arrays
+    exceed the memory cap. Tiles that are not available are never cached so
+    a later download is picked up on the next lookup, and a tile whose file
+    changed size or modification time since it was decoded is decoded again.
+    '''
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def file_version(path: str):
+        """
+        Get the (modification time, size) of a tile file, None if it does not exist.
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def get(self, zoom: int, x: int, y: int, loader, path: str = None):
+        """
+        Get a decoded tile from the cache, decoding it with loader on a miss.
+
+        Args:
+            zoom (int): Zoom level of the tile.
+            x (int): Tile number in X direction.
+            y (int): Tile number in Y direction.
+            loader (callable): Called as loader(zoom, x, y) to decode the tile on a miss.
+            path (str, optional): File the tile is decoded from, a cached tile is only used while
+                the file is unchanged. Defaults to None.
+
+        Returns:
+            np.ndarray: Read only decoded tile, or None if loader could not provide it.
+        """
+        key = (zoom, x, y, path)
+        version = demTileCache.file_version(path) if path is not None else None
+        with self._lock:
+            entry = self._tiles.get(key)
+            if entry is not None and entry[1] == version:
+                self._tiles.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                # the tile file was rewritten or removed
+                del self._tiles[key]
+                self.current_bytes -= entry[0].nbytes
+            self.misses += 1
+
+        tile = loader(zoom, x, y)
+        if tile is None:
+            return None
+        tile.setflags(write=False)
+
+        with self._lock:
+            if key not in self._tiles and tile.nbytes <= self.max_bytes:
+                self._tiles[key] = (tile, version)
+                self.current_bytes += tile.nbytes
+                while self.current_bytes > self.max_bytes:
+                    _, (evicted, _) = self._tiles.popitem(last=False)
+                    self.current_bytes -= evicted.nbytes
+                    self.evictions += 1
+        return tile
+
+    def clear(self) -> None:
+        """
+        Drop every cached tile. The hit and miss counters are kept.
+        """
+        with self._lock:
+            self._tiles.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> dict:
+        """
+        Get the cache counters.
+
+        Returns:
+            dict: Hits, misses, evictions, cached tile count and memory usage in bytes.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "tiles": len(self._tiles),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+dem_tile_cache = demTileCache(globalParam.DEM_CACHE_MAX_BYTES)
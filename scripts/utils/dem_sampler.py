@@ -0,0 +1,207 @@
+import os
+import cv2
+import numpy as np
+from utils.param import globalParam
+from utils.maptile_utils import maptile_utiles
+from utils.dem_cache import dem_tile_cache
+
+
+class demSampler:
+
+    @staticmethod
+    def decode_terrain_rgb(dem_img) -> np.ndarray:
+        """
+        Decode a terrain-RGB tile into elevations.
+
+        Args:
+            dem_img (np.ndarray): Tile image in OpenCV BGR channel order.
+
+        Returns:
+            np.ndarray: Elevation in meters for every pixel (float32).
+
+        reference : https://docs.mapbox.com/data/tilesets/reference/mapbox-terrain-dem-v1/
+        """
+        b = dem_img[..., 0].astype(np.float32)
+        g = dem_img[..., 1].astype(np.float32)
+        r = dem_img[..., 2].astype(np.float32)
+        return (r * 65536.0 + g * 256.0 + b) * 0.1 - 10000.0
+
+    @staticmethod
+    def read_tile(zoom: int, x: int, y: int):
+        """
+        Get a decoded DEM tile through the process wide DEM tile cache.
+
+        Args:
+            zoom (int): Zoom level of the tile.
+            x (int): Tile number in X direction.
+            y (int): Tile number in Y direction.
+
+        Returns:
+            np.ndarray: Decoded elevations, or None if the tile is not available.
+        """
+        return dem_tile_cache.get(zoom, x, y, demSampler.decode_tile_file, demSampler.tile_path(zoom, x, y))
+
+    @staticmethod
+    def tile_path(zoom: int, x: int, y: int) -> str:
+        """
+        Get the path of a DEM tile in the DEM directory.
+        """
+        return os.path.join(globalParam.DEM_PATH, str(zoom), str(x), str(y) + '.png')
+
+    @staticmethod
+    def decode_tile_file(zoom: int, x: int, y: int):
+        """
+        Read and decode a single DEM tile from the DEM directory.
+
+        Args:
+            zoom (int): Zoom level of the tile.
+            x (int): Tile number in X direction.
+            y (int): Tile number in Y direction.
+
+        Returns:
+            np.ndarray: Decoded elevations, or None if the tile is not available.
+        """
+        dem_tile_path = demSampler.tile_path(zoom, x, y)
+        if not os.path.isfile(dem_tile_path):
+            return None
+        dem_img = cv2.imread(dem_tile_path)
+        if dem_img is None:
+            return None
+        return demSampler.decode_terrain_rgb(dem_img)
+
+    @staticmethod
+    def load_mosaic(zoom: int, x_start: int, x_end: int, y_start: int, y_end: int):
+        """
+        Mosaic the decoded DEM tiles of an inclusive tile range into one array.
+
+        Args:
+            zoom (int): Zoom level of the tiles.
+            x_start (int): First tile number in X direction.
+            x_end (int): Last tile number in X direction.
+            y_start (int): First tile number in Y direction.
+            y_end (int): Last tile number in Y direction.
+
+        Returns:
+            tuple: (mosaic, tile_height, tile_width). Pixels of missing tiles are NaN.
+                   mosaic is None when no tile of the range is available.
+        """
+        tiles = {}
+        for x in range(x_start, x_end + 1):
+            for y in range(y_start, y_end + 1):
+                tile = demSampler.read_tile(zoom, x, y)
+                if tile is None:
+                    print(f"Tile not found : {zoom}/{x}/{y}")
+                else:
+                    tiles[(x, y)] = tile
+
+        if not tiles:
+            return None, 0, 0
+
+        tile_height, tile_width = next(iter(tiles.values())).shape[:2]
+        mosaic = np.full(((y_end - y_start + 1) * tile_height, (x_end - x_start + 1) * tile_width), np.nan, dtype=np.float32)
+        for (x, y), tile in tiles.items():
+            if tile.shape[:2] != (tile_height, tile_width):
+                tile = cv2.resize(tile, (tile_width, tile_height), interpolation=cv2.INTER_LINEAR)
+            row = (y - y_start) * tile_height
+            col = (x - x_start) * tile_width
+            mosaic[row:row + tile_height, col:col + tile_width] = tile
+
+        return mosaic, tile_height, tile_width
+
+    @staticmethod
+    def sample(lats, lons, zoom: int) -> np.ndarray:
+        """
+        Get the height above mean sea level for arrays of latitude and longitude.
+
+        The DEM tiles covering all the points are read and mosaiced once and the
+        elevations of every point are picked from the mosaic in one go.
+
+        Args:
+            lats (array_like): Latitudes in degrees.
+            lons (array_like): Longitudes in degrees.
+            zoom (int): Zoom level of the DEM tiles to sample.
+
+        Returns:
+            np.ndarray: Elevations in meters with the shape of lats, NaN where no DEM tile is available.
+        """
+        fx, fy = maptile_utiles.lat_lon_to_fractional_tile(lats, lons, zoom)
+        max_tile = 2 ** zoom - 1
+        tile_x = np.clip(np.floor(fx), 0, max_tile).astype(np.int64)
+        tile_y = np.clip(np.floor(fy), 0, max_tile).astype(np.int64)
+        if tile_x.size == 0:
+            return np.empty(tile_x.shape, dtype=np.float32)
+
+        x_start, x_end = int(tile_x.min()), int(tile_x.max())
+        y_start, y_end = int(tile_y.min()), int(tile_y.max())
+        mosaic, tile_height, tile_width = demSampler.load_mosaic(zoom, x_start, x_end, y_start, y_end)
+        if mosaic is None:
+            return np.full(tile_x.shape, np.nan, dtype=np.float32)
+
+        # from the fractional tile coordinates get the pixel coordinates inside the mosaic
+        px = np.clip(((fx - x_start) * tile_width).astype(np.int64), 0, mosaic.shape[1] - 1)
+        py = np.clip(((fy - y_start) * tile_height).astype(np.int64), 0, mosaic.shape[0] - 1)
+        return mosaic[py, px]
+
+    @staticmethod
+    def sample_grid(tile_xs, tile_ys, zoom: int) -> np.ndarray:
+        """
+        Bilinearly sample the DEM on a regular grid given in fractional tile coordinates.
+
+        Rows and columns of a Web Mercator aligned grid are separable, so the
+        interpolation indices and weights are computed once per column and once
+        per row and the grid is assembled with four array gathers.
+
+        Args:
+            tile_xs (array_like): Fractional tile x coordinate of every grid column.
+            tile_ys (array_like): Fractional tile y coordinate of every grid row.
+            zoom (int): Zoom level of the DEM tiles and of the tile coordinates.
+
+        Returns:
+            np.ndarray: Elevations in meters with shape (len(tile_ys), len(tile_xs)), NaN where no DEM tile is available.
+        """
+        tile_xs = np.asarray(tile_xs, dtype=np.float64)
+        tile_ys = np.asarray(tile_ys, dtype=np.float64)
+        max_tile = 2 ** zoom - 1
+        # include the tiles holding the neighbouring pixel centres of samples near a tile edge, so
+        # grids meeting on a tile edge, e.g. the sub-models of a tiled world, sample it alike
+        half_pixel = 0.5 / globalParam.DEM_TILE_SIZE
+        x_start = int(np.clip(np.floor(tile_xs.min() - half_pixel), 0, max_tile))
+        y_start = int(np.clip(np.floor(tile_ys.min() - half_pixel), 0, max_tile))
+        x_end = int(np.clip(np.floor(tile_xs.max() + half_pixel), x_start, max_tile))
+        y_end = int(np.clip(np.floor(tile_ys.max() + half_pixel), y_start, max_tile))
+        mosaic, tile_height, tile_width = demSampler.load_mosaic(zoom, x_start, x_end, y_start, y_end)
+        if mosaic is None:
+            return np.full((tile_ys.size, tile_xs.size), np.nan, dtype=np.float32)
+
+        x0, x1, wx = demSampler._interpolation_axis((tile_xs - x_start) * tile_width, mosaic.shape[1])
+        y0, y1, wy = demSampler._interpolation_axis((tile_ys - y_start) * tile_height, mosaic.shape[0])
+        wx = wx[np.newaxis, :]
+        wy = wy[:, np.newaxis]
+        top = demSampler._lerp(mosaic[y0[:, np.newaxis], x0], mosaic[y0[:, np.newaxis], x1], wx)
+        bottom = demSampler._lerp(mosaic[y1[:, np.newaxis], x0], mosaic[y1[:, np.newaxis], x1], wx)
+        return demSampler._lerp(top, bottom, wy)
+
+    @staticmethod
+    def _lerp(lower: np.ndarray, upper: np.ndarray, weight: np.ndarray) -> np.ndarray:
+        # Linear interpolation that falls back to the available neighbour next to a missing tile
+        blended = lower * (1 - weight) + upper * weight
+        return np.where(np.isnan(lower), upper, np.where(np.isnan(upper), lower, blended))
+
+    @staticmethod
+    def _interpolation_axis(pixel_coords: np.ndarray, length: int):
+        """
+        Get the neighbouring pixel indices and weights along one mosaic axis.
+
+        Args:
+            pixel_coords (np.ndarray): Positions in pixels from the mosaic edge.
+            length (int): Number of pixels along the axis.
+
+        Returns:
+            tuple: (lower index, upper index, weight of the upper index).
+        """
+        # pixel values are located at the pixel centres
+        centres = np.clip(pixel_coords - 0.5, 0, length - 1)
+        lower = np.minimum(np.floor(centres).astype(np.int64), max(length - 2, 0))
+        upper = np.minimum(lower + 1, length - 1)
+        weight = (centres - lower).astype(np.float32)
+        return lower, upper, weight
@@ -0,0 +1,177 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from utils.param import globalParam
+
+
+_worker_state = threading.local()
+
+
+def _mark_worker() -> None:
+    # Initializer of every pool worker, work submitted from a worker runs inline
+    _worker_state.active = True
+
+
+class taskExecutor:
+    '''
+    Worker pools shared by all pipeline stages and jobs.
+
+    CPU bound tasks such as tile decoding run in the "thread", "process" or
+    "inline" mode the executor is created with. I/O bound tasks such as tile
+    downloads always run on threads, except in inline mode, because they share
+    the HTTP client, caches and writers of this process. The pools are started
+    on first use and live as long as the server.
+
+    Tasks are passed as small descriptors, e.g. tile coordinates and paths,
+    and must be module level functions in process mode. Work submitted from
+    inside a worker runs inline so nested stages cannot deadlock the pools.
+    '''
+
+    MODES = ("thread", "process", "inline")
+
+    def __init__(self, mode: str = "thread", workers: int = None, io_workers: int = 16):
+        """
+        Args:
+            mode (str, optional): "thread", "process" or "inline" for CPU bound tasks. Defaults to "thread".
+            workers (int, optional): Workers for CPU bound tasks, None uses the CPU count.
+            io_workers (int, optional): Threads for I/O bound tasks. Defaults to 16.
+        """
+        if mode not in taskExecutor.MODES:
+            raise ValueError(f"Executor mode must be one of {taskExecutor.MODES}, got {mode}")
+        self.mode = mode
+        self.workers = workers or os.cpu_count() or 1
+        self.io_workers = io_workers
+        self._lock = threading.Lock()
+        self._pools = {}
+
+    @staticmethod
+    def in_worker() -> bool:
+        """
+        Check if the caller runs inside a worker of a pool.
+        """
+        return getattr(_worker_state, "active", False)
+
+    def _pool(self, io: bool):
+        # None when the tasks run inline in the calling thread
+        if self.mode == "inline" or taskExecutor.in_worker():
+            return None
+        kind = "io" if io else self.mode
+        with self._lock:
+            pool = self._pools.get(kind)
+            if pool is None:
+                if kind == "process":
+                    pool = ProcessPoolExecutor(self.workers, initializer=_mark_worker)
+                else:
+                    pool = ThreadPoolExecutor(self.io_workers if io else self.workers,
+                                              thread_name_prefix=kind, initializer=_mark_worker)
+                self._pools[kind] = pool
+            return pool
+
+    def submit(self, func, task, io: bool = False) -> Future:
+        """
+        Run func(task) in a worker.
+
+        Args:
+            func (callable): Task function.
+            task: Task descriptor.
+            io (bool, optional): True for I/O bound tasks. Defaults to False.
+
+        Returns:
+            Future: Future of the result, already done when the task ran inline.
+        """
+        pool = self._pool(io)
+        if pool is not None:
+            return pool.submit(func, task)
+        future = Future()
+        try:
+            future.set_result(func(task))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def imap_unordered(self, func, tasks, io: bool = False, window: int = None):
+        """
+        Run func on every task and yield the results as they finish.
+
+        At most window tasks are in flight, so large task iterables, e.g. the
+        tiles of an MBTiles store, are never held in memory at once.
+
+        Args:
+            func (callable): Task function.
+            tasks (iterable): Task descriptors.
+            io (bool, optional): True for I/O bound tasks. Defaults to False.
+            window (int, optional): Tasks in flight, None uses four per worker.
+
+        Yields:
+            Results in completion order. An exception raised by a task is raised here.
+        """
+        pool = self._pool(io)
+        if pool is None:
+            for task in tasks:
+                yield func(task)
+            return
+
+        window = window or 4 * (self.io_workers if io else self.workers)
+        pending = deque()
+        done = threading.Condition()
+        finished = deque()
+
+        def on_done(future):
+            with done:
+                finished.append(future)
+                done.notify()
+
+        try:
+            for task in tasks:
+                future = pool.submit(func, task)
+                pending.append(future)
+                future.add_done_callback(on_done)
+                while len(pending) >= window:
+                    yield self._next(pending, finished, done)
+            while pending:
+                yield self._next(pending, finished, done)
+        finally:
+            for future in pending:
+                future.cancel()
+
+    @staticmethod
+    def _next(pending: deque, finished: deque, done: threading.Condition):
+        with done:
+            while not finished:
+                done.wait()
+            future = finished.popleft()
+        pending.remove(future)
+        return future.result()
+
+    def map(self, func, tasks, io: bool = False) -> list:
+        """
+        Run func on every task.
+
+        Args:
+            func (callable): Task function.
+            tasks (iterable): Task descriptors.
+            io (bool, optional): True for I/O bound tasks. Defaults to False.
+
+        Returns:
+            list: Results in task order.
+        """
+        pool = self._pool(io)
+        if pool is None:
+            return [func(task) for task in tasks]
+        return [future.result() for future in [pool.submit(func, task) for task in tasks]]
+
+    def shutdown(self) -> None:
+        """
+        Stop the pools, they are started again on the next use.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            pools, self._pools = self._pools, {}
+        for pool in pools.values():
+            pool.shutdown(wait=True)
+
+
+task_executor = taskExecutor(globalParam.EXECUTOR_MODE, globalParam.EXECUTOR_WORKERS, globalParam.EXECUTOR_IO_WORKERS)
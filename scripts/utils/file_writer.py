@@ -1,6 +1,8 @@
 import os
 import json
-import shutil
+import base64
+import threading
+import numpy as np
 from utils.param import globalParam
 
 
@@ -9,6 +11,9 @@ from utils.param import globalParam
 class FileWriter:
 
 	slicer = None
+	manifestLock = threading.Lock()
+	# Tiles directory of every open manifest -> (x, y) of the stored tiles not yet written to it
+	manifestTiles = {}
 	
 	def ensureDirectory(lock, directory):
 		'''
@@ -75,6 +80,8 @@ class FileWriter:
 			("generator", "EliteMapper by Visor Dynamics"),
 			("type", "overlay"),
 			("attribution", "EliteMapper by Visor Dynamics"),
+			# file template relative to path, the world generator builds the tile paths from it
+			("tiles", os.path.relpath(file, path)),
 		]
 		
 		with open(path + "/metadata.json", 'w+') as jsonFile:
@@ -83,14 +90,165 @@ class FileWriter:
 		return
 
 	@staticmethod
-	def addTile(lock, filePath, sourcePath, x, y, z, outputScale):
+	def manifestPath(path):
 		'''
-       Copy a file from sourcePath to filePath.
+        Get the path of the tile manifest of a tiles directory.
+		'''
+		return os.path.join(path, "manifest.json")
+
+	@staticmethod
+	def addManifest(lock, path, zoom_level, tileRange, source=None, outputScale=1):
+		'''
+        Start the manifest of the tiles a job is expected to store, with none present yet.
+
+        Args:
+            lock (multiprocessing.Lock): A lock for thread-safe operations.
+            path (str): The tiles directory holding metadata.json.
+            zoom_level (int): Zoom level of the tiles.
+            tileRange (tuple): (minX, maxX, minY, maxY) inclusive range of expected tiles.
+            source (str, optional): Tile source URL template missing tiles are fetched from again. Defaults to None.
+            outputScale (int, optional): The output scale. Defaults to 1.
+
+        Returns:
+            None
+		'''
+		FileWriter.ensureDirectory(lock, path)
+		minX, maxX, minY, maxY = map(int, tileRange)
+		present = np.zeros((maxY - minY + 1, maxX - minX + 1), dtype=bool)
+		manifest = {"zoom_level": zoom_level, "range": [minX, maxX, minY, maxY], "source": source,
+					"outputScale": outputScale, "present": present}
+		with FileWriter.manifestLock:
+			FileWriter.writeManifest(path, manifest)
+			FileWriter.manifestTiles[os.path.abspath(path)] = []
+
+		return
+
+	@staticmethod
+	def markPresent(filePath, x, y):
+		'''
+        Record a stored tile in the open manifest of the tiles directory holding filePath.
+
+        The tiles are written to the manifest in batches of globalParam.MANIFEST_BATCH_SIZE
+        and by flushManifest when the download is closed.
+
+        Args:
+            filePath (str): Path of the tile, or of the MBTiles file.
+            x (int): X-coordinate.
+            y (int): Y-coordinate.
+
+        Returns:
+            None
+		'''
+		filePath = os.path.abspath(filePath)
+		with FileWriter.manifestLock:
+			paths = [path for path in FileWriter.manifestTiles if filePath.startswith(os.path.join(path, ""))]
+			if not paths:
+				return
+			path = max(paths, key=len)
+			tiles = FileWriter.manifestTiles[path]
+			tiles.append((x, y))
+			if len(tiles) < globalParam.MANIFEST_BATCH_SIZE:
+				return
+			FileWriter.manifestTiles[path] = []
+		FileWriter.updateManifest(path, tiles)
+
+	@staticmethod
+	def flushManifest(path):
+		'''
+        Write the recorded tiles to the manifest of a tiles directory and close it.
+		'''
+		with FileWriter.manifestLock:
+			tiles = FileWriter.manifestTiles.pop(os.path.abspath(path), None)
+		if tiles:
+			FileWriter.updateManifest(path, tiles)
+
+	@staticmethod
+	def writeManifest(path, manifest):
+		'''
+        Write a manifest, the presence of the tiles is stored as a bitmap. Call with manifestLock held.
+		'''
+		data = dict(manifest)
+		data["present"] = base64.b64encode(np.packbits(manifest["present"], axis=None).tobytes()).decode("ascii")
+		with open(FileWriter.manifestPath(path), 'w') as jsonFile:
+			json.dump(data, jsonFile)
+
+	@staticmethod
+	def readManifest(path):
+		'''
+        Read the tile manifest of a tiles directory.
+
+        Args:
+            path (str): The tiles directory holding metadata.json.
+
+        Returns:
+            dict: "zoom_level", "range", "source", "outputScale" and "present", a boolean array
+                  with one row per tile row of the range. None for tiles without a manifest.
+		'''
+		if not os.path.isfile(FileWriter.manifestPath(path)):
+			return None
+		with open(FileWriter.manifestPath(path)) as jsonFile:
+			manifest = json.load(jsonFile)
+		minX, maxX, minY, maxY = manifest["range"]
+		shape = (maxY - minY + 1, maxX - minX + 1)
+		bits = np.frombuffer(base64.b64decode(manifest["present"]), dtype=np.uint8)
+		manifest["present"] = np.unpackbits(bits, count=shape[0] * shape[1]).astype(bool).reshape(shape)
+		return manifest
+
+	@staticmethod
+	def updateManifest(path, present=(), missing=()):
+		'''
+        Mark tiles of the manifest as present or missing, tiles outside its range are ignored.
+
+        Args:
+            path (str): The tiles directory holding metadata.json.
+            present (iterable, optional): (x, y) of stored tiles.
+            missing (iterable, optional): (x, y) of tiles that could not be stored.
+
+        Returns:
+            None
+		'''
+		with FileWriter.manifestLock:
+			manifest = FileWriter.readManifest(path)
+			if manifest is None:
+				return
+			minX, maxX, minY, maxY = manifest["range"]
+			for tiles, value in ((present, True), (missing, False)):
+				tiles = np.asarray(list(tiles), dtype=np.int64).reshape(-1, 2)
+				inside = (tiles[:, 0] >= minX) & (tiles[:, 0] <= maxX) & (tiles[:, 1] >= minY) & (tiles[:, 1] <= maxY)
+				manifest["present"][tiles[inside, 1] - minY, tiles[inside, 0] - minX] = value
+			FileWriter.writeManifest(path, manifest)
+
+		return
+
+	@staticmethod
+	def missingTiles(manifest, tileRange):
+		'''
+        Get the tiles of a range the manifest does not mark as present.
+
+        Args:
+            manifest (dict): Manifest returned by readManifest.
+            tileRange (tuple): (minX, maxX, minY, maxY) inclusive tile range.
+
+        Returns:
+            list: (x, y) of the tiles of tileRange not marked present, including tiles outside the manifest range.
+		'''
+		minX, maxX, minY, maxY = manifest["range"]
+		rangeMinX, rangeMaxX, rangeMinY, rangeMaxY = tileRange
+		ys, xs = np.mgrid[rangeMinY:rangeMaxY + 1, rangeMinX:rangeMaxX + 1]
+		inside = (xs >= minX) & (xs <= maxX) & (ys >= minY) & (ys <= maxY)
+		present = np.zeros(xs.shape, dtype=bool)
+		present[inside] = manifest["present"][ys[inside] - minY, xs[inside] - minX]
+		return list(zip(xs[~present].tolist(), ys[~present].tolist()))
+
+	@staticmethod
+	def addTile(lock, filePath, data, x, y, z, outputScale):
+		'''
+       Write the downloaded tile bytes to filePath.
 
         Args:
             lock (multiprocessing.Lock): A lock for thread-safe operations.
-            filePath (str): The path to save the copied file.
-            sourcePath (str): The source file path to copy from.
+            filePath (str): The path to save the tile.
+            data (bytes): The encoded tile image.
             x (int): X-coordinate.
             y (int): Y-coordinate.
             z (int): Z-coordinate.
@@ -102,7 +260,9 @@ class FileWriter:
 		fileDirectory = os.path.dirname(filePath)
 		FileWriter.ensureDirectory(lock, fileDirectory)
 		
-		shutil.copyfile(sourcePath, filePath)
+		with open(filePath, "wb") as tileFile:
+			tileFile.write(data)
+		FileWriter.markPresent(filePath, x, y)
 
 		return
 
@@ -127,7 +287,7 @@ class FileWriter:
 	@staticmethod
 	def close(lock, path, file, zoom_level):
 		'''
-        Placeholder method for closing and recalculating metadata.
+        Write the recorded tiles to the tile manifest, placeholder for recalculating metadata.
 
         Args:
             lock (multiprocessing.Lock): A lock for thread-safe operations.
@@ -139,6 +299,7 @@ class FileWriter:
             None
 
 		'''
+		FileWriter.flushManifest(path)
 		#TODO recalculate bounds and center
 		return
 	
@@ -190,7 +351,7 @@ class FileWriter:
 		target.close()
 	
 	@staticmethod
-	def write_sdf_file(sdf_template,model_name,  size_x, size_y, size_z,origin_height,path):
+	def write_sdf_file(sdf_template,model_name,  size_x, size_y, size_z,origin_height,path,aerial_image=None,collision_heightmap=None):
 		'''
         Write an SDF file with the provided template and model details.
 
@@ -202,6 +363,8 @@ class FileWriter:
             size_z (float): The size in the z-direction.
             origin_height (float): The origin height.
             path (str): The directory path to save the SDF file.
+            aerial_image (str, optional): File name of the aerial texture including the extension of its format. Defaults to "<model_name>_aerial.png".
+            collision_heightmap (str, optional): File name of the heightmap of the collision element. Defaults to the visual heightmap.
 
         Returns:
             None
@@ -209,7 +372,9 @@ class FileWriter:
 		'''
 		
 		heightmap = model_name+'_height_map.png'
-		aerialimg = model_name+'_aerial.png'
+		collision = collision_heightmap if collision_heightmap is not None else heightmap
+		mesh = model_name+'.obj'
+		aerialimg = aerial_image if aerial_image is not None else model_name+'_aerial.png'
     	# Filling in content
 		sdf_template = sdf_template.replace("$MODEL$", str(model_name))
 
@@ -219,7 +384,9 @@ class FileWriter:
 		sdf_template = sdf_template.replace("$SIZEZ$", str(size_z))
 		sdf_template = sdf_template.replace("$POSZ$",str(origin_height))
 		sdf_template = sdf_template.replace("$AERIALMAP$",str(aerialimg))
+		sdf_template = sdf_template.replace("$COLLISION_HEIGHTMAP$",str(collision))
 		sdf_template = sdf_template.replace("$HEIGHTMAP$",str(heightmap))
+		sdf_template = sdf_template.replace("$MESH$",str(mesh))
 
     	# Ensure results are a string
 		sdf_content = str(sdf_template)
@@ -232,7 +399,7 @@ class FileWriter:
 
 		
 	@staticmethod
-	def write_world_file(sdf_template,model_name,origin_lat,origin_long,path,origin_height):
+	def write_world_file(sdf_template,model_name,origin_lat,origin_long,path,origin_height,includes=None):
 		'''
 		Write a world file with the provided template and model details.
 
@@ -242,12 +409,26 @@ class FileWriter:
             origin_lat (float): The origin latitude.
             origin_long (float): The origin longitude.
             path (str): The directory path to save the world file.
+            includes (list, optional): (model_name, pose) of every model placed in the world, pose is
+                (x, y, z) in meters or None for the origin. Defaults to model_name at the origin.
 
         Returns:
             None
 
 		'''
+		if includes is None:
+			includes = [(model_name, None)]
+		include_blocks = []
+		for include_name, pose in includes:
+			block = "    <include>\n"
+			if pose is not None:
+				block += "      <name>" + include_name + "</name>\n"
+			block += "      <uri>model://" + include_name + "</uri>\n"
+			if pose is not None:
+				block += "      <pose>" + " ".join(str(value) for value in pose) + " 0 0 0</pose>\n"
+			include_blocks.append(block + "    </include>")
     	# Filling in content
+		sdf_template = sdf_template.replace("$INCLUDES$", "\n".join(include_blocks))
 		sdf_template = sdf_template.replace("$MODELNAME$", model_name)
 		sdf_template = sdf_template.replace("$ORIGIN_LAT$", str(origin_lat))
 		sdf_template = sdf_template.replace("$ORIGIN_LONG$", str(origin_long))
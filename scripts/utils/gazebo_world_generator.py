@@ -1,15 +1,26 @@
 # Import necessary libraries
-import os, cv2, shutil
+import os, cv2
+import copy
+import glob
 import json
 import numpy as np
+import threading
 from utils.file_writer import FileWriter
+from utils.mbtiles_writer import MbtilesWriter
+from utils.tile_downloader import tileDownloader
+from utils.utils import Utils
 from utils.param import globalParam
 from utils.maptile_utils import maptile_utiles
+from utils.dem_sampler import demSampler
+from utils.metrics import jobMetrics
+from utils.checkpoint import checkpointManifest
+from utils.executor import task_executor
+from utils.texture_encoder import textureEncoder
+from utils.terrain_mesh import terrainMesh
 
 from geopy.distance import geodesic
 from geopy.distance import distance
 from geopy.point import Point
-from multiprocessing import Pool, cpu_count
 
 
 
@@ -22,37 +33,127 @@ class orthoGenerator:
             data = json.load(f)
             self.boundaries = data["bounds"]
             self.zoomlevel = data["zoom_level"]
+            self.tile_format = data.get("format", "jpg")
+            self.tile_size = int(data.get("tilesize", 256))
+            self.mbtiles_path = os.path.join(self.metadata_path, data["mbtiles"]) if "mbtiles" in data else None
+            # Tile file template of the download, None for tiles downloaded before it was recorded
+            self.tile_template = data.get("tiles")
         self.model_name = os.path.basename(self.metadata_path)
-
-    def generate_height_image(self,height_data ,resolution : int) -> None:
+        self.texture_budget = globalParam.TEXTURE_BUDGET
+        self.texture_levels = []
+        # Tile range of a sub-model of a tiled world, None covers the whole map
+        self.tile_range = None
+        self.texture_encoder = textureEncoder(globalParam.TEXTURE_FORMAT, globalParam.TEXTURE_QUALITY,
+                                              globalParam.TEXTURE_PNG_COMPRESSION, globalParam.TEXTURE_PARALLEL_MIN_PIXELS)
+        if globalParam.TERRAIN_OUTPUT not in ("heightmap", "mesh"):
+            raise ValueError(f"Terrain output must be \"heightmap\" or \"mesh\", got {globalParam.TERRAIN_OUTPUT}")
+        self.terrain_output = globalParam.TERRAIN_OUTPUT
+        # Size of the collision heightmap, None when collision and visual share one heightmap
+        self.collision_resolution = None
+        self.metrics = jobMetrics()
+
+    def generate_height_image(self,height_data ,resolution : int, output_size : int = None, height_range : tuple = None,
+                              collision_size : int = None) -> None:
         """
         Generate the grey scale height image.
 
+        The image is 8 or 16 bit deep as set by globalParam.HEIGHTMAP_BIT_DEPTH. Elevations
+        are resized as floats and quantized once, black is the low and white the high end of
+        height_range, which is the range size_z and pose_z of the model are computed from.
+        With a collision_size a coarser collision heightmap is taken from every n-th sample of
+        the same grid, so both heightmaps share their vertices and edges.
+
         Args:
             height_data: Elevation data.
             resolution (int): Resolution of the heightmap.
+            output_size (int, optional): Size of the written image. Defaults to globalParam.HEIGHTMAP_OUTPUT_SIZE.
+            height_range (tuple, optional): (min, max) elevation mapped to black and white, shared by the
+                sub-models of a tiled world so their edges meet. Defaults to the range of height_data.
+            collision_size (int, optional): Size of the collision heightmap written as
+                <model>_collision_height_map.png, 2^n+1 and smaller than output_size. Defaults to None.
 
         Returns:
             None
 
-        Resize the image to 1025x1025 or size of height map image should be a square with dimensions of 2^n+1 i.e,(3,3)(5,5)(9,9)...(513,513)(1025,1025)
+        Resize the image to output_size or size of height map image should be a square with dimensions of 2^n+1 i.e,(3,3)(5,5)(9,9)...(513,513)(1025,1025)
         ref:https://github.com/AS4SR/general_info/wiki/Creating-Heightmaps-for-Gazebo
 
         """
 
+        # Points without DEM coverage are flattened to the lowest known elevation
+        height_data = np.asarray(height_data, dtype=np.float64)
+        height_data = np.where(np.isnan(height_data), np.nanmin(height_data), height_data)
+        low, high = height_range if height_range is not None else (np.min(height_data), np.max(height_data))
         # Normalize elevation data to generate terrain height map
-        normalized_array = ((height_data - np.min(height_data)) / (np.max(height_data) - np.min(height_data)) * 255).astype(np.uint8)
+        normalized_array = ((height_data - low) / ((high - low) or 1.0)).astype(np.float32)
         # Reshape the array to a 2D image
         image = normalized_array.reshape((resolution, resolution))
 
 
-        resized_image = cv2.resize(image, (1025, 1025), interpolation=cv2.INTER_LINEAR)
+        if output_size is None:
+            output_size = globalParam.HEIGHTMAP_OUTPUT_SIZE
+        if resolution != output_size:
+            resized_image = cv2.resize(image, (output_size, output_size), interpolation=cv2.INTER_LINEAR)
+        else:
+            resized_image = image
         blur = cv2.GaussianBlur(resized_image, (1, 1), 0)
 
-        flipped_img = cv2.flip(blur, 0)
-        model =os.path.basename(self.metadata_path)
-       # Save the height map image
-        cv2.imwrite(os.path.join(globalParam.GAZEBO_WORLD_PATH, model, 'textures', model+'_height_map.png'), flipped_img)
+        # Quantize to the full range of the heightmap bit depth
+        if globalParam.HEIGHTMAP_BIT_DEPTH == 16:
+            levels, dtype = 65535, np.uint16
+        elif globalParam.HEIGHTMAP_BIT_DEPTH == 8:
+            levels, dtype = 255, np.uint8
+        else:
+            raise ValueError(f"Heightmap bit depth must be 8 or 16, got {globalParam.HEIGHTMAP_BIT_DEPTH}")
+
+        model = self.model_name
+        images = [(model+'_height_map', blur)]
+        if collision_size is not None:
+            step = (output_size - 1) // (collision_size - 1)
+            images.append((model+'_collision_height_map', blur[::step, ::step]))
+        # Heightmaps stay lossless PNG whatever the aerial image format
+        heightmap_encoder = textureEncoder("png", png_compression=globalParam.TEXTURE_PNG_COMPRESSION,
+                                           parallel_min_pixels=globalParam.TEXTURE_PARALLEL_MIN_PIXELS)
+        for name, heights in images:
+            quantized = np.clip(np.round(heights * levels), 0, levels).astype(dtype)
+            flipped_img = cv2.flip(quantized, 0)
+           # Save the height map image
+            height_map_path = heightmap_encoder.write(os.path.join(globalParam.GAZEBO_WORLD_PATH, model, 'textures', name), flipped_img)
+            self.metrics.add("heightmap_encode", items=1, bytes=os.path.getsize(height_map_path))
+
+    def generate_terrain_mesh(self, height_data, resolution: int, size_x: float, size_y: float,
+                              height_range: tuple = None, fixed_edges: bool = False) -> None:
+        """
+        Generate the simplified terrain mesh in place of the height image.
+
+        The native 2^n+1 grid is simplified to globalParam.MESH_MAX_ERROR meters, so flat
+        areas become a few large triangles while slopes and ridges keep their detail, and is
+        written as meshes/<model>.obj with texture coordinates spanning the aerial image.
+
+        Args:
+            height_data: Elevation data, row by row from the south edge.
+            resolution (int): Resolution of the grid, 2^n+1.
+            size_x (float): Size of the model in x-direction in meters.
+            size_y (float): Size of the model in y-direction in meters.
+            height_range (tuple, optional): (min, max) elevation, the minimum is placed at z = 0 of the mesh.
+                Defaults to the range of height_data.
+            fixed_edges (bool, optional): Keep every grid point on the edges, so the meshes of the
+                sub-models of a tiled world meet without cracks. Defaults to False.
+
+        Returns:
+            None
+        """
+        height_data = np.asarray(height_data, dtype=np.float64).reshape((resolution, resolution))
+        height_data = np.where(np.isnan(height_data), np.nanmin(height_data), height_data)
+        low = height_range[0] if height_range is not None else np.min(height_data)
+        triangles = terrainMesh.simplify(height_data, globalParam.MESH_MAX_ERROR, fixed_edges)
+
+        model = self.model_name
+        mesh_dir = os.path.join(globalParam.GAZEBO_WORLD_PATH, model, 'meshes')
+        maptile_utiles.ensure_dir(mesh_dir)
+        mesh_path = os.path.join(mesh_dir, model + '.obj')
+        terrainMesh.write_obj(mesh_path, height_data, triangles, size_x, size_y, low, model + '.mtl')
+        self.metrics.add("mesh_encode", items=len(triangles), bytes=os.path.getsize(mesh_path))
 
     def get_origin_height(self)-> float:
         """
@@ -87,8 +188,16 @@ class orthoGenerator:
             None
         """
 
-        template = FileWriter.read_template(os.path.join(globalParam.TEMPLATE_DIR_PATH ,'sdf_temp.txt'))
-        FileWriter.write_sdf_file(template, self.model_name, size_x, size_y, size_z, pose_z, os.path.join(globalParam.GAZEBO_WORLD_PATH, self.model_name))
+        if self.terrain_output == "mesh":
+            # The material of the mesh references the selected aerial image
+            terrainMesh.write_mtl(os.path.join(globalParam.GAZEBO_WORLD_PATH, self.model_name, 'meshes', self.model_name + '.mtl'),
+                                  os.path.join(os.pardir, 'textures', self.select_texture()))
+            template = FileWriter.read_template(os.path.join(globalParam.TEMPLATE_DIR_PATH ,'sdf_mesh_temp.txt'))
+        else:
+            template = FileWriter.read_template(os.path.join(globalParam.TEMPLATE_DIR_PATH ,'sdf_temp.txt'))
+        collision_heightmap = self.model_name + '_collision_height_map.png' if self.collision_resolution is not None else None
+        FileWriter.write_sdf_file(template, self.model_name, size_x, size_y, size_z, pose_z, os.path.join(globalParam.GAZEBO_WORLD_PATH, self.model_name),
+                                  self.select_texture(), collision_heightmap)
 
     def gen_config(self) -> None:
         """
@@ -105,67 +214,275 @@ class orthoGenerator:
         template = FileWriter.read_template(os.path.join(globalParam.TEMPLATE_DIR_PATH ,'config_temp.txt'))
         FileWriter.write_config_file(template, self.model_name, os.path.join(globalParam.GAZEBO_WORLD_PATH, self.model_name))
 
+    def get_tile_range(self) -> tuple:
+        """
+        Get the inclusive range of map tiles that make up the aerial image.
+
+        Returns:
+            tuple: (min_x, max_x, min_y, max_y) tile numbers at the metadata zoom level.
+        """
+        if self.tile_range is not None:
+            return self.tile_range
+        bound_array = self.boundaries.split(',')
+        tile_boundaries = maptile_utiles.get_max_tilenumber(bound_array,self.zoomlevel)
+        min_x = min(tile_boundaries["southwest"][0], tile_boundaries["southeast"][0])
+        max_x = max(tile_boundaries["southwest"][0], tile_boundaries["southeast"][0])
+        min_y = min(tile_boundaries["northwest"][1], tile_boundaries["southwest"][1])
+        max_y = max(tile_boundaries["northwest"][1], tile_boundaries["southwest"][1])
+        return min_x, max_x, min_y, max_y
+
+    def get_model_boundaries(self) -> dict:
+        """
+        Get the true latitude/longitude boundaries of the model, i.e. of its map tiles.
+
+        Returns:
+            dict: "southwest", "southeast", "northwest" and "northeast" (lat, lon) corners.
+        """
+        if self.tile_range is None:
+            return maptile_utiles.get_true_boundaries(self.boundaries.split(','), self.zoomlevel)
+        min_x, max_x, min_y, max_y = self.tile_range
+        return maptile_utiles.tile_corners({"southwest": (min_x, max_y), "southeast": (max_x, max_y),
+                                            "northwest": (min_x, min_y), "northeast": (max_x, min_y)}, self.zoomlevel)
+
+    def get_tile_path(self, path: str, x: int, y: int) -> str:
+        """
+        Get the path of a downloaded map tile.
+
+        The path follows the output file template recorded in metadata.json. Without one
+        the tile is looked up as <zoom>/<x>/<y> with any image extension.
+
+        Args:
+            path (str): Path to the map tiles directory.
+            x (int): Tile number in X direction.
+            y (int): Tile number in Y direction.
+
+        Returns:
+            str: Path of the tile image.
+        """
+        if self.tile_template is not None:
+            tile_file = (self.tile_template.replace("{z}", str(self.zoomlevel)).replace("{x}", str(x))
+                         .replace("{y}", str(y)))
+            if "{quad}" in tile_file:
+                tile_file = tile_file.replace("{quad}", Utils.makeQuadKey(x, y, self.zoomlevel))
+            return os.path.join(path, tile_file)
+        tile_path = os.path.join(path, str(self.zoomlevel), str(x), str(y) + '.' + self.tile_format)
+        if not os.path.isfile(tile_path):
+            matches = glob.glob(os.path.join(glob.escape(os.path.dirname(tile_path)), str(y) + '.*'))
+            if matches:
+                return sorted(matches)[0]
+        return tile_path
+
+    def get_tile_sources(self, path: str):
+        """
+        Get the stored map tiles of the tile range.
+
+        Args:
+            path (str): Path to the map tiles directory.
+
+        Returns:
+            iterable: (x, y, source) with source the tile path for a tile directory or the
+                      encoded tile for an MBTiles store, which only yields stored tiles.
+        """
+        min_x, max_x, min_y, max_y = self.get_tile_range()
+        if self.mbtiles_path is not None:
+            return MbtilesWriter.readTiles(self.mbtiles_path, self.zoomlevel, min_x, max_x, min_y, max_y)
+        return ((x, y, self.get_tile_path(path, x, y)) for x in range(min_x, max_x + 1) for y in range(min_y, max_y + 1))
+
     @staticmethod
-    def are_dimensions_equal(img1, img2) -> bool:
+    def refetch_tile(task: tuple) -> tuple:
         """
-        Check if dimensions of two images are equal.
+        Download one missing map tile again, run on the I/O threads of the shared executor.
 
         Args:
-            img1: First image.
-            img2: Second image.
+            task (tuple): (lock, source, file_path, x, y, zoom, output_scale, writer).
 
         Returns:
-            bool: True if dimensions are equal, False otherwise.
-        """ 
-        return img1.shape[:2] == img2.shape[:2]
+            tuple: (x, y, stored) with stored True if the tile was written.
+        """
+        lock, source, file_path, x, y, zoom, output_scale, writer = task
+        try:
+            result = tileDownloader.download_tile(lock, source, file_path, x, y, zoom, output_scale, writer=writer)
+        except Exception as e:
+            print(f"[WARN] Tile refetch failed: {e}")
+            return x, y, False
+        return x, y, result["message"] != 'Download failed'
+
+    def refetch_missing_tiles(self, path: str) -> int:
+        """
+        Fetch the map tiles of the tile range that the download left missing.
 
+        The tile manifest written during the download tells which tiles are stored, only
+        the others are checked, and the missing ones are fetched again in parallel so a few
+        failed downloads leave no holes in the aerial image. Tiles without a manifest are
+        stitched as they are.
 
+        Args:
+            path (str): Path to the map tiles directory.
 
-    def get_x_image_dirlist(self, image_dir: str, tile_boundaries: dict) -> list:
+        Returns:
+            int: Number of tiles still missing.
+        """
+        manifest = FileWriter.readManifest(path)
+        if manifest is None:
+            return 0
+        writer = MbtilesWriter if self.mbtiles_path is not None else FileWriter
+        lock = threading.Lock()
+        with self.metrics.stage("tile_refetch") as count:
+            try:
+                candidates = FileWriter.missingTiles(manifest, self.get_tile_range())
+                tiles = [(x, y, self.mbtiles_path or self.get_tile_path(path, x, y)) for x, y in candidates]
+                stored = [writer.exists(file_path, x, y, self.zoomlevel) for x, y, file_path in tiles]
+                present = [(x, y) for (x, y, _), exists in zip(tiles, stored) if exists]
+                missing = [tile for tile, exists in zip(tiles, stored) if not exists]
+                if missing and manifest["source"] is None:
+                    print(f"[WARN] {len(missing)} map tiles missing and no tile source to fetch them from.")
+                elif missing:
+                    print(f"Fetching {len(missing)} missing map tiles again")
+                    tasks = ((lock, manifest["source"], file_path, x, y, self.zoomlevel, manifest["outputScale"], writer)
+                             for x, y, file_path in missing)
+                    results = list(task_executor.imap_unordered(orthoGenerator.refetch_tile, tasks, io=True))
+                    present += [(x, y) for x, y, stored in results if stored]
+                    missing = [(x, y, None) for x, y, stored in results if not stored]
+                    count(items=len(results) - len(missing), errors=len(missing))
+            finally:
+                # Writes the refetched MBTiles tiles and releases the connection exists() opened
+                writer.close(lock, path, self.mbtiles_path, self.zoomlevel)
+            FileWriter.updateManifest(path, present, [(x, y) for x, y, _ in missing])
+        return len(missing)
+
+    def tile_set_hash(self, path: str) -> str:
         """
-        Get a numerically sorted list of X-tile directories within tile boundary limits.
+        Hash the contents of the map tiles the aerial image is stitched from.
 
         Args:
-            image_dir (str): Path to the zoom level directory containing X-tile directories.
-            tile_boundaries (dict): Dictionary of tile coordinate bounds.
+            path (str): Path to the map tiles directory.
 
         Returns:
-            list: Sorted list of valid X-tile directory names (as strings).
+            str: Hex digest, missing tiles included.
         """
-        # List only directory names that are numeric (tile x)
-        dir_list = [d for d in os.listdir(image_dir) if d.isdigit()]
+        tiles = sorted(self.get_tile_sources(path), key=lambda tile: (tile[0], tile[1]))
+        return checkpointManifest.hash_contents(((x, y), source) for x, y, source in tiles)
 
-        min_x = min(tile_boundaries["southwest"][0], tile_boundaries["southeast"][0])
-        max_x = max(tile_boundaries["southwest"][0], tile_boundaries["southeast"][0])
+    def allocate_canvas(self, height: int, width: int) -> np.ndarray:
+        """
+        Allocate the array the aerial image is stitched into.
 
-        # Filter and sort X directories
-        x_dirs = sorted([d for d in dir_list if min_x <= int(d) <= max_x], key=lambda x: int(x))
+        Canvases above globalParam.ORTHO_MEMMAP_THRESHOLD bytes are backed by a
+        memory mapped file in the temp directory so areas larger than RAM can be stitched.
 
-        return x_dirs
-       
-    def process_column_image(self, dir_name, image_dir, tile_boundaries, temp_output_dir):
-        image_list = []
-        max_y = max(tile_boundaries["northwest"][1], tile_boundaries["southwest"][1])
-        min_y = min(tile_boundaries["northwest"][1], tile_boundaries["southwest"][1])
+        Args:
+            height (int): Height of the canvas in pixels.
+            width (int): Width of the canvas in pixels.
+
+        Returns:
+            np.ndarray: Zero filled BGR canvas.
+        """
+        shape = (height, width, 3)
+        threshold = globalParam.ORTHO_MEMMAP_THRESHOLD
+        if threshold is not None and height * width * 3 > threshold:
+            os.makedirs(globalParam.TEMP_PATH, exist_ok=True)
+            canvas_path = os.path.join(globalParam.TEMP_PATH, self.model_name + '_aerial.canvas')
+            print("Stitching aerial image in memory mapped file : ", canvas_path)
+            return np.memmap(canvas_path, dtype=np.uint8, mode='w+', shape=shape)
+        return np.zeros(shape, dtype=np.uint8)
+
+    @staticmethod
+    def release_canvas(canvas: np.ndarray) -> None:
+        """
+        Release a canvas and remove its backing file if it is memory mapped.
 
-        dir_path = os.path.join(image_dir, dir_name)
-        for image in os.listdir(dir_path):
-            tile_num = int(image.split('.')[0])
-            if min_y <= tile_num <= max_y:
-                image_list.append(os.path.join(dir_path, image))
+        Args:
+            canvas (np.ndarray): Canvas returned by allocate_canvas.
 
-        image_list.sort()
-        images = [cv2.imread(path) for path in image_list if os.path.exists(path)]
-        if images:
-            output_file = os.path.join(temp_output_dir, dir_name + '.png')
-            cv2.imwrite(output_file, cv2.vconcat(images))
+        Returns:
+            None
+        """
+        if isinstance(canvas, np.memmap) and os.path.isfile(canvas.filename):
+            # the mapping itself is released once the last reference is dropped
+            os.remove(canvas.filename)
+
+    def get_texture_reduction(self) -> int:
+        """
+        Get the factor the map tiles are shrunk by so the aerial image fits globalParam.MAX_TEXTURE_SIZE.
+
+        Returns:
+            int: Smallest power of two reduction that fits, at most the tile size.
+        """
+        max_size = globalParam.MAX_TEXTURE_SIZE
+        if max_size is None:
+            return 1
+        min_x, max_x, min_y, max_y = self.get_tile_range()
+        tiles = max(max_x - min_x + 1, max_y - min_y + 1)
+        reduction = 1
+        while tiles * (self.tile_size // reduction) > max_size and reduction < self.tile_size:
+            reduction *= 2
+        return reduction
 
     @staticmethod
-    def _run_instance_method(args):
-        instance, dir_name, image_dir, tile_boundaries, temp_output_dir = args
-        instance.process_column_image(dir_name, image_dir, tile_boundaries, temp_output_dir)
+    def decode_tile(task: tuple) -> tuple:
+        """
+        Decode one map tile, run in the workers of the shared executor.
 
-        
+        Reductions of 2, 4 and 8 are done by the decoder itself, which for JPEG
+        tiles skips most of the work, larger ones finish with a resize.
+
+        Args:
+            task (tuple): (x, y, source, tile_size, reduction) with source a tile path or an encoded tile.
+
+        Returns:
+            tuple: (x, y, image) with the BGR tile resized to tile_size // reduction, image is None if it could not be read.
+        """
+        x, y, source, tile_size, reduction = task
+        flags = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4}.get(reduction, cv2.IMREAD_REDUCED_COLOR_8)
+        if isinstance(source, bytes):
+            img = cv2.imdecode(np.frombuffer(source, dtype=np.uint8), flags)
+        else:
+            img = cv2.imread(source, flags)
+        size = max(1, tile_size // reduction)
+        if img is not None and img.shape[:2] != (size, size):
+            img = cv2.resize(img, (size, size), interpolation=cv2.INTER_AREA)
+        return x, y, img
+
+    def stitch_ortho(self, path: str) -> np.ndarray:
+        """
+        Stitch the map tiles into one preallocated aerial image.
+
+        Every tile is decoded straight into its pixel offset computed from the
+        tile range. Tiles are read from the tile directories or, for an MBTiles
+        store, with one range query. Missing tiles are reported and left black.
+        When the image would exceed globalParam.MAX_TEXTURE_SIZE the tiles are
+        decoded at a reduced size, so the full resolution image is never built.
+
+        Args:
+            path (str): Path to the map tiles directory.
+
+        Returns:
+            np.ndarray: Stitched BGR aerial image.
+        """
+        min_x, max_x, min_y, max_y = self.get_tile_range()
+        reduction = self.get_texture_reduction()
+        tile_size = max(1, self.tile_size // reduction)
+        if reduction > 1:
+            print(f"Decoding map tiles at 1/{reduction} size to fit the texture size of {globalParam.MAX_TEXTURE_SIZE} px")
+        canvas = self.allocate_canvas((max_y - min_y + 1) * tile_size, (max_x - min_x + 1) * tile_size)
+
+        # Workers decode the tiles, only the tile descriptors and decoded pixels cross the pool
+        tasks = ((x, y, source, self.tile_size, reduction) for x, y, source in self.get_tile_sources(path))
+        placed = 0
+        for x, y, img in task_executor.imap_unordered(orthoGenerator.decode_tile, tasks):
+            if img is None:
+                continue
+            row = (y - min_y) * tile_size
+            col = (x - min_x) * tile_size
+            canvas[row:row + tile_size, col:col + tile_size] = img
+            placed += 1
+
+        expected = (max_x - min_x + 1) * (max_y - min_y + 1)
+        self.metrics.add("ortho_stitch", items=placed, errors=expected - placed)
+        if placed < expected:
+            print(f"[WARN] {expected - placed} of {expected} tiles missing in aerial image.")
+
+        return canvas
 
     def generate_ortho(self,path: str)-> None:
         """
@@ -177,42 +494,62 @@ class orthoGenerator:
         Returns:
             None
         """
- 
-        image_dir = os.path.join(path, str(self.zoomlevel))
-        
-        # Check and create necessary directories
-        maptile_utiles.dir_check(os.path.join(globalParam.GAZEBO_WORLD_PATH, self.model_name, 'textures'))
-        maptile_utiles.dir_check(os.path.join(globalParam.TEMPORARY_SATELLITE_IMAGE, self.model_name))
-        bound_array = self.boundaries.split(',')
-        tile_boundaries = maptile_utiles.get_max_tilenumber(bound_array,self.zoomlevel)
-        image_dir_list = self.get_x_image_dirlist(image_dir,tile_boundaries)
 
+        # Create the textures directory, keeping the outputs of checkpointed stages
+        maptile_utiles.ensure_dir(os.path.join(globalParam.GAZEBO_WORLD_PATH, self.model_name, 'textures'))
+        with self.metrics.stage("ortho_stitch"):
+            stitched_image = self.stitch_ortho(path)
 
-        temp_output_dir = os.path.join(globalParam.TEMPORARY_SATELLITE_IMAGE, self.model_name)
-        args_list = [
-            (self, dir_name, image_dir, tile_boundaries, temp_output_dir)
-            for dir_name in image_dir_list
-        ]
-        #  Multiprocessing call
-        with Pool(processes=cpu_count()) as pool:
-            pool.map(orthoGenerator._run_instance_method, args_list)
+        # Save the stitched image in the configured texture format
+        with self.metrics.stage("ortho_encode") as count:
+            aerial_path = self.texture_encoder.write(os.path.join(globalParam.GAZEBO_WORLD_PATH, self.model_name, 'textures', self.model_name+'_aerial'), stitched_image)
+            count(items=1, bytes=os.path.getsize(aerial_path))
+            self.texture_levels = [(os.path.basename(aerial_path), max(stitched_image.shape[:2]))]
+            self.generate_texture_pyramid(stitched_image)
+        orthoGenerator.release_canvas(stitched_image)
 
-        image_list = sorted([
-            os.path.join(temp_output_dir, img)
-            for img in os.listdir(temp_output_dir) if img.endswith('.png')
-        ])            
-        images = [cv2.imread(path) for path in image_list]
-        filtered_images = [images[0]]
+    def generate_texture_pyramid(self, image: np.ndarray) -> None:
+        """
+        Write successively halved copies of the aerial image.
 
-        for img in images[1:]:
-            if orthoGenerator.are_dimensions_equal(filtered_images[-1], img):
-                filtered_images.append(img)
-        stitched_image = cv2.hconcat(filtered_images)
+        Level n is saved as <model>_aerial_<2^n> in the texture format and halving stops before the longest
+        side drops below globalParam.TEXTURE_PYRAMID_MIN_SIZE.
 
-        # Save the stitched image
-        compression_params = [cv2.IMWRITE_PNG_COMPRESSION, 9]
-        print(os.path.join(globalParam.GAZEBO_WORLD_PATH, self.model_name, 'textures', self.model_name+'_aerial.png'))
-        cv2.imwrite(os.path.join(globalParam.GAZEBO_WORLD_PATH, self.model_name, 'textures', self.model_name+'_aerial.png'), stitched_image, compression_params)
+        Args:
+            image (np.ndarray): Stitched aerial image.
+
+        Returns:
+            None
+        """
+        if globalParam.TEXTURE_PYRAMID_MIN_SIZE is None:
+            return
+        factor = 1
+        level = image
+        while max(level.shape[:2]) // 2 >= globalParam.TEXTURE_PYRAMID_MIN_SIZE:
+            # 2x2 box average of the previous level
+            level = cv2.resize(level, (level.shape[1] // 2, level.shape[0] // 2), interpolation=cv2.INTER_AREA)
+            factor *= 2
+            level_path = self.texture_encoder.write(os.path.join(globalParam.GAZEBO_WORLD_PATH, self.model_name, 'textures', self.model_name + '_aerial_' + str(factor)), level)
+            level_name = os.path.basename(level_path)
+            self.metrics.add("ortho_encode", items=1, bytes=os.path.getsize(level_path))
+            self.texture_levels.append((level_name, max(level.shape[:2])))
+
+    def select_texture(self) -> str:
+        """
+        Pick the largest aerial image level that fits the texture budget.
+
+        Returns:
+            str: File name of the selected aerial image. The stitched image when no
+                 budget is set and the smallest level when none fits.
+        """
+        if not self.texture_levels:
+            return self.model_name + '_aerial' + self.texture_encoder.extension
+        if self.texture_budget is None:
+            return self.texture_levels[0][0]
+        for level_name, level_size in self.texture_levels:
+            if level_size <= self.texture_budget:
+                return level_name
+        return self.texture_levels[-1][0]
 
 
     def get_true_origin(self):
@@ -226,83 +563,263 @@ class orthoGenerator:
   
 
 class heightmapgenerator(orthoGenerator):
-    def __init__(self,path : str):
+    def __init__(self,path : str, heightmap_resolution : int = None, grid : tuple = None):
+        """
+        Args:
+            path (str): Path to the map tiles directory holding metadata.json.
+            heightmap_resolution (int, optional): Sample the DEM natively on a 2^n+1 grid of this size.
+                Defaults to None, which samples globalParam.HEIGHTMAP_RESOLUTION points per side and
+                resizes the result to globalParam.HEIGHTMAP_OUTPUT_SIZE.
+            grid (tuple, optional): (columns, rows) of sub-models the world is split into.
+                Defaults to globalParam.WORLD_GRID.
+        """
         super().__init__(path)
+        if heightmap_resolution is not None and not heightmapgenerator.is_valid_resolution(heightmap_resolution):
+            raise ValueError(f"Heightmap resolution must be 2^n+1 and at most {globalParam.HEIGHTMAP_MAX_RESOLUTION}, got {heightmap_resolution}")
+        self.grid = heightmapgenerator.get_grid(grid)
+        if (self.grid is not None or self.terrain_output == "mesh") and heightmap_resolution is None:
+            # every sub-model and every mesh is sampled natively
+            heightmap_resolution = globalParam.HEIGHTMAP_OUTPUT_SIZE
+        self.native_heightmap = heightmap_resolution is not None
+        self.heightmap_resolution = heightmap_resolution if self.native_heightmap else globalParam.HEIGHTMAP_RESOLUTION
+        collision_resolution = globalParam.HEIGHTMAP_COLLISION_RESOLUTION
+        if collision_resolution is not None and not heightmapgenerator.is_valid_resolution(collision_resolution):
+            raise ValueError(f"Collision heightmap resolution must be 2^n+1 and at most {globalParam.HEIGHTMAP_MAX_RESOLUTION}, got {collision_resolution}")
+        output_size = self.heightmap_resolution if self.native_heightmap else globalParam.HEIGHTMAP_OUTPUT_SIZE
+        if self.terrain_output == "heightmap" and collision_resolution is not None and collision_resolution < output_size:
+            self.collision_resolution = collision_resolution
+        self.dem_zoom = heightmapgenerator.select_dem_zoom(self.boundaries.split(','), self.zoomlevel, heightmap_resolution, self.grid)
+
+    @staticmethod
+    def get_grid(grid: tuple = None) -> tuple:
+        """
+        Get the sub-model grid of a world.
+
+        Args:
+            grid (tuple, optional): (columns, rows), defaults to globalParam.WORLD_GRID.
+
+        Returns:
+            tuple: (columns, rows), None for a world of one model.
+        """
+        if grid is None:
+            grid = globalParam.WORLD_GRID
+        if grid is None:
+            return None
+        columns, rows = int(grid[0]), int(grid[1])
+        if columns < 1 or rows < 1:
+            raise ValueError(f"World grid must be at least 1x1, got {columns}x{rows}")
+        return None if (columns, rows) == (1, 1) else (columns, rows)
+
+    @staticmethod
+    def select_dem_zoom(bound_array: list, zoom: int, heightmap_resolution: int = None, grid: tuple = None) -> int:
+        """
+        Pick the DEM zoom level sampled for a map, the only zoom that has to be downloaded.
+
+        Args:
+            bound_array (list): Map bounds as [west, south, east, north].
+            zoom (int): Zoom level of the map tiles.
+            heightmap_resolution (int, optional): Native heightmap resolution, None for the legacy grid.
+            grid (tuple, optional): Sub-model grid, defaults to globalParam.WORLD_GRID.
+
+        Returns:
+            int: DEM zoom level.
+        """
+        boundaries = maptile_utiles.get_true_boundaries(bound_array, zoom)
+        grid = heightmapgenerator.get_grid(grid)
+        if heightmap_resolution is None and (grid is not None or globalParam.TERRAIN_OUTPUT == "mesh"):
+            heightmap_resolution = globalParam.HEIGHTMAP_OUTPUT_SIZE
+        if grid is not None:
+            # the sub-model heightmaps together sample the map this densely
+            samples = (heightmap_resolution - 1) * max(grid) + 1
+        else:
+            samples = heightmap_resolution if heightmap_resolution is not None else globalParam.HEIGHTMAP_RESOLUTION
+        return maptile_utiles.get_dem_zoom(boundaries, samples)
+
+    def split_grid(self) -> list:
+        """
+        Split the map tiles into the sub-model grid.
+
+        Returns:
+            list: (column, row, tile_range) of every sub-model, columns run west to east and rows north to south.
+                  The grid is reduced to the number of map tiles when it is finer.
+        """
+        min_x, max_x, min_y, max_y = self.get_tile_range()
+        columns = np.array_split(np.arange(min_x, max_x + 1), min(self.grid[0], max_x - min_x + 1))
+        rows = np.array_split(np.arange(min_y, max_y + 1), min(self.grid[1], max_y - min_y + 1))
+        return [(i, j, (int(xs[0]), int(xs[-1]), int(ys[0]), int(ys[-1])))
+                for j, ys in enumerate(rows) for i, xs in enumerate(columns)]
+
+    def submodel(self, column: int, row: int, tile_range: tuple) -> "heightmapgenerator":
+        """
+        Get the generator of one sub-model of a tiled world, named <model>_<column>_<row>.
+
+        Args:
+            column (int): Column of the sub-model.
+            row (int): Row of the sub-model.
+            tile_range (tuple): (min_x, max_x, min_y, max_y) map tiles of the sub-model.
+
+        Returns:
+            heightmapgenerator: Generator covering the tile range, with its own metrics.
+        """
+        sub = copy.copy(self)
+        sub.tile_range = tile_range
+        sub.model_name = f"{self.model_name}_{column}_{row}"
+        sub.texture_levels = []
+        sub.metrics = jobMetrics()
+        return sub
+
+    @staticmethod
+    def is_valid_resolution(resolution: int) -> bool:
+        """
+        Check if a heightmap resolution is a square size Gazebo accepts, i.e. 2^n+1.
+
+        Args:
+            resolution (int): Number of samples per side.
+
+        Returns:
+            bool: True if resolution is 2^n+1 and within globalParam.HEIGHTMAP_MAX_RESOLUTION.
+        """
+        size = resolution - 1
+        return 2 <= size and (size & (size - 1)) == 0 and resolution <= globalParam.HEIGHTMAP_MAX_RESOLUTION
 
 
+    def dem_set_hash(self) -> str:
+        """
+        Hash the contents of the DEM tiles the heightmap and origin height are sampled from.
+
+        Returns:
+            str: Hex digest over the DEM tiles covering the map plus a one tile margin.
+        """
+        boundaries = self.get_model_boundaries()
+        zoom = self.dem_zoom
+        (north, west), (south, east) = boundaries["northwest"], boundaries["southeast"]
+        min_x, max_x, min_y, max_y = maptile_utiles.get_tile_range((west, south, east, north), zoom)
+        tiles = ((x, y) for x in range(min_x - 1, max_x + 2) for y in range(min_y - 1, max_y + 2))
+        return checkpointManifest.hash_contents(
+            ((zoom, x, y), os.path.join(globalParam.DEM_PATH, str(zoom), str(x), str(y) + '.png')) for x, y in tiles)
+
     def get_amsl(self, lat: float, lon: float):
         """
         Get the height above mean sea level (AMSL) for a given latitude and longitude.
         Args:
             lat (float): Latitude in degrees.
-            lox,y n (float): Longitude in degrees.
-        Returns:
-            float: Height above mean sea level in meters.
-        """
-        tile_x,tile_y = maptile_utiles.lat_lon_to_tile(lat, lon,globalParam.DEM_RESOLUTION)
-        boundaries = maptile_utiles.get_tile_bounds(tile_x, tile_y, globalParam.DEM_RESOLUTION)
-        # check if tile exist
-        lat_max = boundaries["northeast"][0]
-        lat_min = boundaries["southwest"][0]
-        lon_max = boundaries["northeast"][1]
-        lon_min = boundaries["southwest"][1]
-        dem_tile_path = os.path.join(globalParam.DEM_PATH, str(globalParam.DEM_RESOLUTION), str(tile_x), str(tile_y)+'.png')
-        if os.path.isfile(dem_tile_path) == True:
-            # read the image from the tile its a gbr image format
-            dem_img = cv2.imread(dem_tile_path)
-            #get the size of the image
-            height,width = dem_img.shape[:2]
-            # from boundaries and the desiderd lat long get the pixel coordinates
-            px = int((lon - lon_min) / (lon_max - lon_min) * width)
-            py = int((lat_max - lat) / (lat_max - lat_min) * height)
-            # from pixel read the image and get the height
-            b,g,r = dem_img[py,px]  
-            b,g,r = float(b), float(g), float(r)
-            # convert the pixel value to height 
-            # reference : https://docs.mapbox.com/data/tilesets/reference/mapbox-terrain-dem-v1/
-            height = ((r * 256 * 256 + g * 256 + b) * 0.1) - 10000
-            return height
-
-        else :
-            # raise an error and kill the program
-
-            print("Tile not found")
+            lon (float): Longitude in degrees.
+        Returns:
+            float: Height above mean sea level in meters, None if the DEM tile is not available.
+        """
+        height = demSampler.sample([lat], [lon], self.dem_zoom)[0]
+        if np.isnan(height):
             return None
+        return float(height)
         
-    def get_heightmap(self,sw_lat:float,sw_lon:float,size_x:int,size_y:int) -> list:
+    def get_heightmap(self,sw_lat:float,sw_lon:float,size_x:int,size_y:int) -> np.ndarray:
         """
         Generate a list of latitude and longitude coordinates for a grid based on a 
         southwest corner point and specified dimensions.
-        Retrieve elevation data for a list of latitude and longitude coordinates 
-        from a Digital Elevation Model (DEM).
+        Retrieve elevation data for all the coordinates from a Digital Elevation Model (DEM)
+        in a single batched lookup.
         Args:
             sw_lat (float): The latitude of the southwest corner of the grid.
             sw_lon (float): The longitude of the southwest corner of the grid.
             size_x (int): The width of the grid in meters.
             size_y (int): The height of the grid in meters.
         Returns:
-            list: A list of elevation values.
+            np.ndarray: Elevation values, row by row from the south edge.
         """
         equispace_x = size_x/globalParam.HEIGHTMAP_RESOLUTION
         equispace_y = size_y/globalParam.HEIGHTMAP_RESOLUTION
         start_point = Point(sw_lat,sw_lon)
-        height_array = []
+        latitudes = []
+        longitudes = []
         for y in range(0,globalParam.HEIGHTMAP_RESOLUTION):
             current_latitude = distance(meters=equispace_y*y).destination(point=start_point, bearing=0)
             for x in range(0,globalParam.HEIGHTMAP_RESOLUTION):
                 new_point = distance(meters=equispace_x*x).destination(point=current_latitude, bearing=90)
-                '''
-                Write a piece of code to get read the height from dem
-                
-                '''                
-                # get the logic to get the height from dem
-
-            
-                height_array.append(self.get_amsl(new_point.latitude, new_point.longitude))
-        
-        
-        return height_array
+                latitudes.append(new_point.latitude)
+                longitudes.append(new_point.longitude)
+
+        return demSampler.sample(latitudes, longitudes, self.dem_zoom)
+
+    def get_native_heightmap(self, boundaries: dict) -> np.ndarray:
+        """
+        Sample the DEM directly on the final 2^n+1 heightmap grid with bilinear interpolation.
+
+        The grid is laid out evenly in Web Mercator between the true boundaries, which
+        keeps every sample aligned with the aerial image stitched from the map tiles.
+
+        Args:
+            boundaries (dict): True latitude/longitude boundaries of the map.
+
+        Returns:
+            np.ndarray: Elevation values, row by row from the south edge.
+        """
+        nw_x, nw_y = maptile_utiles.lat_lon_to_fractional_tile(*boundaries["northwest"], self.dem_zoom)
+        se_x, se_y = maptile_utiles.lat_lon_to_fractional_tile(*boundaries["southeast"], self.dem_zoom)
+        tile_xs = np.linspace(nw_x, se_x, self.heightmap_resolution)
+        tile_ys = np.linspace(se_y, nw_y, self.heightmap_resolution)
+        return demSampler.sample_grid(tile_xs, tile_ys, self.dem_zoom)
+
+
+    def sample_terrain(self, boundaries: dict, size_x: int, size_y: int) -> np.ndarray:
+        """
+        Sample the elevations of the heightmap.
+
+        Args:
+            boundaries (dict): True latitude/longitude boundaries of the model.
+            size_x (int): Width of the model in meters.
+            size_y (int): Height of the model in meters.
+
+        Returns:
+            np.ndarray: Elevation values, row by row from the south edge, NaN without DEM coverage.
+        """
+        sw = boundaries["southwest"]
+        with self.metrics.stage("heightmap_sample") as count:
+            if self.native_heightmap:
+                heightmap_array = self.get_native_heightmap(boundaries)
+            else:
+                heightmap_array = self.get_heightmap(sw[0],sw[1],size_x,size_y)
+            # samples without DEM coverage count as errors
+            count(items=int(np.size(heightmap_array)), errors=int(np.isnan(heightmap_array).sum()))
+        return heightmap_array
+
+    def encode_terrain(self, heightmap_array: np.ndarray, height_range: tuple, size_x: int, size_y: int, fixed_edges: bool = False) -> None:
+        """
+        Write the heightmap image or the terrain mesh, as set by globalParam.TERRAIN_OUTPUT.
+
+        Args:
+            heightmap_array (np.ndarray): Elevation values returned by sample_terrain.
+            height_range (tuple): (min, max) elevation the model size and pose are computed from.
+            size_x (int): Width of the model in meters.
+            size_y (int): Height of the model in meters.
+            fixed_edges (bool, optional): Keep the full resolution on the mesh edges. Defaults to False.
+
+        Returns:
+            None
+        """
+        if self.terrain_output == "mesh":
+            with self.metrics.stage("mesh_encode"):
+                self.generate_terrain_mesh(heightmap_array, self.heightmap_resolution, size_x, size_y, height_range, fixed_edges)
+            return
+        with self.metrics.stage("heightmap_encode"):
+            if self.native_heightmap:
+                self.generate_height_image(heightmap_array,self.heightmap_resolution,self.heightmap_resolution,height_range,self.collision_resolution)
+            else:
+                self.generate_height_image(heightmap_array,self.heightmap_resolution,height_range=height_range,collision_size=self.collision_resolution)
+
+    def terrain_files(self) -> tuple:
+        """
+        Get the terrain files of the model.
 
+        Returns:
+            tuple: Lists of the terrain files written by encode_terrain and the files written with
+                   model.sdf, relative to the model directory.
+        """
+        if self.terrain_output == "mesh":
+            return [os.path.join('meshes', self.model_name + '.obj')], [os.path.join('meshes', self.model_name + '.mtl')]
+        files = [os.path.join('textures', self.model_name + '_height_map.png')]
+        if self.collision_resolution is not None:
+            files.append(os.path.join('textures', self.model_name + '_collision_height_map.png'))
+        return files, []
 
     def gen_terrain(self)-> list: 
         """
@@ -316,8 +833,7 @@ class heightmapgenerator(orthoGenerator):
         """
 
         #get the true boundaries as there is a padding non uniform padding added 
-        bound_array = self.boundaries.split(',')
-        boundaries = maptile_utiles.get_true_boundaries(bound_array,self.zoomlevel)
+        boundaries = self.get_model_boundaries()
         sw = boundaries["southwest"]
         se = boundaries["southeast"]
         ne = boundaries["northeast"]
@@ -328,21 +844,21 @@ class heightmapgenerator(orthoGenerator):
 
         print("size of the terrian map",sizex,sizey)
         print("Using offline DEM data for heightmap generation")
-        heightmap_array = self.get_heightmap(sw[0],sw[1],sizex,sizey)
-
-        self.generate_height_image(heightmap_array,globalParam.HEIGHTMAP_RESOLUTION)
+        heightmap_array = self.sample_terrain(boundaries, sizex, sizey)
+        # The heightmap image is normalized to the range posez and sizez are computed from
+        height_range = (np.nanmin(heightmap_array), np.nanmax(heightmap_array))
+        self.encode_terrain(heightmap_array, height_range, sizex, sizey)
         origin_height = self.get_origin_height()
         print(origin_height)
         # Calculate posez, sizez
-        posez = int(-1*(origin_height - np.min(heightmap_array)+5))
-        sizez = np.max(heightmap_array) - np.min(heightmap_array)
+        posez = int(-1*(origin_height - height_range[0]+5))
+        sizez = height_range[1] - height_range[0]
 
         return sizex,sizey,sizez,posez
         
 
     def get_true_origin(self)-> list:
-        bound_array = self.boundaries.split(',')
-        boundaries = maptile_utiles.get_true_boundaries(bound_array,self.zoomlevel)
+        boundaries = self.get_model_boundaries()
 
         sw = boundaries["southwest"]
         se = boundaries["southeast"]
@@ -357,11 +873,12 @@ class heightmapgenerator(orthoGenerator):
 
 
 
-    def gen_world(self) -> None:
+    def gen_world(self, includes: list = None) -> None:
         """
         Generate the gazebo world file.
 
         Args:
+            includes (list, optional): (model_name, pose) of the sub-models of a tiled world. Defaults to this model.
 
         Returns:
             None
@@ -369,30 +886,230 @@ class heightmapgenerator(orthoGenerator):
 
         template = FileWriter.read_template(os.path.join(globalParam.TEMPLATE_DIR_PATH ,'gazebo_world.txt'))
         origin_cord = self.get_true_origin()
-        centre_height = self.get_amsl(origin_cord["latitude"],origin_cord["longitude"])
-        FileWriter.write_world_file(template, self.model_name,origin_cord["latitude"],origin_cord["longitude"],os.path.join(globalParam.GAZEBO_WORLD_PATH, self.model_name),centre_height)
-
-
-def generate_gazebo_world(tile_path):    
+        FileWriter.write_world_file(template, self.model_name,origin_cord["latitude"],origin_cord["longitude"],os.path.join(globalParam.GAZEBO_WORLD_PATH, self.model_name),origin_cord["altitude"],includes)
+
+
+def generate_submodel(task: dict) -> dict:
+    """
+    Generate the textures, heightmap or mesh, model.config and model.sdf of one sub-model of a tiled world.
+
+    Runs in the workers of the shared executor, so the task only carries what is needed to
+    rebuild the sub-model generator.
+
+    Args:
+        task (dict): tile_path, heightmap_resolution, grid, column, row, tile_range, size (x, y, z in meters),
+                     pose_z, height_range and texture_budget.
+
+    Returns:
+        dict: Model name, texture levels, the stage metrics and the terrain files of the sub-model.
+    """
+    world_generator = heightmapgenerator(task["tile_path"], task["heightmap_resolution"], task["grid"])
+    generator = world_generator.submodel(task["column"], task["row"], task["tile_range"])
+    generator.texture_budget = task["texture_budget"]
+    generator.generate_ortho(task["tile_path"])
+
+    size_x, size_y, size_z = task["size"]
+    heightmap_array = generator.sample_terrain(generator.get_model_boundaries(), size_x, size_y)
+    generator.encode_terrain(heightmap_array, task["height_range"], size_x, size_y, fixed_edges=True)
+    with generator.metrics.stage("world_files") as count:
+        generator.gen_config()
+        generator.gen_sdf(size_x, size_y, size_z, task["pose_z"])
+        count(items=2)
+    terrain_files, sdf_files = generator.terrain_files()
+    return {"name": generator.model_name, "texture_levels": generator.texture_levels, "metrics": generator.metrics.as_dict(),
+            "terrain_files": terrain_files + sdf_files}
+
+
+def generate_tiled_world(world_generator, directory_path, checkpoint, dem_key, progress, metrics):
+    """
+    Generate a world split into the sub-model grid of world_generator.
+
+    Every sub-model covers a block of whole map tiles and is a model of its own named
+    <model>_<column>_<row> next to the model directory, which holds the world file
+    including them all at their offsets from the world origin. The heightmaps share one
+    elevation range so the sub-models meet at their edges, and the sub-models are
+    generated in parallel on the shared executor.
+
+    Args:
+        world_generator (heightmapgenerator): Generator of the whole map with a grid.
+        directory_path (str): Path to the map tiles directory.
+        checkpoint (checkpointManifest): Checkpoint of the world model.
+        dem_key (str): Key of the DEM tiles.
+        progress (callable): Reports (stage, fraction).
+        metrics (jobMetrics): Metrics of the job.
+
+    Returns:
+        None
+    """
+    boundaries = world_generator.get_model_boundaries()
+    sizex = int(geodesic(boundaries["southwest"], boundaries["southeast"]).m)
+    sizey = int(geodesic(boundaries["southeast"], boundaries["northeast"]).m)
+    min_x, max_x, min_y, max_y = world_generator.get_tile_range()
+    columns, rows = max_x - min_x + 1, max_y - min_y + 1
+    submodels = [(i, j, world_generator.submodel(i, j, tile_range)) for i, j, tile_range in world_generator.split_grid()]
+    print("Splitting the world into", len(submodels), "sub-models")
+
+    # One elevation range for all heightmaps, sampled on the grids of the sub-models
+    with metrics.stage("heightmap_range") as count:
+        low, high = np.inf, -np.inf
+        for _, _, sub in submodels:
+            heights = sub.get_native_heightmap(sub.get_model_boundaries())
+            if not np.all(np.isnan(heights)):
+                low, high = min(low, np.nanmin(heights)), max(high, np.nanmax(heights))
+            count(items=int(np.size(heights)))
+    if not np.isfinite(low):
+        raise ValueError("No DEM coverage for the map")
+    origin_height = world_generator.get_origin_height()
+    posez = int(-1*(origin_height - low + 5))
+    sizez = float(high - low)
+
+    templates = [FileWriter.read_template(os.path.join(globalParam.TEMPLATE_DIR_PATH, name))
+                 for name in ('config_temp.txt', 'sdf_temp.txt', 'sdf_mesh_temp.txt')]
+    tasks, keys, includes = {}, {}, []
+    with metrics.stage("checkpoint_hash"):
+        for column, row, sub in submodels:
+            sub_min_x, sub_max_x, sub_min_y, sub_max_y = sub.tile_range
+            size = (sizex * (sub_max_x - sub_min_x + 1) / columns, sizey * (sub_max_y - sub_min_y + 1) / rows, sizez)
+            # offset of the sub-model centre from the world origin, y points north while tile rows run south
+            offset = (round(sizex * ((sub_min_x + sub_max_x) - (min_x + max_x)) / 2 / columns, 3),
+                      round(-sizey * ((sub_min_y + sub_max_y) - (min_y + max_y)) / 2 / rows, 3), 0)
+            includes.append((sub.model_name, offset))
+            task = {"tile_path": directory_path, "heightmap_resolution": world_generator.heightmap_resolution,
+                    "grid": world_generator.grid, "column": column, "row": row, "tile_range": sub.tile_range,
+                    "size": size, "pose_z": posez, "height_range": (float(low), float(high)),
+                    "texture_budget": world_generator.texture_budget}
+            keys[sub.model_name] = checkpoint.digest("submodel", checkpoint.digest("tiles", sub.tile_set_hash(directory_path)), dem_key,
+                                                     {key: value for key, value in task.items() if key != "tile_path"},
+                                                     world_generator.boundaries, world_generator.zoomlevel, world_generator.dem_zoom,
+                                                     world_generator.tile_size, globalParam.TEXTURE_PYRAMID_MIN_SIZE, globalParam.MAX_TEXTURE_SIZE,
+                                                     world_generator.texture_encoder.settings(), globalParam.HEIGHTMAP_BIT_DEPTH,
+                                                     world_generator.terrain_output, globalParam.MESH_MAX_ERROR,
+                                                     world_generator.collision_resolution, templates)
+            if checkpoint.is_fresh(sub.model_name, keys[sub.model_name]):
+                print(sub.model_name, "is up to date, skipping")
+            else:
+                checkpoint.invalidate(sub.model_name)
+                tasks[sub.model_name] = task
+
+    progress("submodels", 0.3)
+    for done, result in enumerate(task_executor.imap_unordered(generate_submodel, tasks.values()), 1):
+        metrics.merge(result["metrics"])
+        outputs = [os.path.join(os.pardir, result["name"], name) for name in ('model.config', 'model.sdf')]
+        outputs += [os.path.join(os.pardir, result["name"], 'textures', level) for level, _ in result["texture_levels"]]
+        outputs += [os.path.join(os.pardir, result["name"], name) for name in result["terrain_files"]]
+        checkpoint.record(result["name"], keys[result["name"]], outputs)
+        print(result["name"], "generated successfully")
+        progress("submodels", 0.3 + 0.6 * done / len(tasks))
+
+    progress("world", 0.9)
+    world_template = FileWriter.read_template(os.path.join(globalParam.TEMPLATE_DIR_PATH, 'gazebo_world.txt'))
+    world_key = checkpoint.digest("world", [keys[sub.model_name] for _, _, sub in submodels], includes, world_template)
+    if checkpoint.is_fresh("world", world_key):
+        print("Gazebo world file is up to date, skipping")
+        return
+    checkpoint.invalidate("world")
+    with metrics.stage("world_files") as count:
+        maptile_utiles.ensure_dir(checkpoint.model_path)
+        world_generator.gen_world(includes)
+        count(items=1)
+    checkpoint.record("world", world_key, [world_generator.model_name+'.world'])
+
+
+def generate_gazebo_world(tile_path, heightmap_resolution=None, texture_budget=None, progress=None, metrics=None, resume=True, grid=None):    
+
+    # Reports (stage, fraction) to the caller, e.g. the server job manager
+    if progress is None:
+        progress = lambda stage, fraction=None: None
+    # Collects per stage timings and counts
+    if metrics is None:
+        metrics = jobMetrics()
 
     # Main loop to select directory and trigger functions
     directory_path = tile_path
     print("Map tiles directory being used : ",directory_path)
     print("Generate gazebo world files are save to : ",os.path.join(globalParam.GAZEBO_WORLD_PATH,os.path.basename(directory_path)))
     if os.path.isfile(os.path.join(directory_path, 'metadata.json')) and directory_path != '':
-        world_generator = heightmapgenerator(directory_path)
-        world_generator.generate_ortho(directory_path)
-        print("Satelliet image generated successfully")
-        (sizex,sizey,sizez,posez) = world_generator.gen_terrain()
-        print("Height map generated successfully")
-        # Generate configuration file
-        world_generator.gen_config()
-        print("Gazebo world files generated successfully")
-        print(sizex,sizey)
-        # Generate SDF file for the world
-        world_generator.gen_sdf(sizex,sizey,sizez, posez)
-        world_generator.gen_world()
-        print(os.path.join(globalParam.TEMPORARY_SATELLITE_IMAGE, os.path.basename(directory_path)))
-        shutil.rmtree(os.path.join(globalParam.TEMPORARY_SATELLITE_IMAGE, os.path.basename(directory_path)))
-
-
+        world_generator = heightmapgenerator(directory_path, heightmap_resolution, grid)
+        world_generator.metrics = metrics
+        if texture_budget is not None:
+            world_generator.texture_budget = texture_budget
+
+        # Stages whose inputs and parameters are unchanged since the last run are skipped
+        model_path = os.path.join(globalParam.GAZEBO_WORLD_PATH, world_generator.model_name)
+        checkpoint = checkpointManifest(model_path)
+        if not resume:
+            checkpoint.stages = {}
+        # Fill the gaps of the download before the tiles are hashed and stitched
+        progress("tiles", 0.15)
+        world_generator.refetch_missing_tiles(directory_path)
+        progress("checkpoint", 0.2)
+        with metrics.stage("checkpoint_hash"):
+            dem_key = checkpoint.digest("dem", world_generator.dem_set_hash())
+            if world_generator.grid is None:
+                tiles_key = checkpoint.digest("tiles", world_generator.tile_set_hash(directory_path))
+        checkpoint.record("dem", dem_key)
+
+        if world_generator.grid is not None:
+            generate_tiled_world(world_generator, directory_path, checkpoint, dem_key, progress, metrics)
+        else:
+            checkpoint.record("tiles", tiles_key)
+
+            progress("ortho", 0.3)
+            ortho_key = checkpoint.digest("ortho", tiles_key, world_generator.boundaries, world_generator.zoomlevel,
+                                          world_generator.tile_size, globalParam.TEXTURE_PYRAMID_MIN_SIZE,
+                                          globalParam.MAX_TEXTURE_SIZE, world_generator.texture_encoder.settings())
+            if checkpoint.is_fresh("ortho", ortho_key):
+                world_generator.texture_levels = [tuple(level) for level in checkpoint.result("ortho")]
+                print("Satellite image is up to date, skipping")
+            else:
+                previous = checkpoint.stages.get("ortho")
+                checkpoint.invalidate("ortho")
+                world_generator.generate_ortho(directory_path)
+                outputs = [os.path.join('textures', name) for name, _ in world_generator.texture_levels]
+                # Remove aerial images of an earlier run that are not rewritten, e.g. after a texture format change
+                for stale in set(previous["outputs"] if previous else ()) - set(outputs):
+                    if os.path.isfile(os.path.join(model_path, stale)):
+                        os.remove(os.path.join(model_path, stale))
+                checkpoint.record("ortho", ortho_key, outputs, world_generator.texture_levels)
+                print("Satelliet image generated successfully")
+
+            progress("heightmap", 0.6)
+            heightmap_key = checkpoint.digest("heightmap", dem_key, world_generator.boundaries, world_generator.zoomlevel,
+                                              world_generator.native_heightmap, world_generator.heightmap_resolution,
+                                              globalParam.HEIGHTMAP_OUTPUT_SIZE, world_generator.dem_zoom, globalParam.TEXTURE_PNG_COMPRESSION,
+                                              globalParam.HEIGHTMAP_BIT_DEPTH, world_generator.terrain_output, globalParam.MESH_MAX_ERROR,
+                                              world_generator.collision_resolution)
+            terrain_files, sdf_files = world_generator.terrain_files()
+            if checkpoint.is_fresh("heightmap", heightmap_key):
+                (sizex,sizey,sizez,posez) = checkpoint.result("heightmap")
+                print("Height map is up to date, skipping")
+            else:
+                previous = checkpoint.stages.get("heightmap")
+                checkpoint.invalidate("heightmap")
+                (sizex,sizey,sizez,posez) = world_generator.gen_terrain()
+                sizez = float(sizez)
+                # Remove the heightmaps or mesh of an earlier run that are not rewritten
+                for stale in set(previous["outputs"] if previous else ()) - set(terrain_files):
+                    if os.path.isfile(os.path.join(model_path, stale)):
+                        os.remove(os.path.join(model_path, stale))
+                checkpoint.record("heightmap", heightmap_key, terrain_files, [sizex,sizey,sizez,posez])
+                print("Height map generated successfully")
+
+            progress("world", 0.9)
+            templates = [FileWriter.read_template(os.path.join(globalParam.TEMPLATE_DIR_PATH, name))
+                         for name in ('config_temp.txt', 'sdf_temp.txt', 'sdf_mesh_temp.txt', 'gazebo_world.txt')]
+            world_key = checkpoint.digest("world", ortho_key, heightmap_key, templates, world_generator.texture_budget)
+            if checkpoint.is_fresh("world", world_key):
+                print("Gazebo world files are up to date, skipping")
+            else:
+                checkpoint.invalidate("world")
+                with metrics.stage("world_files") as count:
+                    # Generate configuration file
+                    world_generator.gen_config()
+                    print("Gazebo world files generated successfully")
+                    print(sizex,sizey)
+                    # Generate SDF file for the world
+                    world_generator.gen_sdf(sizex,sizey,sizez, posez)
+                    world_generator.gen_world()
+                    count(items=3)
+                checkpoint.record("world", world_key, ['model.config', 'model.sdf', world_generator.model_name+'.world'] + sdf_files)
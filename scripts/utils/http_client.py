@@ -0,0 +1,177 @@
+import sys
+import ssl
+import time
+import threading
+import http.client
+from collections import deque
+from urllib.parse import urlsplit, urljoin
+from utils.param import globalParam
+from utils.metrics import metrics_registry
+
+
+class httpClient:
+    '''
+    Shared HTTP client keeping persistent keep-alive connections per host.
+
+    Idle connections are parked per (scheme, host, port) and reused by the next
+    request to the same host, so thousands of tile requests pay the TCP and TLS
+    handshake only once per connection. Failed requests are retried with
+    exponential backoff and every attempt records its latency.
+    '''
+
+    REDIRECT_CODES = (301, 302, 303, 307, 308)
+    RETRY_CODES = (429, 500, 502, 503, 504)
+    MAX_REDIRECTS = 5
+
+    def __init__(self, pool_size: int, timeout: float, retries: int, backoff: float):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.headers = {"User-Agent": "Python-urllib/%d.%d" % sys.version_info[:2]}
+
+        # certificate verification stays disabled like the previous urllib based download
+        # DONT use it in a prod/sensitive environment
+        self._ssl_context = ssl._create_unverified_context()
+
+        self._pools = {}
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=10000)
+        self.requests = 0
+        self.failures = 0
+        self.retried = 0
+        self.connections_opened = 0
+        self.connections_reused = 0
+
+    def _connect(self, scheme: str, host: str, port: int):
+        with self._lock:
+            self.connections_opened += 1
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, port, timeout=self.timeout, context=self._ssl_context)
+        return http.client.HTTPConnection(host, port, timeout=self.timeout)
+
+    def _acquire(self, scheme: str, host: str, port: int):
+        with self._lock:
+            idle = self._pools.get((scheme, host, port))
+            if idle:
+                self.connections_reused += 1
+                return idle.pop(), True
+        return self._connect(scheme, host, port), False
+
+    def _release(self, scheme: str, host: str, port: int, connection) -> None:
+        with self._lock:
+            idle = self._pools.setdefault((scheme, host, port), [])
+            if len(idle) < self.pool_size:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def _request(self, url: str):
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        port = parts.port or (443 if scheme == "https" else 80)
+        target = parts.path or "/"
+        if parts.query:
+            target += "?" + parts.query
+
+        connection, reused = self._acquire(scheme, parts.hostname, port)
+        try:
+            connection.request("GET", target, headers=self.headers)
+            response = connection.getresponse()
+            body = response.read()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            connection.close()
+            if not reused:
+                raise
+            # the server dropped an idle keep-alive connection, retry once on a fresh one
+            connection = self._connect(scheme, parts.hostname, port)
+            try:
+                connection.request("GET", target, headers=self.headers)
+                response = connection.getresponse()
+                body = response.read()
+            except Exception:
+                connection.close()
+                raise
+        except Exception:
+            connection.close()
+            raise
+
+        if response.will_close:
+            connection.close()
+        else:
+            self._release(scheme, parts.hostname, port, connection)
+        return response.status, response.getheader("Location"), body
+
+    def fetch(self, url: str):
+        """
+        Download a URL over a pooled connection.
+
+        Args:
+            url (str): URL to fetch.
+
+        Returns:
+            tuple: (code, data). code is 200 with the response body as data, the HTTP status
+                   code of a failed request, or -1 on a network error. data is None on failure.
+        """
+        code = -1
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                with self._lock:
+                    self.retried += 1
+                time.sleep(self.backoff * (2 ** (attempt - 1)))
+
+            start = time.perf_counter()
+            try:
+                target = url
+                for _ in range(self.MAX_REDIRECTS + 1):
+                    code, location, body = self._request(target)
+                    if code not in self.REDIRECT_CODES or location is None:
+                        break
+                    target = urljoin(target, location)
+            except Exception as e:
+                print(f"Request failed {url}: {e}")
+                code, body = -1, None
+            self._record(time.perf_counter() - start, code)
+
+            if code == 200:
+                return code, body
+            if code != -1 and code not in self.RETRY_CODES:
+                break
+
+        with self._lock:
+            self.failures += 1
+        return code, None
+
+    def _record(self, latency: float, code: int) -> None:
+        with self._lock:
+            self.requests += 1
+            self._latencies.append(latency)
+        metrics_registry.observe("gazebo_tile_fetch_latency_seconds", latency, result="ok" if code == 200 else "error")
+
+    def stats(self) -> dict:
+        """
+        Get the request counters and latency summary of the recent requests.
+
+        Returns:
+            dict: Request, failure, retry and connection counters and latency in seconds.
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+            stats = {
+                "requests": self.requests,
+                "failures": self.failures,
+                "retries": self.retried,
+                "connections_opened": self.connections_opened,
+                "connections_reused": self.connections_reused,
+            }
+        if latencies:
+            stats["latency"] = {
+                "mean": sum(latencies) / len(latencies),
+                "p50": latencies[len(latencies) // 2],
+                "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+                "max": latencies[-1],
+            }
+        return stats
+
+
+http_client = httpClient(globalParam.HTTP_POOL_SIZE, globalParam.HTTP_TIMEOUT, globalParam.HTTP_RETRIES, globalParam.HTTP_BACKOFF)
@@ -0,0 +1,157 @@
+import time
+import uuid
+import queue
+import threading
+from collections import OrderedDict
+from utils.param import globalParam
+from utils.metrics import jobMetrics
+
+
+class jobManager:
+    '''
+    Runs submitted jobs on a fixed number of worker threads.
+
+    Every job gets an id and a status record holding its state (queued,
+    in_progress, completed or failed), the current stage, a progress
+    fraction and the timings and counts of its pipeline stages. Jobs wait in a FIFO queue until a worker is free, which bounds
+    how many CPU heavy generations run at the same time.
+    '''
+
+    def __init__(self, workers: int, history: int):
+        self.history = history
+        self._queue = queue.Queue()
+        self._jobs = OrderedDict()
+        self._pending = []
+        self._metrics = {}
+        self._lock = threading.Lock()
+        for index in range(workers):
+            threading.Thread(target=self._work, name=f"job-worker-{index}", daemon=True).start()
+
+    def submit(self, func, *args, **info) -> str:
+        """
+        Queue a job.
+
+        Args:
+            func (callable): Called as func(*args, progress=callback, metrics=jobMetrics) on a worker.
+                The callback takes (stage, progress) and updates the job status.
+            *args: Positional arguments of func.
+            **info: Extra fields copied into the job status, e.g. the output directory.
+
+        Returns:
+            str: Id of the queued job.
+        """
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._jobs[job_id] = dict(
+                info,
+                id=job_id,
+                status="queued",
+                stage=None,
+                progress=0.0,
+                error=None,
+                created=time.time(),
+                started=None,
+                finished=None,
+            )
+            self._pending.append(job_id)
+            self._metrics[job_id] = jobMetrics()
+            self._trim()
+        self._queue.put((job_id, func, args))
+        return job_id
+
+    def update(self, job_id: str, **changes) -> None:
+        """
+        Update fields of a job status.
+
+        Args:
+            job_id (str): Id of the job.
+            **changes: Fields to set.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(changes)
+
+    def status(self, job_id: str):
+        """
+        Get the status of a job.
+
+        Args:
+            job_id (str): Id of the job.
+
+        Returns:
+            dict: Copy of the job status with its stage metrics and its queue position while
+                  queued, None for an unknown id.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            status = dict(job)
+            if job_id in self._pending:
+                status["position"] = self._pending.index(job_id)
+            metrics = self._metrics[job_id]
+        status["metrics"] = metrics.as_dict()
+        return status
+
+    def latest(self):
+        """
+        Get the status of the most recently submitted job.
+
+        Returns:
+            dict: Copy of the job status, None if no job was submitted.
+        """
+        with self._lock:
+            if not self._jobs:
+                return None
+            job_id = next(reversed(self._jobs))
+        return self.status(job_id)
+
+    def counts(self) -> dict:
+        """
+        Count the known jobs by state.
+
+        Returns:
+            dict: State to number of jobs.
+        """
+        counts = {"queued": 0, "in_progress": 0, "completed": 0, "failed": 0}
+        with self._lock:
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+        return counts
+
+    def _trim(self) -> None:
+        # drop the oldest finished jobs beyond the history limit
+        finished = [job_id for job_id, job in self._jobs.items() if job["finished"] is not None]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self._jobs[job_id]
+            del self._metrics[job_id]
+
+    def _work(self) -> None:
+        while True:
+            job_id, func, args = self._queue.get()
+            with self._lock:
+                self._pending.remove(job_id)
+                metrics = self._metrics[job_id]
+            self.update(job_id, status="in_progress", started=time.time())
+
+            def progress(stage, fraction=None, job_id=job_id):
+                changes = {"stage": stage}
+                if fraction is not None:
+                    changes["progress"] = fraction
+                self.update(job_id, **changes)
+
+            try:
+                func(*args, progress=progress, metrics=metrics)
+                self.update(job_id, status="completed", progress=1.0, finished=time.time())
+            except Exception as e:
+                print(f"Job {job_id} failed: {e}")
+                self.update(job_id, status="failed", error=str(e), finished=time.time())
+            finally:
+                self._queue.task_done()
+
+
+job_manager = jobManager(globalParam.MAX_CONCURRENT_JOBS, globalParam.JOB_HISTORY)
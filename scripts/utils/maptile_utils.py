@@ -1,12 +1,19 @@
-import mercantile
+import math
+import numpy as np
 import os,shutil
+from utils.param import globalParam
 
 
 class maptile_utiles:
+    # Latitude limit of the Web Mercator projection
+    MAX_LATITUDE = 85.0511
+    # Points this close to the next tile are counted in it, as mercantile does to absorb round-trip errors
+    TILE_EPSILON = 1e-14
+
     @staticmethod
     def get_tile_bounds(x, y, zoom):
         """
-        Get the latitude/longitude bounds of a tile using the mercantile library.
+        Get the latitude/longitude bounds of a tile, identical to mercantile.bounds.
         Parameters:
         - x (int): Tile number in X direction.
         - y (int): Tile number in Y direction.
@@ -15,14 +22,55 @@ class maptile_utiles:
         - dict: A dictionary with 'north', 'south', 'east', 'west' latitude/longitude boundaries.
         """
         # Get the bounds of the tile
-        bounds = mercantile.bounds(x, y, zoom)
+        west, south, east, north = (float(value) for value in maptile_utiles.tile_bounds(x, y, zoom))
 
         return {
-            "southwest": (bounds.south, bounds.west),   # Southwest corner
-            "southeast": (bounds.south, bounds.east),  # Southeast corner
-            "northwest": (bounds.north, bounds.west),  # Northwest corner
-            "northeast": (bounds.north, bounds.east)  # Northeast corner
+            "southwest": (south, west),   # Southwest corner
+            "southeast": (south, east),  # Southeast corner
+            "northwest": (north, west),  # Northwest corner
+            "northeast": (north, east)  # Northeast corner
         }
+
+    @staticmethod
+    def tile_bounds(x, y, zoom: int):
+        """
+        Get the bounds of arrays of tiles, identical to mercantile.bounds.
+        Parameters:
+        - x (array_like): Tile numbers in X direction.
+        - y (array_like): Tile numbers in Y direction.
+        - zoom (int): Zoom level.
+        Returns:
+        - (np.ndarray, np.ndarray, np.ndarray, np.ndarray): West, south, east and north edges in degrees.
+        """
+        n = 2.0 ** zoom
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        # Row edges are few, computing them with the math module keeps them bit-identical to mercantile
+        edges = np.unique(np.concatenate([y.ravel(), y.ravel() + 1]))
+        lats = np.array([math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * edge / n)))) for edge in edges])
+        north = lats[np.searchsorted(edges, y)]
+        south = lats[np.searchsorted(edges, y + 1)]
+        west = x / n * 360.0 - 180.0
+        east = (x + 1) / n * 360.0 - 180.0
+        return west, south, east, north
+
+    @staticmethod
+    def tile_corners(tiles: dict, zoom: int) -> dict:
+        """
+        Get one corner of each of a set of tiles in a single pass.
+        Parameters:
+        - tiles (dict): (x, y) tile numbers by corner name, "southwest", "southeast", "northwest" or "northeast".
+        - zoom (int): Zoom level.
+        Returns:
+        - dict: (lat, lon) of the named corner of every tile.
+        """
+        corners = list(tiles)
+        xs, ys = zip(*(tiles[corner] for corner in corners))
+        west, south, east, north = maptile_utiles.tile_bounds(xs, ys, zoom)
+        lats = {"south": south, "north": north}
+        lons = {"west": west, "east": east}
+        return {corner: (float(lats[corner[:5]][index]), float(lons[corner[5:]][index]))
+                for index, corner in enumerate(corners)}
     
     @staticmethod
     def get_max_tilenumber(bound_array,zoom): # take zoom level as fundtion param
@@ -36,10 +84,8 @@ class maptile_utiles:
         se = (float(bound_array[1]), float(bound_array[2]))
         
 
-        sw_tile_x,sw_tile_y = maptile_utiles.lat_lon_to_tile(sw[0],sw[1],zoom)
-        nw_tile_x,nw_tile_y = maptile_utiles.lat_lon_to_tile(nw[0],nw[1],zoom)
-        ne_tile_x,ne_tile_y = maptile_utiles.lat_lon_to_tile(ne[0],ne[1],zoom)
-        se_tile_x,se_tile_y = maptile_utiles.lat_lon_to_tile(se[0],se[1],zoom)
+        tile_xs, tile_ys = maptile_utiles.lat_lon_to_tiles([sw[0], nw[0], ne[0], se[0]], [sw[1], nw[1], ne[1], se[1]], zoom)
+        (sw_tile_x, nw_tile_x, ne_tile_x, se_tile_x), (sw_tile_y, nw_tile_y, _, se_tile_y) = tile_xs.tolist(), tile_ys.tolist()
 
 
         height,width = abs(nw_tile_x - ne_tile_x), abs(sw_tile_y-nw_tile_y)
@@ -68,25 +114,15 @@ class maptile_utiles:
         
         '''
         boundaries  = maptile_utiles.get_max_tilenumber(bound_array,zoom)
-        true_sw     = maptile_utiles.get_tile_bounds(boundaries["southwest"][0],boundaries["southwest"][1],zoom)["southwest"]
-        true_se     = maptile_utiles.get_tile_bounds(boundaries["southeast"][0],boundaries["southeast"][1],zoom)["southeast"]
-        true_nw     = maptile_utiles.get_tile_bounds(boundaries["northwest"][0],boundaries["northwest"][1],zoom)["northwest"]
-        true_ne     = maptile_utiles.get_tile_bounds(boundaries["northeast"][0],boundaries["northeast"][1],zoom)["northeast"]
-        
-
-        return {
-            "southwest": true_sw,  
-            "southeast": true_se,  
-            "northwest": true_nw,  
-            "northeast": true_ne        
-        }
+        # the outer corner of every corner tile
+        return maptile_utiles.tile_corners(boundaries, zoom)
 
 
 
     @staticmethod
     def lat_lon_to_tile( lat: float, lon: float, zoom: int):
         """
-        Converts latitude and longitude to tile numbers at a given zoom level using mercantile.
+        Converts latitude and longitude to tile numbers at a given zoom level, identical to mercantile.tile.
         Parameters:
         - lat (float): Latitude in degrees.
         - lon (float): Longitude in degrees.
@@ -94,10 +130,176 @@ class maptile_utiles:
         Returns:
         - (int, int): Tile x and y numbers.
         """
-        # Clamp latitude for Web Mercator projection bounds
-        lat = max(min(lat, 85.0511), -85.0511)
-        tile = mercantile.tile(lon, lat, zoom)
-        return tile.x, tile.y
+        tile_x, tile_y = maptile_utiles.lat_lon_to_tiles(lat, lon, zoom)
+        return int(tile_x), int(tile_y)
+
+    @staticmethod
+    def lat_lon_to_tiles(lat, lon, zoom: int):
+        """
+        Converts arrays of latitude and longitude to tile numbers, identical to mercantile.tile.
+        Parameters:
+        - lat (array_like): Latitudes in degrees, clamped to the Web Mercator limits.
+        - lon (array_like): Longitudes in degrees.
+        - zoom (int): Zoom level.
+        Returns:
+        - (np.ndarray, np.ndarray): Tile x and y numbers.
+        """
+        x, y = maptile_utiles.lat_lon_to_fractional_tile(lat, lon, 0)
+        n = 2.0 ** zoom
+        tiles = []
+        for value in (x, y):
+            tile = np.floor((value + maptile_utiles.TILE_EPSILON) * n)
+            tiles.append(np.where(value <= 0, 0, np.where(value >= 1, n - 1, tile)).astype(np.int64))
+        return tiles[0], tiles[1]
+
+    @staticmethod
+    def tile_to_lat_lon(x, y, zoom: int):
+        """
+        Converts arrays of fractional tile coordinates to latitude and longitude, the inverse of lat_lon_to_fractional_tile.
+        Whole tile numbers give the north west corner of the tile as mercantile.ul does, to within a unit in the last place.
+        Parameters:
+        - x (array_like): Tile x coordinates.
+        - y (array_like): Tile y coordinates.
+        - zoom (int): Zoom level.
+        Returns:
+        - (np.ndarray, np.ndarray): Latitudes and longitudes in degrees.
+        """
+        n = 2.0 ** zoom
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        lon = x / n * 360.0 - 180.0
+        lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * y / n))))
+        return lat, lon
+
+    @staticmethod
+    def lat_lon_to_pixel(lat, lon, zoom: int, tile_size: int = 256):
+        """
+        Converts arrays of latitude and longitude to global pixel coordinates of a tile pyramid.
+        Parameters:
+        - lat (array_like): Latitudes in degrees.
+        - lon (array_like): Longitudes in degrees.
+        - zoom (int): Zoom level.
+        - tile_size (int): Pixels per tile side.
+        Returns:
+        - (np.ndarray, np.ndarray): Pixel x and y coordinates from the north west corner of the world.
+        """
+        x, y = maptile_utiles.lat_lon_to_fractional_tile(lat, lon, zoom)
+        return x * tile_size, y * tile_size
+
+    @staticmethod
+    def pixel_to_lat_lon(x, y, zoom: int, tile_size: int = 256):
+        """
+        Converts arrays of global pixel coordinates of a tile pyramid to latitude and longitude.
+        Parameters:
+        - x (array_like): Pixel x coordinates.
+        - y (array_like): Pixel y coordinates.
+        - zoom (int): Zoom level.
+        - tile_size (int): Pixels per tile side.
+        Returns:
+        - (np.ndarray, np.ndarray): Latitudes and longitudes in degrees.
+        """
+        return maptile_utiles.tile_to_lat_lon(np.asarray(x, dtype=np.float64) / tile_size,
+                                              np.asarray(y, dtype=np.float64) / tile_size, zoom)
+
+    @staticmethod
+    def get_tile_range(bound_array, zoom: int) -> tuple:
+        """
+        Get the range of tiles touching a region.
+        Parameters:
+        - bound_array (list): Region bounds as [west, south, east, north].
+        - zoom (int): Zoom level.
+        Returns:
+        - tuple: (min_x, max_x, min_y, max_y) inclusive tile numbers.
+        """
+        west, south, east, north = map(float, bound_array)
+        tile_xs, tile_ys = maptile_utiles.lat_lon_to_tiles([north, south], [west, east], zoom)
+        return int(tile_xs.min()), int(tile_xs.max()), int(tile_ys.min()), int(tile_ys.max())
+
+    @staticmethod
+    def get_tiles_in_bounds(bound_array, zoom: int) -> list:
+        """
+        Enumerate every tile touching a region.
+        Parameters:
+        - bound_array (list): Region bounds as [west, south, east, north].
+        - zoom (int): Zoom level.
+        Returns:
+        - list: (x, y) tile numbers, row by row from the north west tile.
+        """
+        min_x, max_x, min_y, max_y = maptile_utiles.get_tile_range(bound_array, zoom)
+        ys, xs = np.mgrid[min_y:max_y + 1, min_x:max_x + 1]
+        return list(zip(xs.ravel().tolist(), ys.ravel().tolist()))
+
+    @staticmethod
+    def quadkeys(x, y, zoom: int) -> np.ndarray:
+        """
+        Get the quadkeys of arrays of tiles, identical to mercantile.quadkey.
+        Parameters:
+        - x (array_like): Tile numbers in X direction.
+        - y (array_like): Tile numbers in Y direction.
+        - zoom (int): Zoom level.
+        Returns:
+        - np.ndarray: Quadkey strings in the shape of x.
+        """
+        x = np.asarray(x, dtype=np.int64)
+        y = np.asarray(y, dtype=np.int64)
+        if zoom == 0:
+            return np.full(x.shape, '', dtype='<U1')
+        # one base 4 digit per zoom level from the coarsest, x adds 1 and y adds 2
+        shifts = np.arange(zoom - 1, -1, -1)
+        digits = (x[..., np.newaxis] >> shifts & 1) + 2 * (y[..., np.newaxis] >> shifts & 1) + ord('0')
+        return np.ascontiguousarray(digits, dtype=np.uint8).view(f'S{zoom}')[..., 0].astype(str)
+
+    @staticmethod
+    def lat_lon_to_fractional_tile(lat, lon, zoom: int):
+        """
+        Converts arrays of latitude and longitude to fractional Web Mercator tile coordinates.
+        The integer part is the tile number and the fractional part the position inside the tile.
+        Parameters:
+        - lat (array_like): Latitudes in degrees.
+        - lon (array_like): Longitudes in degrees.
+        - zoom (int): Zoom level.
+        Returns:
+        - (np.ndarray, np.ndarray): Fractional tile x and y coordinates.
+        """
+        lat = np.clip(np.asarray(lat, dtype=np.float64), -maptile_utiles.MAX_LATITUDE, maptile_utiles.MAX_LATITUDE)
+        lon = np.asarray(lon, dtype=np.float64)
+        n = 2.0 ** zoom
+        sinlat = np.sin(np.radians(lat))
+        x = (lon / 360.0 + 0.5) * n
+        y = (0.5 - 0.25 * np.log((1.0 + sinlat) / (1.0 - sinlat)) / np.pi) * n
+        return x, y
+
+    @staticmethod
+    def get_dem_zoom(boundaries: dict, samples: int) -> int:
+        """
+        Pick the lowest DEM zoom level whose pixels are no coarser than the heightmap sample spacing.
+        Parameters:
+        - boundaries (dict): True latitude/longitude boundaries of the map.
+        - samples (int): Heightmap samples per side.
+        Returns:
+        - int: Zoom level clamped to globalParam.DEM_MIN_ZOOM and globalParam.DEM_MAX_ZOOM.
+        """
+        nw_x, nw_y = maptile_utiles.lat_lon_to_fractional_tile(*boundaries["northwest"], 0)
+        se_x, se_y = maptile_utiles.lat_lon_to_fractional_tile(*boundaries["southeast"], 0)
+        # extent of the shorter side in DEM pixels at zoom 0
+        span = min(abs(float(se_x - nw_x)), abs(float(se_y - nw_y))) * globalParam.DEM_TILE_SIZE
+        if span <= 0:
+            return globalParam.DEM_MAX_ZOOM
+        zoom = math.ceil(math.log2(max(samples - 1, 1) / span))
+        return int(min(max(zoom, globalParam.DEM_MIN_ZOOM), globalParam.DEM_MAX_ZOOM))
+
+    @staticmethod
+    def ensure_dir(path: str) -> None:
+        """
+        Create a directory if it does not exist, keeping its content otherwise.
+
+        Args:
+            path (str): Path to directory.
+
+        Returns:
+            None
+        """
+        os.makedirs(path, exist_ok=True)
 
     @staticmethod
     def dir_check(path: str) -> None:
@@ -0,0 +1,244 @@
+import os
+import json
+import sqlite3
+import threading
+import time
+from utils.file_writer import FileWriter
+from utils.param import globalParam
+
+
+class MbtilesWriter(FileWriter):
+
+	databases = {}
+	databasesLock = threading.Lock()
+	# Timer closing the databases of abandoned downloads, running while databases are open
+	idleTimer = None
+
+	@staticmethod
+	def connect(file):
+		'''
+        Get the shared database state of an MBTiles file, creating the file if needed.
+
+        Args:
+            file (str): Path of the MBTiles file.
+
+        Returns:
+            dict: The "connection", the "pending" tile rows and the "lock" guarding both.
+		'''
+		with MbtilesWriter.databasesLock:
+			database = MbtilesWriter.databases.get(file)
+			if database is not None:
+				database["used"] = time.monotonic()
+				return database
+
+			os.makedirs(os.path.dirname(file), exist_ok=True)
+			connection = sqlite3.connect(file, check_same_thread=False)
+			connection.execute("PRAGMA journal_mode=WAL")
+			connection.execute("PRAGMA synchronous=NORMAL")
+			connection.execute("CREATE TABLE IF NOT EXISTS metadata (name TEXT, value TEXT)")
+			connection.execute("CREATE UNIQUE INDEX IF NOT EXISTS metadata_name ON metadata (name)")
+			connection.execute("CREATE TABLE IF NOT EXISTS tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB)")
+			connection.execute("CREATE UNIQUE INDEX IF NOT EXISTS tile_index ON tiles (zoom_level, tile_column, tile_row)")
+			connection.commit()
+
+			database = {"connection": connection, "pending": {}, "lock": threading.Lock(), "used": time.monotonic()}
+			MbtilesWriter.databases[file] = database
+			if MbtilesWriter.idleTimer is None:
+				MbtilesWriter.startIdleTimer()
+			return database
+
+	@staticmethod
+	def startIdleTimer():
+		'''
+        Schedule closeIdle. Call with databasesLock held.
+		'''
+		MbtilesWriter.idleTimer = threading.Timer(globalParam.MBTILES_IDLE_TIMEOUT, MbtilesWriter.closeIdle)
+		MbtilesWriter.idleTimer.daemon = True
+		MbtilesWriter.idleTimer.start()
+
+	@staticmethod
+	def closeIdle():
+		'''
+        Write the pending tiles and close the databases unused for globalParam.MBTILES_IDLE_TIMEOUT
+        seconds, e.g. of a browser download abandoned before /end-download.
+		'''
+		now = time.monotonic()
+		with MbtilesWriter.databasesLock:
+			idle = [file for file, database in MbtilesWriter.databases.items() if now - database["used"] >= globalParam.MBTILES_IDLE_TIMEOUT]
+			databases = [MbtilesWriter.databases.pop(file) for file in idle]
+			if MbtilesWriter.databases:
+				MbtilesWriter.startIdleTimer()
+			else:
+				MbtilesWriter.idleTimer = None
+
+		for database in databases:
+			with database["lock"]:
+				try:
+					MbtilesWriter.flush(database)
+				finally:
+					database["connection"].close()
+
+	@staticmethod
+	def flush(database):
+		'''
+        Write the pending tiles of a database in one transaction. Call with database["lock"] held.
+		'''
+		if not database["pending"]:
+			return
+		connection = database["connection"]
+		with connection:
+			connection.executemany(
+				"INSERT OR REPLACE INTO tiles (zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?)",
+				[key + (data,) for key, data in database["pending"].items()]
+			)
+		database["pending"].clear()
+
+	@staticmethod
+	def tmsRow(y, z):
+		'''
+        Convert an XYZ tile row to the TMS row stored in MBTiles.
+		'''
+		return (1 << z) - 1 - y
+
+	@staticmethod
+	def addMetadata(lock, path, file, name, description, format, bounds, center,area, zoom_level, profile="mercator", tileSize=256):
+		'''
+        Add metadata to metadata.json and to the metadata table of the MBTiles file.
+
+        metadata.json also records the MBTiles file relative to path so the world
+        generator reads the tiles from it.
+
+        Args:
+            Same as FileWriter.addMetadata, file being the MBTiles file path.
+
+        Returns:
+            None
+		'''
+		FileWriter.addMetadata(lock, path, file, name, description, format, bounds, center, area, zoom_level, profile, tileSize)
+
+		with open(os.path.join(path, "metadata.json")) as jsonFile:
+			data = json.load(jsonFile)
+		del data["tiles"]
+		data["mbtiles"] = os.path.relpath(file, path)
+		with open(os.path.join(path, "metadata.json"), 'w') as jsonFile:
+			json.dump(data, jsonFile)
+
+		database = MbtilesWriter.connect(file)
+		with database["lock"]:
+			connection = database["connection"]
+			with connection:
+				connection.executemany(
+					"INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)",
+					[(key, str(value)) for key, value in data.items() if key != "mbtiles"]
+				)
+
+		return
+
+	@staticmethod
+	def addTile(lock, filePath, data, x, y, z, outputScale):
+		'''
+        Queue a tile for the MBTiles file, writing the queue in batches.
+
+        Args:
+            lock (multiprocessing.Lock): A lock for thread-safe operations.
+            filePath (str): Path of the MBTiles file.
+            data (bytes): The encoded tile image.
+            x (int): X-coordinate.
+            y (int): Y-coordinate.
+            z (int): Z-coordinate.
+            outputScale (float): The output scale.
+
+        Returns:
+            None
+		'''
+		database = MbtilesWriter.connect(filePath)
+		with database["lock"]:
+			database["pending"][(z, x, MbtilesWriter.tmsRow(y, z))] = data
+			if len(database["pending"]) >= globalParam.MBTILES_BATCH_SIZE:
+				MbtilesWriter.flush(database)
+		FileWriter.markPresent(filePath, x, y)
+
+		return
+
+	@staticmethod
+	def exists(filePath, x, y, z):
+		'''
+        Check if a tile is already stored or queued in the MBTiles file.
+
+        Args:
+            filePath (str): Path of the MBTiles file.
+            x (int): X-coordinate.
+            y (int): Y-coordinate.
+            z (int): Z-coordinate.
+
+        Returns:
+            bool: True if the tile exists, False otherwise.
+		'''
+		if not os.path.isfile(filePath):
+			return False
+
+		database = MbtilesWriter.connect(filePath)
+		key = (z, x, MbtilesWriter.tmsRow(y, z))
+		with database["lock"]:
+			if key in database["pending"]:
+				return True
+			row = database["connection"].execute(
+				"SELECT 1 FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?", key
+			).fetchone()
+		return row is not None
+
+	@staticmethod
+	def close(lock, path, file, zoom_level):
+		'''
+        Write the pending tiles and close the MBTiles file and the tile manifest.
+
+        Args:
+            lock (multiprocessing.Lock): A lock for thread-safe operations.
+            path (str): The directory path.
+            file (str): Path of the MBTiles file.
+            zoom_level (int): The maximum zoom level.
+
+        Returns:
+            None
+		'''
+		FileWriter.flushManifest(path)
+		with MbtilesWriter.databasesLock:
+			database = MbtilesWriter.databases.pop(file, None)
+		if database is None:
+			return
+
+		with database["lock"]:
+			try:
+				MbtilesWriter.flush(database)
+			finally:
+				database["connection"].close()
+
+		return
+
+	@staticmethod
+	def readTiles(file, z, minX, maxX, minY, maxY):
+		'''
+        Read the tiles of an inclusive XYZ tile range with one range query.
+
+        Args:
+            file (str): Path of the MBTiles file.
+            z (int): Z-coordinate.
+            minX (int): First tile column.
+            maxX (int): Last tile column.
+            minY (int): First XYZ tile row.
+            maxY (int): Last XYZ tile row.
+
+        Yields:
+            tuple: (x, y, data) for every stored tile of the range.
+		'''
+		connection = sqlite3.connect(file, check_same_thread=False)
+		try:
+			rows = connection.execute(
+				"SELECT tile_column, tile_row, tile_data FROM tiles "
+				"WHERE zoom_level = ? AND tile_column BETWEEN ? AND ? AND tile_row BETWEEN ? AND ?",
+				(z, minX, maxX, MbtilesWriter.tmsRow(maxY, z), MbtilesWriter.tmsRow(minY, z))
+			)
+			for x, row, data in rows:
+				yield x, MbtilesWriter.tmsRow(row, z), data
+		finally:
+			connection.close()
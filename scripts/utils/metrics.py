@@ -0,0 +1,216 @@
+import math
+import time
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict
+from functools import partial
+
+
+class metricsRegistry:
+    '''
+    Process wide counters, gauges and histograms rendered in the Prometheus text format.
+
+    Metrics are declared once with describe and then updated by name with labels
+    passed as keyword arguments.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = OrderedDict()
+
+    def describe(self, name: str, kind: str, help: str, buckets: tuple = None) -> None:
+        """
+        Declare a metric.
+
+        Args:
+            name (str): Metric name.
+            kind (str): "counter", "gauge" or "histogram".
+            help (str): Help text of the metric.
+            buckets (tuple, optional): Upper bounds of the histogram buckets in ascending order.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._metrics.setdefault(name, {"kind": kind, "help": help, "buckets": buckets, "samples": OrderedDict()})
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        """
+        Add to a counter.
+        """
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            samples = self._metrics[name]["samples"]
+            samples[key] = samples.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        """
+        Set a gauge.
+        """
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._metrics[name]["samples"][key] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """
+        Record an observation in a histogram.
+        """
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            metric = self._metrics[name]
+            sample = metric["samples"].get(key)
+            if sample is None:
+                sample = metric["samples"][key] = {"buckets": [0] * len(metric["buckets"]), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(metric["buckets"]):
+                if value <= bound:
+                    sample["buckets"][index] += 1
+            sample["sum"] += value
+            sample["count"] += 1
+
+    @staticmethod
+    def _labels(key: tuple, extra: tuple = ()) -> str:
+        pairs = list(key) + list(extra)
+        if not pairs:
+            return ""
+        escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+        return "{" + ",".join(f'{label}="{value}"' for (label, _), value in zip(pairs, escaped)) + "}"
+
+    @staticmethod
+    def _value(value: float) -> str:
+        if isinstance(value, float) and math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value) if isinstance(value, float) else str(value)
+
+    def render(self) -> str:
+        """
+        Render every metric in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics page.
+        """
+        lines = []
+        with self._lock:
+            for name, metric in self._metrics.items():
+                lines.append(f"# HELP {name} {metric['help']}")
+                lines.append(f"# TYPE {name} {metric['kind']}")
+                for key, sample in metric["samples"].items():
+                    if metric["kind"] != "histogram":
+                        lines.append(f"{name}{self._labels(key)} {self._value(sample)}")
+                        continue
+                    for bound, count in zip(metric["buckets"], sample["buckets"]):
+                        lines.append(f"{name}_bucket{self._labels(key, (('le', self._value(float(bound))),))} {count}")
+                    lines.append(f"{name}_bucket{self._labels(key, (('le', '+Inf'),))} {sample['count']}")
+                    lines.append(f"{name}_sum{self._labels(key)} {self._value(sample['sum'])}")
+                    lines.append(f"{name}_count{self._labels(key)} {sample['count']}")
+        return "\n".join(lines) + "\n"
+
+
+class jobMetrics:
+    '''
+    Wall time, item, byte and error counts of the pipeline stages of one job.
+
+    Every update is also added to the process wide registry so /metrics covers all jobs.
+    '''
+
+    def __init__(self, registry: metricsRegistry = None):
+        self.registry = registry if registry is not None else metrics_registry
+        self._lock = threading.Lock()
+        self._stages = OrderedDict()
+
+    def _stage(self, name: str) -> dict:
+        return self._stages.setdefault(name, {"seconds": 0.0, "items": 0, "bytes": 0, "errors": 0})
+
+    def add(self, name: str, items: int = 0, bytes: int = 0, errors: int = 0) -> None:
+        """
+        Count work done by a stage.
+
+        Args:
+            name (str): Stage name.
+            items (int, optional): Processed items, e.g. tiles fetched or decoded. Defaults to 0.
+            bytes (int, optional): Bytes written. Defaults to 0.
+            errors (int, optional): Failed items. Defaults to 0.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            stage = self._stage(name)
+            stage["items"] += items
+            stage["bytes"] += bytes
+            stage["errors"] += errors
+        if items:
+            self.registry.inc("gazebo_stage_items_total", items, stage=name)
+        if bytes:
+            self.registry.inc("gazebo_stage_bytes_total", bytes, stage=name)
+        if errors:
+            self.registry.inc("gazebo_stage_errors_total", errors, stage=name)
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Time a stage. An exception escaping the block counts as one error.
+
+        Args:
+            name (str): Stage name.
+
+        Yields:
+            callable: add bound to the stage, called as count(items=, bytes=, errors=).
+        """
+        with self._lock:
+            self._stage(name)
+        start = time.perf_counter()
+        try:
+            yield partial(self.add, name)
+        except Exception:
+            self.add(name, errors=1)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._stages[name]["seconds"] += elapsed
+            self.registry.observe("gazebo_stage_duration_seconds", elapsed, stage=name)
+
+    def merge(self, stages: dict) -> None:
+        """
+        Add the stage counters of work done elsewhere, e.g. by an executor task, to this job.
+
+        The process wide registry is not updated, the task already reported to the registry of its process.
+
+        Args:
+            stages (dict): Stage counters as returned by as_dict.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            for name, counters in stages.items():
+                stage = self._stage(name)
+                for key in ("seconds", "items", "bytes", "errors"):
+                    stage[key] += counters[key]
+
+    def as_dict(self) -> dict:
+        """
+        Get the stage counters.
+
+        Returns:
+            dict: Stage name to its seconds, items, bytes, errors and items per second.
+        """
+        with self._lock:
+            stages = OrderedDict((name, dict(stage)) for name, stage in self._stages.items())
+        for stage in stages.values():
+            stage["items_per_second"] = stage["items"] / stage["seconds"] if stage["seconds"] > 0 else None
+        return stages
+
+
+metrics_registry = metricsRegistry()
+metrics_registry.describe("gazebo_stage_duration_seconds", "histogram", "Wall time of pipeline stages.",
+                          (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600))
+metrics_registry.describe("gazebo_stage_items_total", "counter", "Items processed by pipeline stages, e.g. tiles fetched or decoded.")
+metrics_registry.describe("gazebo_stage_bytes_total", "counter", "Bytes written by pipeline stages.")
+metrics_registry.describe("gazebo_stage_errors_total", "counter", "Failed items and stages of the pipeline.")
+metrics_registry.describe("gazebo_tile_fetch_latency_seconds", "histogram", "Latency of tile HTTP requests, one observation per attempt.",
+                          (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+metrics_registry.describe("gazebo_tiles_total", "counter", "Imagery tiles handled by the tile downloader by result.")
+metrics_registry.describe("gazebo_jobs", "gauge", "Known world generation jobs by state.")
+metrics_registry.describe("gazebo_http_requests", "gauge", "Tile HTTP client request and connection counters.")
+metrics_registry.describe("gazebo_cache", "gauge", "Tile and DEM cache counters.")
@@ -7,13 +7,76 @@ class globalParam:
     OUTPUT_BASE_PATH            = str(Path(__file__).resolve().parents[2] / 'output')
 
     GAZEBO_WORLD_PATH           = os.path.join(OUTPUT_BASE_PATH,'gazebo_terrian')  
-    DEM_RESOLUTION              = 11 
+    DEM_MIN_ZOOM                = 0                   # DEM zoom is picked per region within these limits
+    DEM_MAX_ZOOM                = 15                  # highest zoom served by the DEM provider
+    DEM_TILE_SIZE               = 256                 # pixels per side of a DEM tile
     HEIGHTMAP_RESOLUTION        = 18
+    HEIGHTMAP_OUTPUT_SIZE       = 1025                # legacy grids are resized to this size
+    HEIGHTMAP_MAX_RESOLUTION    = 4097                # largest native 2^n+1 heightmap grid
+    HEIGHTMAP_BIT_DEPTH         = 8                   # 16 writes 65536 elevation levels instead of 256
+    HEIGHTMAP_COLLISION_RESOLUTION = None             # 2^n+1 size of a coarser collision heightmap, e.g. 257, None collides with the visual one
+    DEM_CACHE_MAX_BYTES         = 256 * 1024 * 1024   # memory cap of the decoded DEM tile cache
 
     DEM_PATH                    = os.path.join(OUTPUT_BASE_PATH, 'dem')
+    DEM_TILE_URL                = ("https://api.mapbox.com/raster/v1/mapbox.mapbox-terrain-dem-v1/"
+                                   "{z}/{x}/{y}.webp?sku=101CUGorpzzyK&access_token=pk.eyJ1IjoicHJhdmlubWFsaTg1NCIsImEiOiJjbDM4Y2ZpaDIwMDdkM2JxbGM0ZWtkamxxIn0.VStYkAceQjhkW8StZekEvg")
 
+    # Persistent tile cache shared by all jobs
+    TILE_CACHE_PATH             = str(Path(__file__).resolve().parents[2] / 'cache')
+    TILE_CACHE_MAX_BYTES        = 2 * 1024 * 1024 * 1024
+    TILE_CACHE_TTL              = 30 * 24 * 3600    # seconds, None keeps tiles until evicted by the quota
+
+
+    # Shared HTTP client used for imagery and DEM tiles
+    HTTP_POOL_SIZE              = 16        # idle keep-alive connections kept per host
+    HTTP_TIMEOUT                = 30        # seconds
+    HTTP_RETRIES                = 3
+    HTTP_BACKOFF                = 0.5       # seconds, doubled on every retry
+
+    # Worker pools shared by all stages and jobs, see utils/executor.py
+    EXECUTOR_MODE               = "thread"  # "thread", "process" or "inline" for CPU bound tasks such as tile decoding
+    EXECUTOR_WORKERS            = None      # CPU bound workers, None uses the CPU count
+    EXECUTOR_IO_WORKERS         = 16        # threads fetching imagery and DEM tiles
+
+    # Tiles written to an MBTiles file per insert transaction
+    MBTILES_BATCH_SIZE          = 256
+    # Seconds an MBTiles file may go unused before its pending tiles are written and it is closed
+    MBTILES_IDLE_TIMEOUT        = 600
+    # Stored tiles recorded in the tile manifest per write, the rest is written when the download is closed
+    MANIFEST_BATCH_SIZE         = 256
+
+    # DEM downloads started at /start-download that run at the same time
+    DEM_PREFETCH_WORKERS        = 2
+    # Seconds a prefetched DEM is kept for its /end-download, later ones download the DEM again
+    DEM_PREFETCH_TTL            = 3600
+
+    # World generation jobs that run at the same time, later jobs wait in a queue
+    MAX_CONCURRENT_JOBS         = 2
+    # Finished jobs whose status is kept for /task-status/<id>
+    JOB_HISTORY                 = 100
+
+    # (columns, rows) of terrain sub-models a world is split into, each with its own heightmap and texture, None generates one model
+    WORLD_GRID                  = None
+    # Terrain of the models, "heightmap" or "mesh" for a simplified OBJ mesh sampled natively, textured with the aerial image
+    TERRAIN_OUTPUT              = "heightmap"
+    # Largest vertical error in meters of the simplified terrain mesh
+    MESH_MAX_ERROR              = 0.5
+    # Encoding of the aerial image, "png", "jpg" or "webp", and the quality of the lossy formats
+    TEXTURE_FORMAT              = "png"
+    TEXTURE_QUALITY             = 90
+    # PNG compression level of the aerial and heightmap images, 9 is the smallest and slowest
+    TEXTURE_PNG_COMPRESSION     = 3
+    # PNG images of at least this many pixels are deflated in parallel strips, None disables it
+    TEXTURE_PARALLEL_MIN_PIXELS = 16 * 1024 * 1024
+    # Longest side in pixels of the stitched aerial image, tiles are decoded at 1/2^n of their size to fit, None keeps the full resolution
+    MAX_TEXTURE_SIZE            = 8192
+    # Aerial image pyramid levels are halved down to this longest side in pixels, None disables the pyramid
+    TEXTURE_PYRAMID_MIN_SIZE    = 1024
+    # Longest side in pixels of the aerial image referenced by model.sdf, None uses the stitched image
+    TEXTURE_BUDGET              = None
+    # Aerial images larger than this many bytes are stitched in a memory mapped file, None disables it
+    ORTHO_MEMMAP_THRESHOLD      = 4 * 1024 * 1024 * 1024
 
     # Set the global config
-    TEMPORARY_SATELLITE_IMAGE    = os.path.join(TEMP_PATH,'gazebo_terrian')
     TEMPLATE_DIR_PATH            =  str(Path(__file__).resolve().parents[2] / 'templates')
 
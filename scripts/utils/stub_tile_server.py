@@ -0,0 +1,143 @@
+import re
+import time
+import threading
+import numpy as np
+import cv2
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _backlogHTTPServer(ThreadingHTTPServer):
+    # the default listen backlog of 5 drops connections when the downloaders open
+    # their pools at once, which shows up as 1 s SYN retransmits in the timings
+    request_queue_size = 128
+    daemon_threads = True
+
+
+class stubTileServer:
+    '''
+    Local HTTP stand-in for the imagery and DEM tile providers.
+
+    Serves synthetic JPEG imagery at /imagery/<z>/<x>/<y>.jpg and Mapbox style
+    terrain-RGB tiles at /dem/<z>/<x>/<y>.png for any tile. Both are
+    deterministic, and the terrain is a smooth function of latitude and
+    longitude so neighbouring tiles and zoom levels line up.
+    '''
+
+    PATH_PATTERN = re.compile(r"^/(imagery|dem)/(\d+)/(\d+)/(\d+)\.\w+$")
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        """
+        Args:
+            host (str, optional): Interface to listen on. Defaults to "127.0.0.1".
+            port (int, optional): Port to listen on, 0 picks a free port. Defaults to 0.
+            latency (float, optional): Seconds every response is delayed to emulate a remote
+                provider. Defaults to 0.0.
+        """
+        self.latency = latency
+        self._server = _backlogHTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def imagery_url(self) -> str:
+        # tile source template in the placeholder format of Utils.qualifyURL
+        return self.base_url + "/imagery/{z}/{x}/{y}.jpg"
+
+    @property
+    def dem_url(self) -> str:
+        # str.format template like globalParam.DEM_TILE_URL
+        return self.base_url + "/dem/{z}/{x}/{y}.png"
+
+    def start(self) -> "stubTileServer":
+        """
+        Serve requests in a background thread.
+
+        Returns:
+            stubTileServer: self.
+        """
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """
+        Stop serving and close the socket.
+
+        Returns:
+            None
+        """
+        self._server.shutdown()
+        self._server.server_close()
+
+    @staticmethod
+    def elevation(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+        """
+        Synthetic terrain in meters: rolling hills with ridges, between roughly 550 and 1450 m.
+        """
+        return (900
+                + 300 * np.sin(np.radians(lat) * 900) * np.cos(np.radians(lon) * 700)
+                + 200 * np.exp(-((lat * 40) % 2 - 1) ** 2 * 4)
+                + 50 * np.sin(np.radians(lon) * 5000))
+
+    @staticmethod
+    def dem_tile(z: int, x: int, y: int) -> bytes:
+        """
+        Encode a 256x256 terrain-RGB tile, elevation = (R*65536 + G*256 + B) * 0.1 - 10000.
+        """
+        n = 256
+        tiles = 2 ** z
+        xs = (x + (np.arange(n) + 0.5) / n) / tiles
+        ys = (y + (np.arange(n) + 0.5) / n) / tiles
+        lon = xs * 360.0 - 180.0
+        lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * ys))))
+        lon_grid, lat_grid = np.meshgrid(lon, lat)
+        value = np.round((stubTileServer.elevation(lat_grid, lon_grid) + 10000) * 10).astype(np.int64)
+        # OpenCV writes BGR, terrain-RGB keeps the high byte in red
+        bgr = np.stack([value & 255, (value >> 8) & 255, (value >> 16) & 255], axis=-1).astype(np.uint8)
+        return cv2.imencode(".png", bgr)[1].tobytes()
+
+    @staticmethod
+    def imagery_tile(z: int, x: int, y: int) -> bytes:
+        """
+        Encode a 256x256 JPEG with smooth noise so it compresses like aerial imagery.
+        """
+        rng = np.random.default_rng((z << 48) ^ (x << 24) ^ y)
+        coarse = rng.integers(0, 256, size=(32, 32, 3), dtype=np.uint8)
+        image = cv2.resize(coarse, (256, 256), interpolation=cv2.INTER_CUBIC)
+        image = cv2.add(image, rng.integers(0, 24, size=image.shape, dtype=np.uint8))
+        return cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                match = stubTileServer.PATH_PATTERN.match(self.path.split("?")[0])
+                if match is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                kind, z, x, y = match.group(1), int(match.group(2)), int(match.group(3)), int(match.group(4))
+                if server.latency:
+                    time.sleep(server.latency)
+                if kind == "dem":
+                    data, content_type = stubTileServer.dem_tile(z, x, y), "image/png"
+                else:
+                    data, content_type = stubTileServer.imagery_tile(z, x, y), "image/jpeg"
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,190 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+class terrainMesh:
+    '''
+    Simplified triangle mesh of a 2^n+1 elevation grid.
+
+    The grid is covered by a restricted quadtree: a node is split while the grid
+    points inside it deviate from its two triangles by more than the error bound,
+    and neighbouring leaves differ by at most one level. Leaves next to a finer
+    neighbour are fanned around their centre through the shared edge midpoint,
+    so the mesh has no cracks. Flat areas end up as a few large triangles while
+    ridges keep the full grid resolution.
+    '''
+
+    MATERIAL = 'terrain'
+
+    @staticmethod
+    def node_errors(heights: np.ndarray, size: int) -> np.ndarray:
+        """
+        Get the error of every quadtree node of one level.
+
+        Args:
+            heights (np.ndarray): (N, N) elevation grid with N = 2^n+1.
+            size (int): Node size in grid cells.
+
+        Returns:
+            np.ndarray: Largest vertical distance of the grid points of every node from the
+                        bilinear patch through its corners, plus the distance of that patch
+                        from the two triangles it is drawn with.
+        """
+        windows = sliding_window_view(heights, (size + 1, size + 1))[::size, ::size]
+        h00 = windows[:, :, 0, 0]
+        h01 = windows[:, :, 0, -1]
+        h10 = windows[:, :, -1, 0]
+        h11 = windows[:, :, -1, -1]
+        t = np.linspace(0.0, 1.0, size + 1)
+        ty = t[:, np.newaxis]
+        tx = t[np.newaxis, :]
+        bilinear = (h00[..., None, None] * (1 - ty) * (1 - tx) + h01[..., None, None] * (1 - ty) * tx
+                    + h10[..., None, None] * ty * (1 - tx) + h11[..., None, None] * ty * tx)
+        return np.abs(windows - bilinear).max(axis=(2, 3)) + np.abs(h00 + h11 - h01 - h10) / 4
+
+    @staticmethod
+    def simplify(heights: np.ndarray, max_error: float, fixed_edges: bool = False) -> np.ndarray:
+        """
+        Triangulate an elevation grid within an error bound.
+
+        Args:
+            heights (np.ndarray): (N, N) elevation grid with N = 2^n+1, rows from the south edge.
+            max_error (float): Largest vertical error in the elevation unit.
+            fixed_edges (bool, optional): Keep every grid point on the outer edges, so meshes of
+                neighbouring grids meet without cracks. Defaults to False.
+
+        Returns:
+            np.ndarray: (T, 3) triangles as flat grid indices row * N + column, counter clockwise seen from above.
+        """
+        n = heights.shape[0]
+        if heights.shape != (n, n) or n < 3 or (n - 1) & (n - 2):
+            raise ValueError(f"Mesh grids must be square with 2^n+1 points per side, got {heights.shape}")
+        sizes = [n - 1]
+        while sizes[-1] > 2:
+            sizes.append(sizes[-1] // 2)
+
+        # Node errors from the finest level up, a node is never better than its children
+        errors = {}
+        for size in reversed(sizes):
+            error = terrainMesh.node_errors(heights, size)
+            if size > 2:
+                children = errors[size // 2]
+                error = np.maximum(error, children.reshape(error.shape[0], 2, error.shape[1], 2).max(axis=(1, 3)))
+            errors[size] = error
+
+        # Leaf size of every 2x2 cell block, split top down, 1 marks a block at full resolution
+        cells = (n - 1) // 2
+        leaf_size = np.zeros((cells, cells), dtype=np.int64)
+        active = np.ones((1, 1), dtype=bool)
+        for size in sizes:
+            split = active & (errors[size] > max_error)
+            if fixed_edges:
+                border = np.zeros_like(split)
+                border[0, :] = border[-1, :] = border[:, 0] = border[:, -1] = True
+                split |= active & border
+            block = size // 2
+            leaf = np.repeat(np.repeat(active & ~split, block, axis=0), block, axis=1)
+            leaf_size[leaf] = size
+            if size == 2:
+                # nodes of the smallest level keep every grid point
+                leaf_size[split] = 1
+            active = np.repeat(np.repeat(split, 2, axis=0), 2, axis=1)
+
+        # Restrict the quadtree, leaves sharing an edge differ by at most one level
+        while True:
+            padded = np.pad(leaf_size, 1, constant_values=n)
+            neighbour = np.minimum(np.minimum(padded[:-2, 1:-1], padded[2:, 1:-1]), np.minimum(padded[1:-1, :-2], padded[1:-1, 2:]))
+            violation = leaf_size > 2 * neighbour
+            if not violation.any():
+                break
+            for size in sizes[:-1]:
+                block = size // 2
+                marked = (violation & (leaf_size == size)).reshape(cells // block, block, cells // block, block).any(axis=(1, 3))
+                leaf_size[np.repeat(np.repeat(marked, block, axis=0), block, axis=1) & (leaf_size == size)] = size // 2
+
+        triangles = []
+        for size in sizes:
+            block = size // 2
+            origins = leaf_size[::block, ::block]
+            rows, columns = np.nonzero((origins == size) | ((origins == 1) & (size == 2)))
+            if rows.size == 0:
+                continue
+            r0, c0 = rows * block, columns * block
+            # a finer neighbour across an edge adds the midpoint of that edge, full nodes add all of them
+            full = leaf_size[r0, c0] == 1
+            south = full | (r0 > 0) & (leaf_size[np.maximum(r0 - 1, 0), c0] < size)
+            north = full | (r0 + block < cells) & (leaf_size[np.minimum(r0 + block, cells - 1), c0] < size)
+            west = full | (c0 > 0) & (leaf_size[r0, np.maximum(c0 - 1, 0)] < size)
+            east = full | (c0 + block < cells) & (leaf_size[r0, np.minimum(c0 + block, cells - 1)] < size)
+
+            y0, x0 = rows * size, columns * size
+            y1, x1 = y0 + size, x0 + size
+            ym, xm = y0 + size // 2, x0 + size // 2
+            sw, se, ne, nw = y0 * n + x0, y0 * n + x1, y1 * n + x1, y1 * n + x0
+            centre = ym * n + xm
+
+            plain = ~(south | north | west | east)
+            triangles.append(np.stack([sw, se, ne], axis=1)[plain])
+            triangles.append(np.stack([sw, ne, nw], axis=1)[plain])
+            for flag, a, b, mid in ((south, sw, se, y0 * n + xm), (east, se, ne, ym * n + x1),
+                                    (north, ne, nw, y1 * n + xm), (west, nw, sw, ym * n + x0)):
+                fan = ~plain
+                triangles.append(np.stack([centre, a, b], axis=1)[fan & ~flag])
+                triangles.append(np.stack([centre, a, mid], axis=1)[fan & flag])
+                triangles.append(np.stack([centre, mid, b], axis=1)[fan & flag])
+        return np.concatenate(triangles).astype(np.int64)
+
+    @staticmethod
+    def write_obj(path: str, heights: np.ndarray, triangles: np.ndarray, size_x: float, size_y: float,
+                  low: float, material_file: str) -> None:
+        """
+        Write a triangulated grid as a Wavefront OBJ with texture coordinates and normals.
+
+        The mesh is centred on the origin, x points east, y north and z up from the lowest
+        elevation, and the texture spans the whole grid.
+
+        Args:
+            path (str): Path of the OBJ file.
+            heights (np.ndarray): (N, N) elevation grid, rows from the south edge.
+            triangles (np.ndarray): Triangles returned by simplify.
+            size_x (float): Width of the grid in meters.
+            size_y (float): Height of the grid in meters.
+            low (float): Elevation placed at z = 0.
+            material_file (str): File name of the MTL file next to the OBJ file.
+
+        Returns:
+            None
+        """
+        n = heights.shape[0]
+        used, faces = np.unique(triangles, return_inverse=True)
+        faces = faces.reshape(-1, 3) + 1
+        rows, columns = used // n, used % n
+        u, v = columns / (n - 1), rows / (n - 1)
+        positions = np.stack([(u - 0.5) * size_x, (v - 0.5) * size_y, heights[rows, columns] - low], axis=1)
+
+        slope_y, slope_x = np.gradient(heights, size_y / (n - 1), size_x / (n - 1))
+        normals = np.stack([-slope_x[rows, columns], -slope_y[rows, columns], np.ones(used.size)], axis=1)
+        normals /= np.linalg.norm(normals, axis=1, keepdims=True)
+
+        with open(path, 'w') as obj_file:
+            obj_file.write(f"mtllib {material_file}\no terrain\n")
+            np.savetxt(obj_file, positions, fmt="v %.3f %.3f %.3f")
+            np.savetxt(obj_file, np.stack([u, v], axis=1), fmt="vt %.6f %.6f")
+            np.savetxt(obj_file, normals, fmt="vn %.4f %.4f %.4f")
+            obj_file.write(f"usemtl {terrainMesh.MATERIAL}\n")
+            np.savetxt(obj_file, np.repeat(faces, 3, axis=1), fmt="f %d/%d/%d %d/%d/%d %d/%d/%d")
+
+    @staticmethod
+    def write_mtl(path: str, texture: str) -> None:
+        """
+        Write the material of the terrain mesh.
+
+        Args:
+            path (str): Path of the MTL file.
+            texture (str): Path of the aerial texture relative to the MTL file.
+
+        Returns:
+            None
+        """
+        with open(path, 'w') as mtl_file:
+            mtl_file.write(f"newmtl {terrainMesh.MATERIAL}\nKa 1 1 1\nKd 1 1 1\nKs 0 0 0\nmap_Kd {texture}\n")
@@ -0,0 +1,155 @@
+import zlib
+import struct
+import numpy as np
+import cv2
+from utils.executor import task_executor
+
+
+class textureEncoder:
+    '''
+    Encoder of the aerial and heightmap images of a world.
+
+    Writes PNG with a configurable compression level, or lossy JPEG or WebP
+    with a quality setting. PNG images of at least parallel_min_pixels are
+    split into horizontal strips that are deflated in parallel on the shared
+    executor and joined into one standard PNG stream.
+    '''
+
+    EXTENSIONS = {"png": ".png", "jpg": ".jpg", "webp": ".webp"}
+    # Largest side the WebP format can store
+    WEBP_MAX_SIZE = 16383
+
+    def __init__(self, format: str = "png", quality: int = 90, png_compression: int = 9, parallel_min_pixels: int = None):
+        """
+        Args:
+            format (str, optional): "png", "jpg" or "webp". Defaults to "png".
+            quality (int, optional): JPEG and WebP quality from 1 to 100. Defaults to 90.
+            png_compression (int, optional): PNG compression level from 0 to 9. Defaults to 9.
+            parallel_min_pixels (int, optional): Smallest PNG in pixels encoded in parallel strips,
+                None always encodes in one piece.
+        """
+        if format not in textureEncoder.EXTENSIONS:
+            raise ValueError(f"Texture format must be one of {tuple(textureEncoder.EXTENSIONS)}, got {format}")
+        self.format = format
+        self.quality = quality
+        self.png_compression = png_compression
+        self.parallel_min_pixels = parallel_min_pixels
+
+    @property
+    def extension(self) -> str:
+        return textureEncoder.EXTENSIONS[self.format]
+
+    def settings(self) -> list:
+        """
+        Get the settings that change the encoded images, e.g. for checkpoint keys.
+        """
+        return [self.format, self.quality, self.png_compression]
+
+    def format_for(self, image: np.ndarray) -> str:
+        """
+        Get the format an image is written in, WebP falls back to PNG above its size limit.
+        """
+        if self.format == "webp" and max(image.shape[:2]) > textureEncoder.WEBP_MAX_SIZE:
+            return "png"
+        return self.format
+
+    def write(self, path: str, image: np.ndarray) -> str:
+        """
+        Encode an image.
+
+        Args:
+            path (str): Output path without extension.
+            image (np.ndarray): 8 bit grey or BGR image, or 16 bit grey image written as PNG.
+
+        Returns:
+            str: Path of the written file with the extension of its format.
+        """
+        format = self.format_for(image)
+        if format != self.format:
+            print(f"[WARN] {image.shape[1]}x{image.shape[0]} image exceeds the WebP size limit, writing PNG.")
+        output_path = path + textureEncoder.EXTENSIONS[format]
+        if format == "png":
+            if self.parallel_min_pixels is not None and image.shape[0] * image.shape[1] >= self.parallel_min_pixels and task_executor.workers > 1:
+                with open(output_path, "wb") as output_file:
+                    output_file.write(textureEncoder.encode_png_strips(image, self.png_compression, task_executor.workers))
+                return output_path
+            params = [cv2.IMWRITE_PNG_COMPRESSION, self.png_compression]
+        elif format == "jpg":
+            params = [cv2.IMWRITE_JPEG_QUALITY, self.quality]
+        else:
+            params = [cv2.IMWRITE_WEBP_QUALITY, self.quality]
+        if not cv2.imwrite(output_path, image, params):
+            raise IOError(f"Failed to write {output_path}")
+        return output_path
+
+    @staticmethod
+    def _png_chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    @staticmethod
+    def _deflate_strip(task: tuple) -> tuple:
+        # Filter the rows of one strip with the PNG "Up" filter and deflate them as raw blocks
+        rows, previous, level, last = task
+        up = np.empty((rows.shape[0], rows.shape[1] + 1), dtype=np.uint8)
+        up[:, 0] = 2
+        up[0, 1:] = rows[0] - previous
+        up[1:, 1:] = rows[1:] - rows[:-1]
+        data = up.tobytes()
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        deflated = compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+        return deflated, zlib.adler32(data), len(data)
+
+    @staticmethod
+    def encode_png_strips(image: np.ndarray, level: int, strips: int) -> bytes:
+        """
+        Encode an image as PNG with its rows deflated in independent strips.
+
+        Every strip ends on a byte aligned deflate block, so the strips form one
+        zlib stream whose checksum is combined from the strip checksums.
+
+        Args:
+            image (np.ndarray): 8 bit grey or BGR image, or 16 bit grey image.
+            level (int): zlib compression level from 0 to 9.
+            strips (int): Number of strips.
+
+        Returns:
+            bytes: The PNG file.
+        """
+        height, width = image.shape[:2]
+        channels = 1 if image.ndim == 2 else image.shape[2]
+        if channels == 3:
+            image = image[:, :, ::-1]
+        elif channels != 1:
+            raise ValueError(f"Unsupported number of channels {channels}")
+        bit_depth = 16 if image.dtype == np.uint16 else 8
+        if bit_depth == 16:
+            image = image.astype(">u2")
+        # Rows as bytes in PNG order, filters work on bytes
+        rows = np.ascontiguousarray(image).view(np.uint8).reshape(height, -1)
+
+        bounds = np.linspace(0, height, min(strips, height) + 1).astype(int)
+        tasks = [(rows[start:end], rows[start - 1] if start > 0 else np.zeros(rows.shape[1], dtype=np.uint8), level, end == height)
+                 for start, end in zip(bounds[:-1], bounds[1:])]
+        results = task_executor.map(textureEncoder._deflate_strip, tasks)
+
+        adler = 1
+        for _, checksum, length in results:
+            adler = textureEncoder._adler32_combine(adler, checksum, length)
+        stream = b"\x78\x9c" + b"".join(deflated for deflated, _, _ in results) + struct.pack(">I", adler)
+
+        header = struct.pack(">IIBBBBB", width, height, bit_depth, 0 if channels == 1 else 2, 0, 0, 0)
+        return (b"\x89PNG\r\n\x1a\n" + textureEncoder._png_chunk(b"IHDR", header)
+                + textureEncoder._png_chunk(b"IDAT", stream) + textureEncoder._png_chunk(b"IEND", b""))
+
+    @staticmethod
+    def _adler32_combine(adler1: int, adler2: int, length2: int) -> int:
+        # Checksum of two concatenated buffers from their checksums, as zlib's adler32_combine
+        base = 65521
+        remainder = length2 % base
+        sum1 = adler1 & 0xffff
+        sum2 = (remainder * sum1) % base
+        sum1 += (adler2 & 0xffff) + base - 1
+        sum2 += ((adler1 >> 16) & 0xffff) + ((adler2 >> 16) & 0xffff) + base - remainder
+        sum1 %= base
+        sum2 %= base
+        return (sum2 << 16) | sum1
@@ -0,0 +1,222 @@
+import os
+import time
+import hashlib
+import tempfile
+import threading
+from utils.param import globalParam
+
+
+class tileCache:
+    '''
+    Persistent on-disk cache of downloaded tiles keyed by (source, z, x, y).
+
+    Entries live under <path>/<source hash>/<z>/<x>/<y>.tile and are written
+    atomically. The modification time of an entry is its download time and is
+    used for the TTL, the access time is refreshed on every hit and drives the
+    LRU eviction once the cache grows past its disk quota. The disk usage is
+    scanned once, before the first tile is stored, and then kept as a running
+    count, and one thread at a time evicts.
+    '''
+
+    def __init__(self, path: str, max_bytes: int, ttl: float = None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._total_bytes = None
+        self._lock = threading.Lock()
+        self._scan_lock = threading.Lock()
+        self._evict_lock = threading.Lock()
+
+    def _entry_path(self, source: str, z: int, x: int, y: int) -> str:
+        source_key = hashlib.sha1(source.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.path, source_key, str(z), str(x), str(y) + ".tile")
+
+    def _is_expired(self, stat: os.stat_result, now: float) -> bool:
+        return self.ttl is not None and now - stat.st_mtime > self.ttl
+
+    def get(self, source: str, z: int, x: int, y: int):
+        """
+        Read a tile from the cache.
+
+        Args:
+            source (str): Tile source the tile was downloaded from.
+            z (int): Z-coordinate.
+            x (int): X-coordinate.
+            y (int): Y-coordinate.
+
+        Returns:
+            bytes: The cached tile, None if it is not cached or expired.
+        """
+        entry = self._entry_path(source, z, x, y)
+        now = time.time()
+        try:
+            stat = os.stat(entry)
+            if self._is_expired(stat, now):
+                self._remove(entry, stat.st_size)
+                data = None
+            else:
+                with open(entry, "rb") as entry_file:
+                    data = entry_file.read()
+                # refresh the access time for LRU, keep the download time for TTL
+                os.utime(entry, (now, stat.st_mtime))
+        except OSError:
+            data = None
+
+        with self._lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return data
+
+    def put(self, source: str, z: int, x: int, y: int, data: bytes) -> None:
+        """
+        Atomically store a tile in the cache and evict old entries when over quota.
+
+        Args:
+            source (str): Tile source the tile was downloaded from.
+            z (int): Z-coordinate.
+            x (int): X-coordinate.
+            y (int): Y-coordinate.
+            data (bytes): Encoded tile.
+
+        Returns:
+            None
+        """
+        self._ensure_size()
+        entry = self._entry_path(source, z, x, y)
+        directory = os.path.dirname(entry)
+        os.makedirs(directory, exist_ok=True)
+        try:
+            previous_size = os.path.getsize(entry)
+        except OSError:
+            previous_size = 0
+
+        descriptor, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as temp_file:
+                temp_file.write(data)
+            os.replace(temp_path, entry)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        with self._lock:
+            self._total_bytes += len(data) - previous_size
+            over_quota = self._total_bytes > self.max_bytes
+        if over_quota:
+            self.evict()
+
+    def _ensure_size(self) -> None:
+        # Scan the disk usage once, stores wait for the scan but never hold the lock during it
+        if self._total_bytes is not None:
+            return
+        with self._scan_lock:
+            if self._total_bytes is None:
+                total = self._scan_size()
+                with self._lock:
+                    self._total_bytes = total
+
+    def fetch(self, source: str, z: int, x: int, y: int, fetcher):
+        """
+        Read a tile through the cache, downloading and storing it on a miss.
+
+        Args:
+            source (str): Tile source the tile is downloaded from.
+            z (int): Z-coordinate.
+            x (int): X-coordinate.
+            y (int): Y-coordinate.
+            fetcher (callable): Called without arguments on a miss, returns (code, data).
+
+        Returns:
+            tuple: (code, data) with code 200 for a cached tile.
+        """
+        data = self.get(source, z, x, y)
+        if data is not None:
+            return 200, data
+
+        code, data = fetcher()
+        if code == 200 and data:
+            try:
+                self.put(source, z, x, y, data)
+            except OSError as e:
+                print(f"[WARN] Could not cache tile {z}/{x}/{y}: {e}")
+        return code, data
+
+    def _entries(self):
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                if name.endswith(".tile"):
+                    entry = os.path.join(root, name)
+                    try:
+                        yield entry, os.stat(entry)
+                    except OSError:
+                        continue
+
+    def _scan_size(self) -> int:
+        return sum(stat.st_size for _, stat in self._entries())
+
+    def _remove(self, entry: str, size: int) -> None:
+        try:
+            # the entry may have been stored again since size was taken
+            size = os.stat(entry).st_size
+            os.remove(entry)
+        except OSError:
+            return
+        with self._lock:
+            self.evictions += 1
+            if self._total_bytes is not None:
+                self._total_bytes -= size
+
+    def evict(self) -> None:
+        """
+        Remove expired entries, then least recently used entries until the cache
+        is below 90% of its quota. Returns at once while another thread evicts.
+
+        Returns:
+            None
+        """
+        if not self._evict_lock.acquire(blocking=False):
+            return
+        try:
+            self._ensure_size()
+            now = time.time()
+            entries = []
+            for entry, stat in self._entries():
+                if self._is_expired(stat, now):
+                    self._remove(entry, stat.st_size)
+                else:
+                    entries.append((stat.st_atime, stat.st_size, entry))
+
+            entries.sort()
+            target = self.max_bytes * 0.9
+            for _, size, entry in entries:
+                with self._lock:
+                    if self._total_bytes <= target:
+                        break
+                self._remove(entry, size)
+        finally:
+            self._evict_lock.release()
+
+    def stats(self) -> dict:
+        """
+        Get the cache counters.
+
+        Returns:
+            dict: Hits, misses, evictions and the known disk usage in bytes.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+tile_cache = tileCache(globalParam.TILE_CACHE_PATH, globalParam.TILE_CACHE_MAX_BYTES, globalParam.TILE_CACHE_TTL)
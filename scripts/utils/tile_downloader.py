@@ -0,0 +1,240 @@
+import os
+import time
+import uuid
+import base64
+import threading
+from utils.file_writer import FileWriter
+from utils.mbtiles_writer import MbtilesWriter
+from utils.utils import Utils
+from utils.maptile_utils import maptile_utiles
+from utils.param import globalParam
+from utils.metrics import metrics_registry
+from utils.executor import task_executor
+
+
+class tileDownloader:
+
+	@staticmethod
+	def getWriter(outputType):
+		'''
+        Get the tile storage backend for an output type.
+
+        Args:
+            outputType (str): "mbtiles" for a single MBTiles file, anything else for a tile directory tree.
+
+        Returns:
+            type: MbtilesWriter or FileWriter.
+		'''
+		if outputType == "mbtiles":
+			return MbtilesWriter
+		return FileWriter
+
+	@staticmethod
+	def resolve_output_path(outputDirectory, outputFile, x, y, z, timestamp):
+		'''
+        Fill the {x}, {y}, {z}, {quad} and {timestamp} placeholders of the output templates.
+
+        Args:
+            outputDirectory (str): Output directory template.
+            outputFile (str): Output file template.
+            x (int): X-coordinate.
+            y (int): Y-coordinate.
+            z (int): Z-coordinate.
+            timestamp (int): Timestamp of the download.
+
+        Returns:
+            tuple: (outputDirectory, filePath) with the placeholders replaced.
+		'''
+		replaceMap = {
+			"x": str(x),
+			"y": str(y),
+			"z": str(z),
+			"quad": Utils.makeQuadKey(x, y, z),
+			"timestamp": str(timestamp),
+		}
+		for key, value in replaceMap.items():
+			outputDirectory = outputDirectory.replace(f"{{{key}}}", value)
+			outputFile = outputFile.replace(f"{{{key}}}", value)
+
+		return outputDirectory, os.path.join(globalParam.OUTPUT_BASE_PATH, outputDirectory, outputFile)
+
+	@staticmethod
+	def download_tile(lock, source, filePath, x, y, z, outputScale, withImage=False, writer=FileWriter):
+		'''
+        Download a tile unless it already exists and store it with FileWriter.
+
+        Args:
+            lock (threading.Lock): A lock for thread-safe operations.
+            source (str): Tile source URL template.
+            filePath (str): The path to save the tile.
+            x (int): X-coordinate.
+            y (int): Y-coordinate.
+            z (int): Z-coordinate.
+            outputScale (int): The output scale.
+            withImage (bool, optional): Add the base64 encoded tile to the result. Defaults to False.
+            writer (type, optional): Tile storage backend. Defaults to FileWriter.
+
+        Returns:
+            dict: Result with the response "code" and a "message".
+		'''
+		result = {}
+		if writer.exists(filePath, x, y, z):
+			writer.markPresent(filePath, x, y)
+			result["code"] = 200
+			result["message"] = 'Tile already exists'
+			metrics_registry.inc("gazebo_tiles_total", result="existing")
+			return result
+
+		result["code"], data = Utils.fetchTileScaled(source, x, y, z, outputScale)
+
+		if data is not None:
+			writer.addTile(lock, filePath, data, x, y, z, outputScale)
+			if withImage:
+				result["image"] = base64.b64encode(data).decode("utf-8")
+			result["message"] = 'Tile Downloaded'
+			metrics_registry.inc("gazebo_tiles_total", result="downloaded")
+		else:
+			result["message"] = 'Download failed'
+			metrics_registry.inc("gazebo_tiles_total", result="failed")
+
+		return result
+
+
+class bulkDownloader:
+
+	jobs = {}
+	jobsLock = threading.Lock()
+
+	@staticmethod
+	def start(lock, bounds, zoom_level, source, outputScale, outputDirectory, outputFile, timestamp, center=None, area="", onComplete=None, outputType="directory"):
+		'''
+        Start downloading every tile of a region on the server in a background thread.
+
+        Args:
+            lock (threading.Lock): A lock for thread-safe file operations.
+            bounds (list): Region bounds as [west, south, east, north].
+            zoom_level (int): Zoom level of the tiles.
+            source (str): Tile source URL template.
+            outputScale (int): The output scale.
+            outputDirectory (str): Output directory template.
+            outputFile (str): Output file template.
+            timestamp (int): Timestamp used for the {timestamp} placeholder.
+            center (list, optional): Center of the region as [lon, lat]. Defaults to the middle of bounds.
+            area (str, optional): The area metadata. Defaults to "".
+            onComplete (callable, optional): Called as onComplete(outputDirectory, filePath) after the
+                tiles are downloaded, e.g. to queue the world generation. A returned job id is
+                reported as "generation_job_id" in the job status.
+            outputType (str, optional): Tile storage backend, see tileDownloader.getWriter. Defaults to "directory".
+
+        Returns:
+            str: Id of the started job.
+		'''
+		if center is None:
+			center = [(bounds[0] + bounds[2]) / 2, (bounds[1] + bounds[3]) / 2]
+
+		outputDirectory = outputDirectory.replace("{timestamp}", str(timestamp))
+		outputFile = outputFile.replace("{timestamp}", str(timestamp))
+		filePath = os.path.join(globalParam.OUTPUT_BASE_PATH, outputDirectory, outputFile)
+
+		writer = tileDownloader.getWriter(outputType)
+		writer.addMetadata(
+			lock, os.path.join(globalParam.OUTPUT_BASE_PATH, outputDirectory), filePath, outputFile,
+			"Map Tiles Downloader via AliFlux", "jpg", bounds, center, area,
+			zoom_level, "mercator", 256 * outputScale
+		)
+
+		tiles = maptile_utiles.get_tiles_in_bounds(bounds, zoom_level)
+		# The manifest records which of the expected tiles are stored, so gaps are refetched before stitching
+		writer.addManifest(lock, os.path.join(globalParam.OUTPUT_BASE_PATH, outputDirectory), zoom_level,
+			maptile_utiles.get_tile_range(bounds, zoom_level), source, outputScale)
+		jobId = uuid.uuid4().hex
+		with bulkDownloader.jobsLock:
+			bulkDownloader.jobs[jobId] = {
+				"status": "in_progress",
+				"outputDirectory": outputDirectory,
+				"total": len(tiles),
+				"downloaded": 0,
+				"existing": 0,
+				"failed": 0,
+				"started": time.time(),
+				"finished": None,
+			}
+			bulkDownloader._trim()
+
+		thread = threading.Thread(
+			target=bulkDownloader._run,
+			args=(jobId, lock, writer, tiles, zoom_level, source, outputScale, outputDirectory, outputFile, timestamp, filePath, onComplete),
+			daemon=True,
+		)
+		thread.start()
+		return jobId
+
+	@staticmethod
+	def status(jobId):
+		'''
+        Get the progress of a bulk download job.
+
+        Args:
+            jobId (str): Id returned by start.
+
+        Returns:
+            dict: Copy of the job progress, None for an unknown job id.
+		'''
+		with bulkDownloader.jobsLock:
+			job = bulkDownloader.jobs.get(jobId)
+			return dict(job) if job is not None else None
+
+	@staticmethod
+	def _trim():
+		# Drop the oldest finished jobs beyond globalParam.JOB_HISTORY, call with jobsLock held
+		finished = [jobId for jobId, job in bulkDownloader.jobs.items() if job["finished"] is not None]
+		for jobId in finished[:max(0, len(finished) - globalParam.JOB_HISTORY)]:
+			del bulkDownloader.jobs[jobId]
+
+	@staticmethod
+	def _update(jobId, **changes):
+		with bulkDownloader.jobsLock:
+			job = bulkDownloader.jobs[jobId]
+			for key, value in changes.items():
+				job[key] = value
+
+	@staticmethod
+	def _count(jobId, key):
+		with bulkDownloader.jobsLock:
+			bulkDownloader.jobs[jobId][key] += 1
+
+	@staticmethod
+	def _fetch(task):
+		# Task of the shared executor, a failed tile is reported instead of ending the job
+		lock, source, outputDirectory, outputFile, x, y, zoom_level, timestamp, outputScale, writer = task
+		try:
+			_, tilePath = tileDownloader.resolve_output_path(outputDirectory, outputFile, x, y, zoom_level, timestamp)
+			return tileDownloader.download_tile(lock, source, tilePath, x, y, zoom_level, outputScale, writer=writer)
+		except Exception as e:
+			print(f"[WARN] Tile download failed: {e}")
+			return {"code": -1, "message": 'Download failed'}
+
+	@staticmethod
+	def _run(jobId, lock, writer, tiles, zoom_level, source, outputScale, outputDirectory, outputFile, timestamp, filePath, onComplete):
+		try:
+			tasks = ((lock, source, outputDirectory, outputFile, x, y, zoom_level, timestamp, outputScale, writer) for x, y in tiles)
+			try:
+				for result in task_executor.imap_unordered(bulkDownloader._fetch, tasks, io=True):
+					if result["message"] == 'Tile already exists':
+						bulkDownloader._count(jobId, "existing")
+					elif result["message"] == 'Tile Downloaded':
+						bulkDownloader._count(jobId, "downloaded")
+					else:
+						bulkDownloader._count(jobId, "failed")
+			finally:
+				# A failed job still writes and closes the tiles it stored
+				writer.close(lock, os.path.join(globalParam.OUTPUT_BASE_PATH, outputDirectory), filePath, zoom_level)
+
+			if onComplete is not None:
+				generationJobId = onComplete(outputDirectory, filePath)
+				if generationJobId is not None:
+					bulkDownloader._update(jobId, generation_job_id=generationJobId)
+			bulkDownloader._update(jobId, status="completed", finished=time.time())
+		except Exception as e:
+			print(f"Bulk download failed: {e}")
+			bulkDownloader._update(jobId, status="failed", error=str(e), finished=time.time())
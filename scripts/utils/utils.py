@@ -3,13 +3,12 @@
 from urllib.parse import urlparse
 from urllib.parse import parse_qs
 from urllib.parse import parse_qsl
-import urllib.request
 import uuid
-import uuid
-import ssl
-import os
-import math
-from utils.param import globalParam
+import io
+from utils.http_client import http_client
+from utils.tile_cache import tile_cache
+from utils.executor import task_executor
+from utils.maptile_utils import maptile_utiles
 from PIL import Image
 
 class Utils:
@@ -19,18 +18,34 @@ class Utils:
 	def randomString():
 		return uuid.uuid4().hex.upper()[0:6]
 
-	def getChildTiles(x, y, z):
-		childX = x * 2
-		childY = y * 2
-		childZ = z + 1
-
+	@staticmethod
+	def getDescendantTiles(x, y, z, depth):
+		'''
+        Get the tiles covering a tile depth zoom levels further in.
+
+        Args:
+            x (int): X-coordinate.
+            y (int): Y-coordinate.
+            z (int): Z-coordinate.
+            depth (int): Number of zoom levels to descend.
+
+        Returns:
+            list: (x, y, z) of the 4^depth descendants, row by row from the top left.
+		'''
+		count = 1 << depth
 		return [
-			(childX, childY, childZ),
-			(childX+1, childY, childZ),
-			(childX+1, childY+1, childZ),
-			(childX, childY+1, childZ),
+			(x * count + dx, y * count + dy, z + depth)
+			for dy in range(count)
+			for dx in range(count)
 		]
 
+	@staticmethod
+	def isValidScale(outputScale):
+		'''
+        Check if an output scale is a power of two.
+		'''
+		return outputScale >= 1 and (outputScale & (outputScale - 1)) == 0
+
 	def makeQuadKey(tile_x, tile_y, level):
 		quadkey = ""
 		for i in range(level):
@@ -46,10 +61,13 @@ class Utils:
 
 	@staticmethod
 	def num2deg(xtile, ytile, zoom):
-		n = 2.0 ** zoom
-		lon_deg = xtile / n * 360.0 - 180.0
-		lat_rad = math.atan(math.sinh(math.pi * (1 - 2 * ytile / n)))
-		lat_deg = math.degrees(lat_rad)
+		'''
+        Get the latitude and longitude of the north west corner of tiles, xtile and ytile may be arrays.
+		'''
+		lat_deg, lon_deg = maptile_utiles.tile_to_lat_lon(xtile, ytile, zoom)
+		if lat_deg.ndim == 0:
+			# scalar tiles keep returning Python floats
+			return (float(lat_deg), float(lon_deg))
 		return (lat_deg, lon_deg)
 
 	@staticmethod
@@ -72,96 +90,90 @@ class Utils:
 		return url
 
 	@staticmethod
-	def mergeQuadTile(quadTiles):
-
-		width = 0
-		height = 0
+	def mergeTiles(tiles, count):
+		'''
+        Composite a count x count grid of tile images into one image.
 
-		for tile in quadTiles:
-			if(tile is not None):
-				width = quadTiles[0].size[0] * 2
-				height = quadTiles[1].size[1] * 2
-				break
+        Args:
+            tiles (list): PIL images row by row from the top left.
+            count (int): Number of tiles per side.
 
-		if width == 0 or height == 0:
-			return None
+        Returns:
+            PIL.Image: The merged RGB image.
+		'''
+		width, height = tiles[0].size
+		canvas = Image.new('RGB', (width * count, height * count))
 
-		canvas = Image.new('RGB', (width, height))
-
-		if quadTiles[0] is not None:
-			canvas.paste(quadTiles[0], box=(0,0))
-
-		if quadTiles[1] is not None:
-			canvas.paste(quadTiles[1], box=(width - quadTiles[1].size[0], 0))
-
-		if quadTiles[2] is not None:
-			canvas.paste(quadTiles[2], box=(width - quadTiles[2].size[0], height - quadTiles[2].size[1]))
-
-		if quadTiles[3] is not None:
-			canvas.paste(quadTiles[3], box=(0, height - quadTiles[3].size[1]))
+		for index, tile in enumerate(tiles):
+			if tile.size != (width, height):
+				tile = tile.resize((width, height))
+			canvas.paste(tile.convert('RGB'), box=((index % count) * width, (index // count) * height))
 
 		return canvas
 
 	@staticmethod
-	def downloadFile(url, destination, x, y, z):
-
-		url = Utils.qualifyURL(url, x, y, z)
-
-		code = 0
-
-		# monkey patching SSL certificate issue
-		# DONT use it in a prod/sensitive environment
-		ssl._create_default_https_context = ssl._create_unverified_context
-
-		try:
-			path, response = urllib.request.urlretrieve(url, destination)
-			code = 200
-		except urllib.error.URLError as e:
-			if not hasattr(e, "code"):
-				print(e)
-				code = -1
-			else:
-				code = e.code
-
-		return code
+	def fetchTile(url, x, y, z):
+		'''
+        Download a single tile into memory through the persistent tile cache.
 
+        Returns:
+            tuple: (code, data) with the response code and the tile bytes, None on failure.
+		'''
+		return tile_cache.fetch(url, z, x, y, lambda: http_client.fetch(Utils.qualifyURL(url, x, y, z)))
 
 	@staticmethod
-	def downloadFileScaled(url, destination, x, y, z, outputScale):
-		
-
+	def fetchTileScaled(url, x, y, z, outputScale):
+		'''
+        Download a tile into memory at outputScale times its size.
+
+        For an output scale of 2^k the 4^k descendant tiles k zoom levels further
+        in are fetched concurrently on the shared I/O threads and composited in memory into one JPEG.
+
+        Args:
+            url (str): Tile source URL template.
+            x (int): X-coordinate.
+            y (int): Y-coordinate.
+            z (int): Z-coordinate.
+            outputScale (int): Power of two output scale.
+
+        Returns:
+            tuple: (code, data) with the response code and the tile bytes, None on failure.
+		'''
+		if not Utils.isValidScale(outputScale):
+			raise ValueError(f"Output scale must be a power of two, got {outputScale}")
 
 		if outputScale == 1:
-			return Utils.downloadFile(url, destination, x, y, z)
+			return Utils.fetchTile(url, x, y, z)
 
-		elif outputScale == 2:
+		depth = outputScale.bit_length() - 1
+		childTiles = Utils.getDescendantTiles(x, y, z, depth)
 
-			childTiles = Utils.getChildTiles(x, y, z)
-			childImages = []
+		# Runs inline when called from a worker of a bulk download, which already fetches tiles in parallel
+		results = task_executor.map(lambda tile: Utils.fetchTile(url, *tile), childTiles, io=True)
 
-			for childX, childY, childZ in childTiles:
-				
-				tempFile = Utils.randomString() + ".jpg"
-				tempFilePath = os.path.join(globalParam.TEMPFILE_PATH, tempFile)
+		for code, data in results:
+			if code != 200:
+				return code, None
 
-				code = Utils.downloadFile(url, tempFilePath, childX, childY, childZ)
+		childImages = [Image.open(io.BytesIO(data)) for _, data in results]
+		canvas = Utils.mergeTiles(childImages, outputScale)
 
-				if code == 200:
-					image = Image.open(tempFilePath)
-				else:
-					return code
+		output = io.BytesIO()
+		canvas.save(output, "JPEG")
+		return 200, output.getvalue()
 
-				childImages.append(image)
-			
-			canvas = Utils.mergeQuadTile(childImages)
-			# canvas.save(destination, "PNG")
-			canvas.save(destination, "JPEG")
-			
-			return 200
+	@staticmethod
+	def downloadFile(url, destination, x, y, z):
 
-		#TODO implement custom scale
+		return Utils.downloadFileScaled(url, destination, x, y, z, 1)
 
-			
 
+	@staticmethod
+	def downloadFileScaled(url, destination, x, y, z, outputScale):
 
+		code, data = Utils.fetchTileScaled(url, x, y, z, outputScale)
+		if code == 200:
+			with open(destination, "wb") as tile_file:
+				tile_file.write(data)
 
+		return code